@@ -0,0 +1,162 @@
+# backend/app/activity_log.py
+"""
+Write-behind buffer for user activity logging
+
+Events are queued in-process and written by a background thread with one
+multi-row INSERT per batch, either when ACTIVITY_BATCH_SIZE events are waiting
+or every ACTIVITY_FLUSH_INTERVAL_SECONDS. The buffer drains on shutdown.
+Each batch is folded into the analytics rollups in the same transaction.
+"""
+import atexit
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from .config import get_settings
+from .database import engine
+from . import models, rollups
+
+settings = get_settings()
+
+
+class ActivityBuffer:
+    """In-process queue of user_activities rows with a background flusher"""
+
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, row: Dict[str, Any]) -> None:
+        """Queue one activity row; never touches the database"""
+        with self._lock:
+            self._pending.append(row)
+            self._trim_locked()
+            full = len(self._pending) >= self.batch_size
+        self._ensure_started()
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write all queued rows; returns the number written
+
+        On anything but an IntegrityError (database down, connection lost) the
+        rows go back to the front of the queue for the next flush and the error
+        propagates.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            try:
+                with engine.begin() as conn:
+                    # executemany on an INSERT is sent as multi-row VALUES batches
+                    conn.execute(insert(models.UserActivity), rows)
+                    rollups.fold_activities(conn, rows)
+                return len(rows)
+            except IntegrityError:
+                return self._flush_one_by_one(rows)
+            except Exception:
+                self._requeue(rows)
+                raise
+
+    def _flush_one_by_one(self, rows: List[Dict[str, Any]]) -> int:
+        """Fallback when a batch violates a constraint, e.g. a note deleted before its view event was flushed"""
+        written = 0
+        for i, row in enumerate(rows):
+            try:
+                for attempt in (row, {**row, "note_id": None}):
+                    try:
+                        with engine.begin() as conn:
+                            conn.execute(insert(models.UserActivity), [attempt])
+                            rollups.fold_activities(conn, [attempt])
+                        written += 1
+                        break
+                    except IntegrityError as e:
+                        error = e
+                else:
+                    print(f"WARNING: dropped activity event {row['activity_type']}: {error}")
+            except Exception:
+                self._requeue(rows[i:])
+                raise
+        return written
+
+    def _requeue(self, rows: List[Dict[str, Any]]) -> None:
+        """Put unwritten rows back ahead of anything queued since they were taken"""
+        with self._lock:
+            self._pending = rows + self._pending
+            self._trim_locked()
+
+    def _trim_locked(self) -> None:
+        if len(self._pending) > self.max_pending:
+            # Database unreachable for a long time: keep the newest events
+            dropped = len(self._pending) - self.max_pending
+            del self._pending[:dropped]
+            print(f"WARNING: activity buffer full, dropped {dropped} events")
+
+    def close(self) -> None:
+        """Stop the flusher thread and drain everything still queued"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"WARNING: activity flush on shutdown failed, {len(self._pending)} events lost: {e}")
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None or self._stopping:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="activity-log-flusher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"WARNING: activity flush failed: {e}")
+
+
+buffer = ActivityBuffer(
+    batch_size=settings.ACTIVITY_BATCH_SIZE,
+    flush_interval=settings.ACTIVITY_FLUSH_INTERVAL_SECONDS,
+    max_pending=settings.ACTIVITY_BUFFER_MAX_PENDING,
+)
+atexit.register(buffer.close)
+
+
+def log_activity(
+    user_id: int,
+    activity_type: str,
+    description: Optional[str] = None,
+    note_id: Optional[int] = None,
+    meta_data: Optional[dict] = None
+) -> None:
+    """Queue an activity event, stamped now, for the next batch insert"""
+    buffer.record({
+        "user_id": user_id,
+        "activity_type": activity_type,
+        "description": description,
+        "note_id": note_id,
+        "meta_data": meta_data or {},
+        "created_at": datetime.utcnow(),
+    })
+
+
+def shutdown() -> None:
+    """Drain the buffer; called from the app's lifespan on shutdown"""
+    buffer.close()
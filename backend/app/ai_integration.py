@@ -3,8 +3,13 @@
 AI Integration using OpenRouter (OpenAI-compatible)
 """
 from openai import AsyncOpenAI
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple
+import asyncio
+import hashlib
+import json
 from .config import get_settings
+from .cache import llm_cache
+from .context_budget import ContextBudget, configured_model
 
 settings = get_settings()
 
@@ -31,63 +36,220 @@ else:
 
 def _get_model():
     """Get the appropriate model name based on provider"""
-    model = "gpt-4o-mini"
-    if settings.OPENAI_API_KEY:
-        model = settings.OPENAI_MODEL or "gpt-4o-mini"
-    elif settings.OPENROUTER_MODEL:
-        model = settings.OPENROUTER_MODEL
+    model = configured_model()
     
     print(f"DEBUG: Using model: {model}")
     return model
 
-def _truncate_text(text: str, max_chars: int = 100000) -> str:
-    """Truncate text to safe limit to avoid context length errors"""
-    if len(text) <= max_chars:
-        return text
-    return text[:max_chars] + "... (truncated)"
+def _budget(task: str) -> ContextBudget:
+    """Token budget for one request of this task on the configured model (see context_budget)"""
+    return ContextBudget(task, _get_model())
 
-async def _generate_text(prompt: str, system_prompt: str = "You are a helpful assistant.", history: List[Dict[str, str]] = None) -> str:
-    """Helper to generate text using OpenRouter with history support"""
-    if not client:
-        raise Exception("OpenRouter API key not configured")
-        
+def _completion_key(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    """Content address of a completion request: sha256 over everything that shapes the answer"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _build_messages(prompt: str, system_prompt: str, history: List[Dict[str, str]] = None) -> List[Dict[str, str]]:
     messages = [{"role": "system", "content": system_prompt}]
     
     if history:
         messages.extend(history)
     
     messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def _generation_error(e: Exception) -> Exception:
+    # Check for context length error
+    if "maximum context length" in str(e):
+        return Exception("Text is too long for AI processing. Please try with a shorter section.")
+    return Exception(f"AI generation failed: {str(e)}")
+
+
+async def _generate_text(
+    prompt: str,
+    system_prompt: str = "You are a helpful assistant.",
+    history: List[Dict[str, str]] = None,
+    use_cache: bool = True,
+    max_tokens: int = 1000
+) -> str:
+    """
+    Helper to generate text using OpenRouter with history support
+    
+    Completions are cached by content (model, system prompt, messages,
+    temperature), and identical concurrent requests share one provider call.
+    Pass use_cache=False where a fresh answer is expected every time, and the
+    task's output budget (ContextBudget.max_tokens) as max_tokens.
+    """
+    if not client:
+        raise Exception("OpenRouter API key not configured")
         
+    messages = _build_messages(prompt, system_prompt, history)
+    model = _get_model()
+    temperature = 0.7
+    
+    async def complete() -> str:
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            raise _generation_error(e)
+    
+    if not use_cache or not settings.LLM_CACHE_ENABLED:
+        return await complete()
+    return await llm_cache.get_or_set(
+        "llm",
+        _completion_key(model, messages, temperature, max_tokens),
+        complete,
+        ttl=settings.LLM_CACHE_TTL_SECONDS
+    )
+
+
+async def _stream_text(
+    prompt: str,
+    system_prompt: str = "You are a helpful assistant.",
+    history: List[Dict[str, str]] = None,
+    use_cache: bool = True,
+    max_tokens: int = 1000
+) -> AsyncIterator[str]:
+    """
+    _generate_text, yielding the completion chunk by chunk as the provider sends it
+    
+    Shares _generate_text's cache: a cached completion is yielded in one piece,
+    and a streamed one is stored once it has arrived in full.
+    """
+    if not client:
+        raise Exception("OpenRouter API key not configured")
+    
+    messages = _build_messages(prompt, system_prompt, history)
+    model = _get_model()
+    temperature = 0.7
+    use_cache = use_cache and settings.LLM_CACHE_ENABLED
+    key = _completion_key(model, messages, temperature, max_tokens)
+    
+    if use_cache:
+        cached = await llm_cache.get("llm", key)
+        if cached is not None:
+            yield cached
+            return
+    
+    chunks = []
     try:
-        response = await client.chat.completions.create(
-            model=_get_model(),
+        stream = await client.chat.completions.create(
+            model=model,
             messages=messages,
-            temperature=0.7,
-            max_tokens=1000
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
         )
-        return response.choices[0].message.content.strip()
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                # Drop leading whitespace, as the non-streaming strip() would
+                if not chunks:
+                    delta = delta.lstrip()
+                    if not delta:
+                        continue
+                chunks.append(delta)
+                yield delta
     except Exception as e:
-        # Check for context length error
-        if "maximum context length" in str(e):
-            raise Exception("Text is too long for AI processing. Please try with a shorter section.")
-        raise Exception(f"AI generation failed: {str(e)}")
-
-async def ai_chat(text: str, history: List[Dict[str, str]] = None, context: Optional[str] = None) -> str:
-    """Chat with the AI using conversation history"""
-    system_prompt = "You are a helpful AI assistant for NoteAI Pro. You help users with their notes, organization, and information needs."
-    
-    # Truncate content to avoid token limits
-    safe_text = _truncate_text(text, max_chars=50000)
-    safe_context = _truncate_text(context, max_chars=20000) if context else None
+        raise _generation_error(e)
+    
+    if use_cache and chunks:
+        await llm_cache.set("llm", key, "".join(chunks).strip(), ttl=settings.LLM_CACHE_TTL_SECONDS)
+
+def _chat_prompt(
+    text: str,
+    history: Optional[List[Dict[str, str]]],
+    context: Optional[str],
+    summary: Optional[str] = None
+) -> Tuple[str, str, List[Dict[str, str]], int]:
+    """(prompt, system prompt, history, max_tokens) for a chat turn, within the chat token budget"""
+    budget = _budget("chat")
+    system_prompt = budget.fit("You are a helpful AI assistant for NoteAI Pro. You help users with their notes, organization, and information needs.")
+    
+    # Budget priority: system prompt, summary of earlier turns, history,
+    # context, the new message; the message itself (up to half the budget) is
+    # never crowded out
+    message_reserve = min(budget.count(text), budget.input_tokens // 2)
+    safe_summary = budget.fit(summary, reserve=message_reserve)
+    if safe_summary:
+        system_prompt += f"\n\nSummary of the earlier conversation:\n{safe_summary}"
+    history = budget.fit_history(history, reserve=message_reserve)
+    safe_context = budget.fit(context, reserve=message_reserve)
+    safe_text = budget.fit(text)
     
     if safe_context:
         system_prompt += f"\n\nContext about the current task or file:\n{safe_context}"
-        
-    return await _generate_text(safe_text, system_prompt, history)
+    return safe_text, system_prompt, history, budget.max_tokens
 
-async def ai_summarize(text: str, mode: str = "short", context: Optional[str] = None) -> str:
-    """Summarize text with different modes: short, bullets, key_takeaways, eli5"""
-    safe_text = _truncate_text(text)
+
+async def ai_chat(
+    text: str,
+    history: List[Dict[str, str]] = None,
+    context: Optional[str] = None,
+    summary: Optional[str] = None
+) -> str:
+    """Chat with the AI using conversation history (recent messages plus a summary of earlier ones)"""
+    prompt, system_prompt, history, max_tokens = _chat_prompt(text, history, context, summary)
+    # Conversations stay uncached: a repeated question deserves a fresh answer
+    return await _generate_text(prompt, system_prompt, history, use_cache=False, max_tokens=max_tokens)
+
+
+def ai_chat_stream(
+    text: str,
+    history: List[Dict[str, str]] = None,
+    context: Optional[str] = None,
+    summary: Optional[str] = None
+) -> AsyncIterator[str]:
+    """ai_chat, streamed chunk by chunk"""
+    prompt, system_prompt, history, max_tokens = _chat_prompt(text, history, context, summary)
+    return _stream_text(prompt, system_prompt, history, use_cache=False, max_tokens=max_tokens)
+
+
+async def ai_summarize_chat(summary: Optional[str], messages: List[Dict[str, str]]) -> str:
+    """Fold chat messages into the running summary of a conversation"""
+    budget = _budget("chat_summary")
+    system_prompt = budget.fit("You maintain concise running summaries of conversations.")
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    # The previous summary is kept whole when possible; the oldest messages come first
+    previous = budget.fit(summary or "(none yet)", reserve=budget.remaining // 2)
+    transcript = budget.fit(transcript)
+    
+    prompt = f"""Update the summary of a conversation between a user and an AI assistant.
+
+Summary so far:
+{previous}
+
+New messages:
+{transcript}
+
+Write the updated summary in at most 200 words. Keep facts, decisions, names,
+open questions and the user's preferences that later turns may rely on; drop
+small talk. Return only the summary."""
+    
+    return await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
+
+
+SUMMARIZE_SYSTEM_PROMPT = "You are an expert summarization assistant."
+
+
+def _summarize_prompt(text: str, mode: str = "short", context: Optional[str] = None) -> Tuple[str, int]:
+    budget = _budget("summarize")
+    budget.fit(SUMMARIZE_SYSTEM_PROMPT)
+    context = budget.fit(context, reserve=budget.remaining // 2)
+    safe_text = budget.fit(text)
     
     mode_prompts = {
         "short": "Write a concise 1-2 sentence summary.",
@@ -102,14 +264,28 @@ async def ai_summarize(text: str, mode: str = "short", context: Optional[str] =
     
     if context:
         prompt = f"Context: {context}\n\n{prompt}"
-    
-    return await _generate_text(prompt, "You are an expert summarization assistant.")
+    return prompt, budget.max_tokens
 
 
-async def ai_rewrite(text: str, style: str = "improve") -> str:
-    """Rewrite/improve text"""
-    # Truncate input
-    safe_text = _truncate_text(text)
+async def ai_summarize(text: str, mode: str = "short", context: Optional[str] = None) -> str:
+    """Summarize text with different modes: short, bullets, key_takeaways, eli5"""
+    prompt, max_tokens = _summarize_prompt(text, mode, context)
+    return await _generate_text(prompt, SUMMARIZE_SYSTEM_PROMPT, max_tokens=max_tokens)
+
+
+def ai_summarize_stream(text: str, mode: str = "short", context: Optional[str] = None) -> AsyncIterator[str]:
+    """ai_summarize, streamed chunk by chunk"""
+    prompt, max_tokens = _summarize_prompt(text, mode, context)
+    return _stream_text(prompt, SUMMARIZE_SYSTEM_PROMPT, max_tokens=max_tokens)
+
+
+REWRITE_SYSTEM_PROMPT = "You are a skilled writing assistant that helps improve text quality."
+
+
+def _rewrite_prompt(text: str, style: str = "improve") -> Tuple[str, int]:
+    budget = _budget("rewrite")
+    budget.fit(REWRITE_SYSTEM_PROMPT)
+    safe_text = budget.require(text)  # a rewrite of a prefix would lose the rest
     
     style_prompts = {
         "improve": "Improve the following text while maintaining its original meaning. Make it clearer and more engaging:",
@@ -119,9 +295,19 @@ async def ai_rewrite(text: str, style: str = "improve") -> str:
     }
     
     instruction = style_prompts.get(style, style_prompts["improve"])
-    prompt = f"{instruction}\n\n{safe_text}"
-    
-    return await _generate_text(prompt, "You are a skilled writing assistant that helps improve text quality.")
+    return f"{instruction}\n\n{safe_text}", budget.max_tokens
+
+
+async def ai_rewrite(text: str, style: str = "improve") -> str:
+    """Rewrite/improve text; raises context_budget.TextTooLong rather than rewriting only part of it"""
+    prompt, max_tokens = _rewrite_prompt(text, style)
+    return await _generate_text(prompt, REWRITE_SYSTEM_PROMPT, max_tokens=max_tokens)
+
+
+def ai_rewrite_stream(text: str, style: str = "improve") -> AsyncIterator[str]:
+    """ai_rewrite, streamed chunk by chunk"""
+    prompt, max_tokens = _rewrite_prompt(text, style)
+    return _stream_text(prompt, REWRITE_SYSTEM_PROMPT, max_tokens=max_tokens)
 
 async def ai_generate_note(topic: str, length: str = "medium") -> Dict[str, Any]:
     """Auto-generate a note based on a topic"""
@@ -132,6 +318,8 @@ async def ai_generate_note(topic: str, length: str = "medium") -> Dict[str, Any]
     }
     
     instruction = length_instructions.get(length, length_instructions["medium"])
+    budget = _budget("generate_note")
+    topic = budget.fit(topic)
     
     prompt = f"""Generate a comprehensive note about: {topic}
 
@@ -144,7 +332,9 @@ Please structure the note with:
 
 Format the response as markdown."""
     
-    content = await _generate_text(prompt, "You are a knowledgeable assistant that creates well-structured, informative notes.")
+    # Uncached: generating the same topic again should give a new draft
+    content = await _generate_text(prompt, "You are a knowledgeable assistant that creates well-structured, informative notes.",
+                                   use_cache=False, max_tokens=budget.max_tokens)
     
     # Extract title
     lines = content.split('\n')
@@ -161,16 +351,17 @@ Format the response as markdown."""
 
 async def ai_generate_tags(text: str, max_tags: int = 5) -> List[str]:
     """Generate relevant tags"""
-    # Truncate input for tagging too
-    safe_text = _truncate_text(text, max_chars=20000)
+    budget = _budget("tags")
+    system_prompt = budget.fit("You are a content analysis assistant that generates relevant tags.")
+    safe_text = budget.fit(text)
     
     prompt = f"""Analyze the following text and generate {max_tags} relevant, concise tags (single words or short phrases).
 Return only the tags as a comma-separated list, nothing else.
 
 Text:
-{safe_text[:1000]}"""
+{safe_text}"""
     
-    tags_text = await _generate_text(prompt, "You are a content analysis assistant that generates relevant tags.")
+    tags_text = await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
     return [tag.strip() for tag in tags_text.split(',')][:max_tags]
 
 async def ai_generate_image(prompt: str, size: str = "1024x1024", quality: str = "standard") -> bytes:
@@ -189,11 +380,14 @@ async def ai_get_suggestions(current_text: str, cursor_position: int) -> str:
     if len(context.strip()) < 10:
         return ""
     
+    budget = _budget("suggestions")
+    system_prompt = budget.fit("You are a writing assistant providing brief, contextual suggestions.")
+    context = budget.fit(context)
     prompt = f"""Given this text context, suggest a brief, natural continuation (1-2 sentences max):
 
 {context}"""
     
-    return await _generate_text(prompt, "You are a writing assistant providing brief, contextual suggestions.")
+    return await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
 
 async def ai_action(text: str, action: str, **kwargs) -> Any:
     """Unified AI action handler"""
@@ -222,7 +416,9 @@ async def ai_action(text: str, action: str, **kwargs) -> Any:
 
 async def ai_detect_category(text: str) -> str:
     """Auto-detect the category of a note."""
-    safe_text = _truncate_text(text, max_chars=5000)
+    budget = _budget("category")
+    system_prompt = budget.fit("You are a text classification expert. Respond with only one word.")
+    safe_text = budget.fit(text)
     prompt = f"""Analyze the following note and assign ONE category from this list:
 [work, study, personal, ideas, tasks, finance, health, travel, other]
 
@@ -231,16 +427,84 @@ Return ONLY the category name in lowercase, nothing else.
 Note:
 {safe_text}"""
     
-    result = await _generate_text(prompt, "You are a text classification expert. Respond with only one word.")
-    # Clean up result
-    category = result.strip().lower().replace('"', '').replace("'", "")
-    valid_categories = ["work", "study", "personal", "ideas", "tasks", "finance", "health", "travel", "other"]
-    return category if category in valid_categories else "other"
+    result = await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
+    return _clean_category(result)
+
+
+NOTE_CATEGORIES = ["work", "study", "personal", "ideas", "tasks", "finance", "health", "travel", "other"]
+
+
+def _clean_category(result: str) -> str:
+    category = str(result).strip().lower().replace('"', '').replace("'", "")
+    return category if category in NOTE_CATEGORIES else "other"
+
+
+async def ai_enrich_note(text: str, want_tags: bool = True, want_category: bool = True, max_tags: int = 5) -> Dict[str, Any]:
+    """
+    Tags and category for a note from one structured prompt
+    
+    Returns {"tags": [...]} and/or {"category": "..."} for what was asked.
+    Falls back to ai_generate_tags / ai_detect_category, run concurrently,
+    if the combined answer can't be parsed.
+    """
+    if not want_tags and not want_category:
+        return {}
+    
+    budget = _budget("enrich")
+    system_prompt = budget.fit("You are a content analysis assistant. Return valid JSON only.")
+    safe_text = budget.fit(text)
+    fields = []
+    if want_tags:
+        fields.append(f'"tags": {max_tags} relevant, concise tags (single words or short phrases)')
+    if want_category:
+        fields.append(f'"category": ONE of [{", ".join(NOTE_CATEGORIES)}], in lowercase')
+    field_lines = "\n".join(f"- {field}" for field in fields)
+    prompt = f"""Analyze the following note and return a JSON object with:
+{field_lines}
+
+Return ONLY the JSON object, nothing else.
+
+Note:
+{safe_text}"""
+    
+    result = await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
+    try:
+        result = result.strip()
+        if result.startswith("```json"):
+            result = result[7:]
+        if result.startswith("```"):
+            result = result[3:]
+        if result.endswith("```"):
+            result = result[:-3]
+        data = json.loads(result.strip())
+        enrichment = {}
+        if want_tags:
+            tags = data["tags"]
+            if isinstance(tags, str):
+                tags = tags.split(",")
+            enrichment["tags"] = [str(tag).strip() for tag in tags if str(tag).strip()][:max_tags]
+        if want_category:
+            enrichment["category"] = _clean_category(data["category"])
+        return enrichment
+    except (ValueError, KeyError, TypeError):
+        pass
+    
+    # Unparseable combined answer: ask separately, in parallel
+    keys, calls = [], []
+    if want_tags:
+        keys.append("tags")
+        calls.append(ai_generate_tags(text, max_tags))
+    if want_category:
+        keys.append("category")
+        calls.append(ai_detect_category(text))
+    return dict(zip(keys, await asyncio.gather(*calls)))
 
 
 async def ai_auto_format(text: str) -> str:
-    """Clean and structure messy text into well-formatted markdown."""
-    safe_text = _truncate_text(text)
+    """Clean and structure messy text into well-formatted markdown (TextTooLong if it cannot be sent whole)."""
+    budget = _budget("format")
+    system_prompt = budget.fit("You are a professional document formatter. Return clean, readable markdown.")
+    safe_text = budget.require(text)
     prompt = f"""Clean and format the following messy text into well-structured markdown. Apply these rules:
 1. Create clear headings using #, ##, ### where appropriate.
 2. Convert any lists to properly formatted bullet points or numbered lists.
@@ -252,13 +516,15 @@ async def ai_auto_format(text: str) -> str:
 Text to format:
 {safe_text}"""
     
-    return await _generate_text(prompt, "You are a professional document formatter. Return clean, readable markdown.")
+    return await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
 
 
 async def ai_extract_tasks(text: str) -> List[Dict[str, Any]]:
     """Extract tasks and deadlines from note text."""
     import json
-    safe_text = _truncate_text(text, max_chars=10000)
+    budget = _budget("tasks")
+    system_prompt = budget.fit("You are a task extraction expert. Return valid JSON only.")
+    safe_text = budget.fit(text)
     prompt = f"""Extract ALL tasks, to-do items, action items, and deadlines from the following text.
 
 Return as a valid JSON array with objects containing:
@@ -274,7 +540,7 @@ If no tasks are found, return an empty array: []
 Text:
 {safe_text}"""
     
-    result = await _generate_text(prompt, "You are a task extraction expert. Return valid JSON only.")
+    result = await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
     
     # Parse JSON safely
     try:
@@ -296,8 +562,12 @@ async def ai_find_related_notes(current_note: str, other_notes: List[Dict[str, A
     if not other_notes:
         return []
     
-    current_summary = _truncate_text(current_note, max_chars=500)
-    notes_list = "\n".join([f"{i}: {_truncate_text(n.get('title', '') + ' ' + n.get('content', ''), max_chars=200)}" 
+    budget = _budget("related")
+    system_prompt = budget.fit("You are a semantic similarity expert.")
+    # The current note gets up to a quarter of the budget, the candidates share the rest
+    current_summary = budget.fit(current_note, reserve=budget.remaining * 3 // 4)
+    per_note = max(20, budget.remaining // len(other_notes))
+    notes_list = "\n".join([f"{i}: {budget.fit(n.get('title', '') + ' ' + n.get('content', ''), reserve=budget.remaining - per_note)}"
                            for i, n in enumerate(other_notes)])
     
     prompt = f"""Given the current note and a list of other notes, identify the 3 most semantically related notes.
@@ -312,7 +582,7 @@ Return ONLY the indices of the 3 most related notes as comma-separated numbers (
 If fewer than 3 are related, return only those that are relevant.
 If none are related, return "none"."""
     
-    result = await _generate_text(prompt, "You are a semantic similarity expert.")
+    result = await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
     
     if "none" in result.lower():
         return []
@@ -326,19 +596,24 @@ If none are related, return "none"."""
 
 async def ai_expand_search_query(query: str) -> List[str]:
     """Expand a search query with semantically similar terms for better search."""
+    budget = _budget("expand_query")
+    system_prompt = budget.fit("You are a search query expansion expert.")
+    query = budget.fit(query)
     prompt = f"""Given the search query "{query}", generate 5 related keywords or phrases that someone might also be looking for.
 
 Return ONLY a comma-separated list of terms, nothing else.
 Example: for "python", you might return "programming, coding, script, automation, development"."""
     
-    result = await _generate_text(prompt, "You are a search query expansion expert.")
+    result = await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
     return [q.strip() for q in result.split(',') if q.strip()][:5]
 
 
 async def ai_generate_flashcards(text: str, count: int = 5) -> List[Dict[str, str]]:
     """Generate flashcards from note content for study mode."""
     import json
-    safe_text = _truncate_text(text, max_chars=10000)
+    budget = _budget("flashcards")
+    system_prompt = budget.fit("You are an educational content creator. Return valid JSON only.")
+    safe_text = budget.fit(text)
     prompt = f"""Create {count} flashcards from the following study material.
 Each flashcard should test understanding of a key concept.
 
@@ -348,7 +623,7 @@ Example: [{{"question": "What is photosynthesis?", "answer": "The process by whi
 Material:
 {safe_text}"""
     
-    result = await _generate_text(prompt, "You are an educational content creator. Return valid JSON only.")
+    result = await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
     
     try:
         result = result.strip()
@@ -365,8 +640,12 @@ Material:
 
 async def ai_generate_daily_brief(notes: List[Dict[str, Any]], tasks: List[Dict[str, Any]]) -> str:
     """Generate a personalized daily brief summarizing recent notes and pending tasks."""
+    budget = _budget("daily_brief")
+    system_prompt = budget.fit("You are a helpful personal productivity assistant.")
     notes_summary = "\n".join([f"- {n.get('title', 'Untitled')}" for n in notes[:10]])
     tasks_summary = "\n".join([f"- {t.get('task', '')} (Due: {t.get('deadline', 'No deadline')})" for t in tasks[:10]])
+    notes_summary = budget.fit(notes_summary, reserve=budget.remaining // 2)
+    tasks_summary = budget.fit(tasks_summary)
     
     prompt = f"""Create a friendly, concise daily brief for the user. Include:
 1. A warm greeting
@@ -382,7 +661,7 @@ PENDING TASKS:
 
 Keep it brief and motivating!"""
     
-    return await _generate_text(prompt, "You are a helpful personal productivity assistant.")
+    return await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
 
 
 async def ai_ask_notes(question: str, notes_context: str) -> str:
@@ -390,6 +669,11 @@ async def ai_ask_notes(question: str, notes_context: str) -> str:
     system_prompt = """You are an AI assistant that answers questions ONLY based on the user's notes provided below.
 If the answer cannot be found in the notes, clearly say "I couldn't find information about this in your notes."
 Do not make up information. Cite which note the information comes from when possible."""
+    budget = _budget("ask_notes")
+    budget.fit(system_prompt)
+    question_reserve = min(budget.count(question), budget.remaining // 4)
+    notes_context = budget.fit(notes_context, reserve=question_reserve)
+    question = budget.fit(question)
     
     prompt = f"""USER'S NOTES:
 {notes_context}
@@ -399,4 +683,4 @@ USER'S QUESTION:
 
 Answer based only on the notes above:"""
     
-    return await _generate_text(prompt, system_prompt)
+    return await _generate_text(prompt, system_prompt, max_tokens=budget.max_tokens)
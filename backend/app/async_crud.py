@@ -0,0 +1,377 @@
+# backend/app/async_crud.py
+"""
+Async CRUD operations for the API routes
+
+Each function runs the matching function from crud.py on an AsyncSession via
+run_sync, so the queries go through the asyncio driver and never block the
+event loop, while crud.py stays the single place where the logic lives.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+from datetime import datetime
+from . import models, schemas, crud, rollups
+
+
+# ==================== NOTE OPERATIONS ====================
+
+async def get_notes(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    archived: bool = False,
+    cursor: Optional[str] = None,
+    summary: bool = False
+) -> List[models.Note]:
+    """Get all notes for a user (default: non-archived, non-deleted); summary=True returns NoteSummaryOut dicts"""
+    return await db.run_sync(crud.get_notes, user_id, skip, limit, archived, cursor, summary)
+
+
+async def get_note_etag_key(db: AsyncSession, note_id: int, user_id: int) -> Optional[tuple]:
+    """The fields of a note's ETag (see crud.get_note_etag_key) without loading it; None if not found"""
+    return await db.run_sync(crud.get_note_etag_key, note_id, user_id)
+
+
+async def get_corpus_version(db: AsyncSession, user_id: int) -> int:
+    """Counter that changes whenever any of the user's notes does"""
+    return await db.run_sync(rollups.get_corpus_version, user_id)
+
+
+async def get_note_by_id(db: AsyncSession, note_id: int, user_id: int) -> Optional[models.Note]:
+    """Get a specific note by ID"""
+    return await db.run_sync(crud.get_note_by_id, note_id, user_id)
+
+
+async def create_note(db: AsyncSession, note: schemas.NoteCreate, user_id: int) -> models.Note:
+    """Create a new note"""
+    return await db.run_sync(crud.create_note, note, user_id)
+
+
+async def update_note(db: AsyncSession, note_id: int, note_update: schemas.NoteUpdate, user_id: int) -> models.Note:
+    """Update an existing note"""
+    return await db.run_sync(crud.update_note, note_id, note_update, user_id)
+
+
+async def delete_note(db: AsyncSession, note_id: int, user_id: int) -> bool:
+    """Delete a note"""
+    return await db.run_sync(crud.delete_note, note_id, user_id)
+
+
+async def archive_note(db: AsyncSession, note_id: int, user_id: int) -> Optional[models.Note]:
+    """Archive a note"""
+    return await db.run_sync(crud.archive_note, note_id, user_id)
+
+
+async def unarchive_note(db: AsyncSession, note_id: int, user_id: int) -> Optional[models.Note]:
+    """Unarchive a note"""
+    return await db.run_sync(crud.unarchive_note, note_id, user_id)
+
+
+async def search_notes(db: AsyncSession, user_id: int, search_params: schemas.NoteSearch, summary: bool = False) -> List[models.Note]:
+    """Search and filter notes; summary=True returns NoteSummaryOut dicts"""
+    return await db.run_sync(crud.search_notes, user_id, search_params, summary)
+
+
+async def semantic_search(db: AsyncSession, user_id: int, query: str, limit: int = 20) -> List[dict]:
+    """Notes closest to the query in the local vector index (summary dicts with a score), best first"""
+    return await db.run_sync(crud.semantic_search, user_id, query, limit)
+
+
+async def get_related_notes(db: AsyncSession, note_id: int, user_id: int, limit: int = 5) -> List[dict]:
+    """The user's notes most similar to this one (summary dicts with a score), best first"""
+    return await db.run_sync(crud.get_related_notes, note_id, user_id, limit)
+
+
+async def find_passages(db: AsyncSession, user_id: int, question: str, k: int, token_budget: int) -> dict:
+    """{"passages": [...], "notes_searched": n}: the passages of the user's notes that best match a question"""
+    return await db.run_sync(crud.find_passages, user_id, question, k, token_budget)
+
+
+async def get_note_versions(db: AsyncSession, note_id: int, user_id: int) -> List[models.NoteVersion]:
+    """Get all versions of a note"""
+    return await db.run_sync(crud.get_note_versions, note_id, user_id)
+
+
+# ==================== TAG OPERATIONS ====================
+
+async def sync_note_tags(db: AsyncSession, note: models.Note) -> None:
+    """Rewrite a note's note_tags rows from note.tags; caller commits"""
+    await db.run_sync(crud.sync_note_tags, note)
+
+
+async def get_tag_counts(db: AsyncSession, user_id: int) -> List[dict]:
+    """Number of live notes per tag, most used first"""
+    return await db.run_sync(crud.get_tag_counts, user_id)
+
+
+# ==================== AI ENRICHMENT ====================
+
+async def get_enrichment_source(db: AsyncSession, note_id: int):
+    """The columns of a note the enrichment worker reads; None if it is gone"""
+    return await db.run_sync(crud.get_enrichment_source, note_id)
+
+
+async def apply_note_enrichment(
+    db: AsyncSession,
+    note_id: int,
+    version: int,
+    enrichment: Optional[dict]
+) -> Optional[models.Note]:
+    """Store tags / category computed from `version` of a note; None if the note moved on"""
+    return await db.run_sync(crud.apply_note_enrichment, note_id, version, enrichment)
+
+
+async def get_pending_enrichments(db: AsyncSession, limit: int = 1000) -> List[Tuple[int, int]]:
+    """(note_id, version) of notes still waiting for enrichment"""
+    return await db.run_sync(crud.get_pending_enrichments, limit)
+
+
+# ==================== TASK INDEX ====================
+
+async def get_task_source(db: AsyncSession, note_id: int):
+    """Content, version and task state of a note for task extraction"""
+    return await db.run_sync(crud.get_task_source, note_id)
+
+
+async def store_note_tasks(db: AsyncSession, note_id: int, version: int, tasks: Optional[List[dict]]) -> bool:
+    """Replace a note's tasks with those extracted from `version` (False if it was edited meanwhile)"""
+    return await db.run_sync(crud.store_note_tasks, note_id, version, tasks)
+
+
+async def request_task_extraction(db: AsyncSession, note_id: int) -> None:
+    """Mark a note's tasks pending"""
+    return await db.run_sync(crud.request_task_extraction, note_id)
+
+
+async def get_note_tasks(db: AsyncSession, note_id: int) -> List[models.NoteTask]:
+    """A note's stored tasks"""
+    return await db.run_sync(crud.get_note_tasks, note_id)
+
+
+async def get_user_tasks(
+    db: AsyncSession,
+    user_id: int,
+    due_within_days: Optional[int] = None,
+    priority: Optional[str] = None,
+    order: str = "due",
+    limit: int = 50
+) -> List[dict]:
+    """Tasks across a user's notes"""
+    return await db.run_sync(crud.get_user_tasks, user_id, due_within_days, priority, order, limit)
+
+
+async def get_pending_task_extractions(db: AsyncSession, limit: int = 1000) -> List[Tuple[int, int]]:
+    """(note_id, version) of notes waiting for task extraction"""
+    return await db.run_sync(crud.get_pending_task_extractions, limit)
+
+
+# ==================== DAILY BRIEF ====================
+
+async def get_brief_notes(db: AsyncSession, user_id: int, since: datetime, limit: int = 10):
+    """Recently edited notes with their task index state"""
+    return await db.run_sync(crud.get_brief_notes, user_id, since, limit)
+
+
+async def get_recently_active_users(db: AsyncSession, since: datetime, limit: int = 500) -> List[int]:
+    """Ids of users with any activity since `since`"""
+    return await db.run_sync(crud.get_recently_active_users, since, limit)
+
+
+# ==================== TRASH OPERATIONS ====================
+
+async def move_to_trash(db: AsyncSession, note_id: int, user_id: int) -> Optional[models.Note]:
+    """Move a note to trash (soft delete)"""
+    return await db.run_sync(crud.move_to_trash, note_id, user_id)
+
+
+async def restore_from_trash(db: AsyncSession, note_id: int, user_id: int) -> Optional[models.Note]:
+    """Restore a note from trash"""
+    return await db.run_sync(crud.restore_from_trash, note_id, user_id)
+
+
+async def get_trash_notes(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    summary: bool = False
+) -> List[models.Note]:
+    """Get all deleted notes (trash) for a user; summary=True returns NoteSummaryOut dicts"""
+    return await db.run_sync(crud.get_trash_notes, user_id, skip, limit, cursor, summary)
+
+
+async def permanent_delete_note(db: AsyncSession, note_id: int, user_id: int) -> bool:
+    """Permanently delete a note from trash"""
+    return await db.run_sync(crud.permanent_delete_note, note_id, user_id)
+
+
+async def empty_trash(db: AsyncSession, user_id: int) -> int:
+    """Permanently delete all notes in trash"""
+    return await db.run_sync(crud.empty_trash, user_id)
+
+
+# ==================== FILE OPERATIONS ====================
+
+async def create_file_attachment(
+    db: AsyncSession,
+    note_id: int,
+    user_id: int,
+    filename: str,
+    original_filename: str,
+    file_type: str,
+    file_size: int,
+    file_data: bytes,
+    thumbnail_data: Optional[bytes] = None,
+    meta_data: dict = {}
+) -> models.FileAttachment:
+    """Create a file attachment for a note"""
+    return await db.run_sync(
+        crud.create_file_attachment,
+        note_id=note_id,
+        user_id=user_id,
+        filename=filename,
+        original_filename=original_filename,
+        file_type=file_type,
+        file_size=file_size,
+        file_data=file_data,
+        thumbnail_data=thumbnail_data,
+        meta_data=meta_data
+    )
+
+
+async def get_file_attachment(
+    db: AsyncSession,
+    file_id: int,
+    user_id: int,
+    with_data: bool = False,
+    with_thumbnail: bool = False
+) -> Optional[models.FileAttachment]:
+    """Get a file attachment with ownership verification (bytes only when asked for)"""
+    return await db.run_sync(crud.get_file_attachment, file_id, user_id, with_data, with_thumbnail)
+
+
+async def delete_file_attachment(db: AsyncSession, file_id: int, user_id: int) -> bool:
+    """Delete a file attachment"""
+    return await db.run_sync(crud.delete_file_attachment, file_id, user_id)
+
+
+# ==================== SHARED LINK OPERATIONS ====================
+
+async def create_shared_link(
+    db: AsyncSession,
+    note_id: int,
+    user_id: int,
+    expires_at: Optional[datetime] = None,
+    password: Optional[str] = None
+) -> models.SharedLink:
+    """Create a shareable link for a note"""
+    return await db.run_sync(crud.create_shared_link, note_id, user_id, expires_at, password)
+
+
+async def get_shared_note(db: AsyncSession, token: str, password: Optional[str] = None) -> Optional[models.Note]:
+    """Access a shared note using token"""
+    return await db.run_sync(crud.get_shared_note, token, password)
+
+
+async def get_shared_note_with_link(
+    db: AsyncSession,
+    token: str,
+    password: Optional[str] = None
+) -> Optional[Tuple[models.SharedLink, models.Note]]:
+    """Access a shared note using token, returning the link with it"""
+    return await db.run_sync(crud.get_shared_note_with_link, token, password)
+
+
+async def get_shared_link_state(db: AsyncSession, token: str):
+    """A share link's access state and its note's ETag fields; None if the token is unknown"""
+    return await db.run_sync(crud.get_shared_link_state, token)
+
+
+async def record_shared_view(db: AsyncSession, link_id: int) -> None:
+    """Count a view of a shared link served from the cache"""
+    await db.run_sync(crud.record_shared_view, link_id)
+
+
+async def get_shared_links_for_note(db: AsyncSession, note_id: int, user_id: int) -> List[models.SharedLink]:
+    """Get all shared links for a note"""
+    return await db.run_sync(crud.get_shared_links_for_note, note_id, user_id)
+
+
+async def deactivate_shared_link(db: AsyncSession, link_id: int, user_id: int) -> bool:
+    """Deactivate a shared link"""
+    return await db.run_sync(crud.deactivate_shared_link, link_id, user_id)
+
+
+# ==================== ACTIVITY OPERATIONS ====================
+
+async def create_activity(
+    db: AsyncSession,
+    user_id: int,
+    activity_type: str,
+    description: Optional[str] = None,
+    note_id: Optional[int] = None,
+    meta_data: dict = {}
+) -> None:
+    """Log user activity (only queues the event, so there is nothing to await on the database)"""
+    crud.create_activity(
+        db,
+        user_id=user_id,
+        activity_type=activity_type,
+        description=description,
+        note_id=note_id,
+        meta_data=meta_data
+    )
+
+
+async def get_analytics(db: AsyncSession, user_id: int, days: int = crud.ANALYTICS_TIMELINE_DAYS) -> dict:
+    """Get analytics data for user dashboard"""
+    return await db.run_sync(crud.get_analytics, user_id, days)
+
+
+# ==================== CHAT OPERATIONS ====================
+
+async def create_chat_session(db: AsyncSession, user_id: int) -> models.ChatSession:
+    """Create a new chat session"""
+    return await db.run_sync(crud.create_chat_session, user_id)
+
+
+async def get_chat_session(db: AsyncSession, chat_id: str, user_id: int) -> Optional[models.ChatSession]:
+    """Get a chat session with ownership verification"""
+    return await db.run_sync(crud.get_chat_session, chat_id, user_id)
+
+
+async def get_chat_sessions(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> List[models.ChatSession]:
+    """Get all chat sessions for a user"""
+    return await db.run_sync(crud.get_chat_sessions, user_id, skip, limit, cursor)
+
+
+async def create_chat_message(db: AsyncSession, chat_id: str, role: str, content: str) -> models.ChatMessage:
+    """Add a message to a chat session"""
+    return await db.run_sync(crud.create_chat_message, chat_id, role, content)
+
+
+async def get_chat_messages(db: AsyncSession, chat_id: str, user_id: int, limit: int = 50) -> List[models.ChatMessage]:
+    """Get messages for a chat session with ownership verification"""
+    return await db.run_sync(crud.get_chat_messages, chat_id, user_id, limit)
+
+
+async def get_chat_memory(db: AsyncSession, chat_id: str, user_id: int, limit: int) -> Optional[dict]:
+    """A session's rolling memory (summary and latest unsummarized messages)"""
+    return await db.run_sync(crud.get_chat_memory, chat_id, user_id, limit)
+
+
+async def get_messages_to_summarize(db: AsyncSession, chat_id: str, after_id: int, keep: int, limit: int) -> List[dict]:
+    """Oldest messages not yet summarized, leaving the latest `keep` out"""
+    return await db.run_sync(crud.get_messages_to_summarize, chat_id, after_id, keep, limit)
+
+
+async def update_chat_summary(db: AsyncSession, chat_id: str, summary: str, previous_until: int, summarized_until: int) -> bool:
+    """Store a new session summary (optimistic on summarized_until)"""
+    return await db.run_sync(crud.update_chat_summary, chat_id, summary, previous_until, summarized_until)
@@ -8,11 +8,15 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
 from .database import get_db
 from .models import User
 from .config import get_settings
+from .utils import TTLCache
+import hashlib
 import secrets
+import time
 
 settings = get_settings()
 
@@ -21,6 +25,12 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 security = HTTPBearer()
 
+# sha256(token) -> user_id, kept until the token's own exp
+_token_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_ENTRIES, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+
+# user_id -> detached snapshot of the users row
+_user_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_ENTRIES, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -81,6 +91,18 @@ def decode_access_token(token: str) -> dict:
         )
 
 
+def _snapshot_user(user: User) -> User:
+    """Copy a user's column values into a detached instance safe to share across sessions"""
+    snapshot = User(**{attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+def invalidate_user_cache(user_id: int) -> None:
+    """Drop a cached user row; call after any write to the users table"""
+    _user_cache.pop(user_id)
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -88,6 +110,9 @@ async def get_current_user(
     """
     Dependency to get the current authenticated user
     
+    Verified tokens and user rows are cached in-process, so a warm request
+    neither re-verifies the JWT nor queries the users table.
+    
     Args:
         credentials: HTTP Bearer credentials
         db: Database session
@@ -99,15 +124,28 @@ async def get_current_user(
         HTTPException: If authentication fails
     """
     token = credentials.credentials
-    payload = decode_access_token(token)
+    token_key = hashlib.sha256(token.encode()).hexdigest()
     
-    user_id: int = payload.get("user_id")
+    user_id: Optional[int] = _token_cache.get(token_key)
     if user_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        payload = decode_access_token(token)
+        
+        user_id = payload.get("user_id")
+        if user_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authentication credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        
+        expires_in = payload.get("exp", 0) - time.time()
+        if expires_in > 0:
+            _token_cache.set(token_key, user_id, ttl=expires_in)
+    
+    cached_user = _user_cache.get(user_id)
+    if cached_user is not None:
+        # Attach a copy to this request's session without touching the database
+        return db.merge(cached_user, load=False)
     
     user = db.query(User).filter(User.id == user_id).first()
     if user is None:
@@ -117,6 +155,7 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    _user_cache.set(user_id, _snapshot_user(user))
     return user
 
 
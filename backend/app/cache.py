@@ -0,0 +1,392 @@
+# backend/app/cache.py
+"""
+Read cache for API responses
+
+One Cache facade over interchangeable backends:
+    MemoryBackend  in-process LRU with per-entry TTL (also the stand-in for tests)
+    RedisBackend   shared by all workers, at REDIS_URL
+    NullBackend    caching disabled
+
+Keys are "<CACHE_NAMESPACE>:<area>:<key>". User-scoped entries also carry the
+user's generation ("u<id>.<generation>"), so invalidate_user() drops all of a
+user's entries at once by moving the generation. Commits that change a note
+(or a share link's active flag) invalidate its owner automatically; see the
+session hooks at the bottom. Those invalidations only reach other workers
+through a shared backend, so routes also pass get_or_set() a fresh() check
+against a cheap indexed key (a note's ETag fields, the corpus version, a
+share link's state) and never serve an entry the database has moved past.
+
+get_or_set() coalesces concurrent misses for the same key into one load
+(stampede protection). Hit / miss counters per area are available from
+stats(). Backend failures are counted and treated as misses, never surfaced
+to the request.
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from .config import get_settings
+from .utils import TTLCache
+from . import models
+
+settings = get_settings()
+
+
+# -----------------------------
+# Backends
+# -----------------------------
+class NullBackend:
+    """Caching disabled: every read misses"""
+    name = "none"
+
+    async def get(self, key: str) -> Optional[str]:
+        return None
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        pass
+
+    async def add(self, key: str, value: str, ttl: Optional[float] = None) -> str:
+        return value
+
+    def set_now(self, key: str, value: str) -> None:
+        pass
+
+
+class MemoryBackend:
+    """
+    In-process LRU with per-entry TTL
+
+    Per worker: invalidations do not reach other processes, so routes revalidate
+    hits with fresh(); Redis lets workers share entries (and warm each other up).
+    """
+    name = "memory"
+
+    def __init__(self, maxsize: int = 10000):
+        self._data = TTLCache(maxsize=maxsize, ttl=float("inf"))
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._data.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._data.set(key, value, ttl)
+
+    async def add(self, key: str, value: str, ttl: Optional[float] = None) -> str:
+        """Store value unless the key exists; return whichever value is stored"""
+        current = self._data.get(key)
+        if current is None:
+            self._data.set(key, value, ttl)
+            return value
+        return current
+
+    def set_now(self, key: str, value: str) -> None:
+        self._data.set(key, value)
+
+
+class RedisBackend:
+    """
+    Redis at REDIS_URL, shared by all workers
+
+    Reads and writes go through the asyncio client; set_now (invalidations
+    from commit hooks, which run in synchronous code) uses a blocking client.
+    Tests can pass fakes for both clients.
+    """
+    name = "redis"
+
+    def __init__(self, client, sync_client):
+        self._client = client
+        self._sync_client = sync_client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        import redis
+        import redis.asyncio
+
+        options = {"socket_connect_timeout": 1, "socket_timeout": 1}
+        return cls(redis.asyncio.Redis.from_url(url, **options), redis.Redis.from_url(url, **options))
+
+    def ping(self) -> None:
+        self._sync_client.ping()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        await self._client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def add(self, key: str, value: str, ttl: Optional[float] = None) -> bytes:
+        await self._client.set(key, value, nx=True, px=int(ttl * 1000) if ttl else None)
+        return await self._client.get(key) or value
+
+    def set_now(self, key: str, value: str) -> None:
+        self._sync_client.set(key, value)
+
+
+# -----------------------------
+# Cache facade
+# -----------------------------
+class Uncached:
+    """Wraps a get_or_set loader result that should be returned but not stored"""
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+_RETRY = object()  # handed to coalesced waiters when the loading request was cancelled
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _new_generation() -> str:
+    # Never reuses an earlier value, even after the generation key is evicted
+    return str(time.time_ns())
+
+
+class Cache:
+    """JSON values under namespaced, optionally user-scoped keys (see module docstring)"""
+
+    def __init__(self, backend, namespace: str, default_ttl: float):
+        self.backend = backend
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self._counters: Dict[str, Counter] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _count(self, area: str, outcome: str) -> None:
+        self._counters.setdefault(area, Counter())[outcome] += 1
+
+    def _generation_key(self, user_id: int) -> str:
+        return f"{self.namespace}:gen:u{user_id}"
+
+    async def generation(self, user_id: int) -> Optional[str]:
+        """Current generation of a user's entries, to pass to set(); None if the backend failed"""
+        try:
+            return await self._generation(user_id)
+        except Exception as e:
+            self._error("generation", e)
+            return None
+
+    async def _generation(self, user_id: int) -> str:
+        """Current generation of a user's entries (created on first use)"""
+        key = self._generation_key(user_id)
+        generation = await self.backend.get(key)
+        if generation is None:
+            generation = await self.backend.add(key, _new_generation())
+        return _text(generation)
+
+    async def _key(self, area: str, key: Any, user_id: Optional[int], generation: Optional[str] = None) -> str:
+        if user_id is None:
+            return f"{self.namespace}:{area}:{key}"
+        if generation is None:
+            generation = await self._generation(user_id)
+        return f"{self.namespace}:{area}:u{user_id}.{generation}:{key}"
+
+    async def get(self, area: str, key: Any, user_id: Optional[int] = None) -> Any:
+        """Cached value, or None on a miss"""
+        try:
+            raw = await self.backend.get(await self._key(area, key, user_id))
+        except Exception as e:
+            self._error(area, e)
+            return None
+        self._count(area, "hits" if raw is not None else "misses")
+        return None if raw is None else json.loads(raw)
+
+    async def set(
+        self,
+        area: str,
+        key: Any,
+        value: Any,
+        ttl: Optional[float] = None,
+        user_id: Optional[int] = None,
+        generation: Optional[str] = None
+    ) -> None:
+        """
+        Store a JSON-serializable value
+
+        Pass the generation read before loading the value, so an invalidation
+        that lands while it loads is not overwritten by the stale copy.
+        """
+        try:
+            full_key = await self._key(area, key, user_id, generation)
+            await self.backend.set(full_key, json.dumps(value), ttl or self.default_ttl)
+        except Exception as e:
+            self._error(area, e)
+
+    async def get_or_set(
+        self,
+        area: str,
+        key: Any,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        user_id: Optional[int] = None,
+        fresh: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """
+        Cached value, or the result of loader() stored for next time
+
+        Concurrent misses on the same key wait for the first caller's load
+        instead of all hitting the database. loader() may return Uncached(v)
+        to hand v back without storing it. A cached value for which fresh()
+        returns False is counted as stale and reloaded like a miss.
+        """
+        try:
+            full_key = await self._key(area, key, user_id)
+            raw = await self.backend.get(full_key)
+        except Exception as e:
+            self._error(area, e)
+            return self._unwrap(await loader())
+        if raw is not None:
+            value = json.loads(raw)
+            if fresh is None or fresh(value):
+                self._count(area, "hits")
+                return value
+            self._count(area, "stale")
+        self._count(area, "misses")
+
+        inflight = self._inflight.get(full_key)
+        if inflight is not None:
+            self._count(area, "coalesced")
+            value = await asyncio.shield(inflight)
+            return self._unwrap(await loader()) if value is _RETRY else value
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            result = await loader()
+        except asyncio.CancelledError:
+            future.set_result(_RETRY)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved: waiters re-raise it, none may be waiting
+            raise
+        finally:
+            self._inflight.pop(full_key, None)
+
+        value = self._unwrap(result)
+        future.set_result(value)
+        if not isinstance(result, Uncached):
+            try:
+                await self.backend.set(full_key, json.dumps(value), ttl or self.default_ttl)
+            except Exception as e:
+                self._error(area, e)
+        return value
+
+    @staticmethod
+    def _unwrap(result: Any) -> Any:
+        return result.value if isinstance(result, Uncached) else result
+
+    @property
+    def shared(self) -> bool:
+        """Whether entries (and claim()) are seen by every worker, not just this process"""
+        return self.backend.name == "redis"
+
+    async def claim(self, area: str, key: Any, ttl: float) -> bool:
+        """
+        Take a lock for ttl seconds: True for the one caller that set it, False
+        if someone holds it (or the backend failed). Cross-process only when shared.
+        """
+        token = _new_generation()
+        try:
+            holder = await self.backend.add(f"{self.namespace}:{area}:{key}", token, ttl)
+        except Exception as e:
+            self._error(area, e)
+            return False
+        return _text(holder) == token
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop every user-scoped entry of this user (synchronous; safe from commit hooks)"""
+        try:
+            self.backend.set_now(self._generation_key(user_id), _new_generation())
+        except Exception as e:
+            self._error("invalidate", e)
+
+    def _error(self, area: str, error: Exception) -> None:
+        self._count(area, "errors")
+        print(f"WARNING: cache {self.backend.name} error ({area}): {error}")
+
+    def stats(self) -> dict:
+        """Hit / miss counters per area, for sizing the cache"""
+        areas = {}
+        for area, counter in self._counters.items():
+            lookups = counter["hits"] + counter["misses"]
+            areas[area] = {**counter, "hit_ratio": round(counter["hits"] / lookups, 3) if lookups else None}
+        return {"backend": self.backend.name, "areas": areas}
+
+    def reset_stats(self) -> None:
+        self._counters.clear()
+
+
+def _create_backend():
+    choice = settings.CACHE_BACKEND.lower()
+    if choice == "none":
+        return NullBackend()
+    # Only connect when Redis is asked for: the REDIS_URL default is just localhost,
+    # and every process importing the app would block probing it
+    if choice == "redis" or (choice == "auto" and "REDIS_URL" in settings.model_fields_set):
+        try:
+            backend = RedisBackend.from_url(settings.REDIS_URL)
+            backend.ping()
+            return backend
+        except Exception as e:
+            print(f"WARNING: Redis cache unavailable ({e}), using the in-process cache")
+    return MemoryBackend(settings.CACHE_MAX_ENTRIES)
+
+
+cache = Cache(_create_backend(), settings.CACHE_NAMESPACE, settings.CACHE_DEFAULT_TTL_SECONDS)
+
+# LLM completions: week-long entries that must not push notes and lists out of
+# an in-process LRU, so they get one of their own unless Redis holds both
+llm_cache = Cache(
+    cache.backend if cache.shared else MemoryBackend(settings.LLM_CACHE_MAX_ENTRIES),
+    settings.CACHE_NAMESPACE,
+    settings.LLM_CACHE_TTL_SECONDS
+)
+
+
+def use_backend(backend, llm_backend=None) -> None:
+    """Swap the backends, e.g. MemoryBackend() or RedisBackend(fake, fake) in tests"""
+    cache.backend = backend
+    cache.reset_stats()
+    llm_cache.backend = llm_backend or (backend if cache.shared else MemoryBackend(settings.LLM_CACHE_MAX_ENTRIES))
+    llm_cache.reset_stats()
+
+
+# -----------------------------
+# Invalidation on commit
+# -----------------------------
+_PENDING_KEY = "cache_invalidate_users"
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_invalidations(session, flush_context, instances) -> None:
+    """Remember the owners of notes (and share links whose active flag) this flush changes"""
+    owners = session.info.setdefault(_PENDING_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, models.Note):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            owners.add(obj.user_id)
+        elif isinstance(obj, models.SharedLink):
+            # view_count bumps on every shared read must not invalidate the owner
+            if obj in session.dirty and not inspect(obj).attrs.is_active.history.has_changes():
+                continue
+            note = session.get(models.Note, obj.note_id)
+            if note is not None:
+                owners.add(note.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session) -> None:
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        if user_id is not None:
+            cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
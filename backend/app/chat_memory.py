@@ -0,0 +1,81 @@
+# backend/app/chat_memory.py
+"""
+Rolling-window chat memory
+
+A chat turn's prompt carries the session's running summary
+(ChatSession.summary) plus the messages after it verbatim, so its size stays
+bounded however long the session gets. Once a turn leaves
+CHAT_MEMORY_TURNS + CHAT_SUMMARY_BATCH_TURNS turns unsummarized, all but the
+last CHAT_MEMORY_TURNS are folded into the summary in the background: one AI
+call per batch of turns, not per turn, and none on the request path.
+
+A fold stores its summary only if summarized_until (the last folded message
+id) has not moved since it started, so concurrent folds of one session never
+fold a message twice. If folding fails (e.g. the AI provider is down), the
+oldest unsummarized messages drop out of the prompt until a later turn
+folds them.
+"""
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import get_settings
+from .database import AsyncSessionLocal
+from . import async_crud, ai_integration
+
+settings = get_settings()
+
+WINDOW_MESSAGES = settings.CHAT_MEMORY_TURNS * 2  # a turn is the user's message and the reply
+MAX_UNSUMMARIZED = WINDOW_MESSAGES + settings.CHAT_SUMMARY_BATCH_TURNS * 2
+FOLD_LIMIT = 100  # messages per summarization call
+
+_folding: Set[str] = set()  # sessions with a fold running in this process
+_tasks: Set[asyncio.Task] = set()
+
+
+async def load(db: AsyncSession, chat_id: str, user_id: int) -> Optional[Tuple[Optional[str], List[Dict[str, str]]]]:
+    """(summary, recent messages as role/content dicts) for the next turn, or None if the session isn't the user's"""
+    memory = await async_crud.get_chat_memory(db, chat_id, user_id, MAX_UNSUMMARIZED)
+    if memory is None:
+        return None
+    return memory["summary"], [{"role": m["role"], "content": m["content"]} for m in memory["messages"]]
+
+
+def schedule_fold(chat_id: str, user_id: int) -> None:
+    """After a turn: fold messages past the window into the summary, in the background, if a batch is due"""
+    if chat_id in _folding:
+        return
+    _folding.add(chat_id)
+    task = asyncio.create_task(_fold(chat_id, user_id))
+    _tasks.add(task)  # keep a reference until it finishes
+    task.add_done_callback(_tasks.discard)
+
+
+async def shutdown() -> None:
+    """Cancel folds still running; called from the app's lifespan on shutdown"""
+    for task in list(_tasks):
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+
+
+async def _fold(chat_id: str, user_id: int) -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            while True:
+                memory = await async_crud.get_chat_memory(db, chat_id, user_id, 1)
+                if memory is None or memory["unsummarized"] < MAX_UNSUMMARIZED:
+                    return
+                messages = await async_crud.get_messages_to_summarize(
+                    db, chat_id, memory["summarized_until"], WINDOW_MESSAGES, FOLD_LIMIT
+                )
+                await db.rollback()  # don't hold a transaction open across the AI call
+                if not messages:
+                    return
+                summary = await ai_integration.ai_summarize_chat(memory["summary"], messages)
+                # If another worker folded meanwhile, the loop re-reads and continues from its summary
+                await async_crud.update_chat_summary(
+                    db, chat_id, summary, memory["summarized_until"], messages[-1]["id"]
+                )
+    except Exception as e:
+        print(f"WARNING: summarizing chat {chat_id} failed: {e}")
+    finally:
+        _folding.discard(chat_id)
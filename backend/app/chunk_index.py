@@ -0,0 +1,201 @@
+# backend/app/chunk_index.py
+"""
+Per-user passage index for Ask My Notes
+
+Notes are split into sentence-aligned passages of about
+CHUNK_INDEX_PASSAGE_WORDS words. Passages are scored against the question with
+BM25 over hashed word buckets: a uint16 term-count matrix, one row per passage.
+The score is computed for all passages at once from the columns of the
+question's words.
+
+Private (meta_data.is_private) and archived notes are indexed but never
+returned. Freshness and memory work as in vector_index (CorpusIndex): built
+on first use, then only notes whose updated_at moved are re-split.
+"""
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from .config import get_settings
+from .context_budget import configured_model, count_tokens
+from .utils import to_plain_text
+from .vector_index import CorpusIndex
+
+settings = get_settings()
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Question words that would otherwise look rare (and so decisive) in notes
+STOPWORDS = frozenset("""
+a an and are as at be but by can could did do does for from had has have how i if in is it its me my
+of on or our please should so than that the their them then there these they this to was we were what
+when where which who why will with would you your
+""".split())
+
+K1 = 1.2
+B = 0.75
+
+
+def _terms(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if len(word) > 1 and word not in STOPWORDS]
+
+
+def split_passages(text: str, passage_words: int) -> List[str]:
+    """
+    Sentence-aligned passages of about passage_words words
+
+    A passage starts with the previous one's last sentence when that sentence
+    is short, so a fact split across the boundary is still found. Run-on text
+    without sentence ends is cut every passage_words words.
+    """
+    sentences = []
+    for sentence in _SENTENCE_END.split(to_plain_text(text)):
+        words = sentence.split()
+        for start in range(0, len(words), passage_words):
+            sentences.append(words[start:start + passage_words])
+
+    passages, current, previous = [], [], []
+    for words in sentences:
+        if current and len(current) + len(words) > passage_words:
+            passages.append(" ".join(current))
+            current = list(previous) if len(previous) <= passage_words // 4 else []
+        current += words
+        previous = words
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+class UserChunks:
+    """One user's passages: term-count rows, lengths and document frequencies per bucket"""
+
+    def __init__(self, dim: int, passage_words: int):
+        self.dim = dim
+        self.passage_words = passage_words
+        self.lock = threading.Lock()
+        self.corpus_version: Optional[int] = None
+        self.stamps: Dict[int, object] = {}
+        self.titles: Dict[int, str] = {}
+        self.hidden: Dict[int, bool] = {}  # archived or private: indexed, never returned
+        self._rows_of: Dict[int, List[int]] = {}  # note_id -> passage rows
+        self._note: List[Optional[int]] = []  # passage row -> note_id (None: free)
+        self._text: List[Optional[str]] = []
+        self._free: List[int] = []
+        self._counts = np.zeros((0, dim), dtype=np.uint16)
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._df = np.zeros(dim, dtype=np.int64)
+
+    def passage_count(self) -> int:
+        return len(self._note) - len(self._free)
+
+    def add_note(self, row) -> None:
+        """(Re-)split a note row loaded by CorpusIndex.refresh into passages"""
+        self._drop_passages(row.id)
+        self.titles[row.id] = row.title
+        self.hidden[row.id] = bool(row.is_archived) or bool((row.meta_data or {}).get("is_private"))
+        rows = []
+        for passage in split_passages(row.content, self.passage_words):
+            # The title is scored with every passage but not repeated in its text
+            counts = Counter(zlib.crc32(term.encode()) % self.dim for term in _terms(f"{row.title} {passage}"))
+            if not counts:
+                continue
+            index = self._free.pop() if self._free else self._grow()
+            buckets = np.fromiter(counts.keys(), dtype=np.int64)
+            self._counts[index, buckets] = np.minimum(np.fromiter(counts.values(), dtype=np.int64), 65535)
+            self._lengths[index] = sum(counts.values())
+            self._df[buckets] += 1
+            self._note[index] = row.id
+            self._text[index] = passage
+            rows.append(index)
+        self._rows_of[row.id] = rows
+
+    def remove(self, note_id: int) -> None:
+        self._drop_passages(note_id)
+        self._rows_of.pop(note_id, None)
+        self.stamps.pop(note_id, None)
+        self.titles.pop(note_id, None)
+        self.hidden.pop(note_id, None)
+
+    def _drop_passages(self, note_id: int) -> None:
+        for index in self._rows_of.get(note_id, ()):
+            self._df[np.nonzero(self._counts[index])[0]] -= 1
+            self._counts[index] = 0
+            self._lengths[index] = 0
+            self._note[index] = None
+            self._text[index] = None
+            self._free.append(index)
+        self._rows_of[note_id] = []
+
+    def _grow(self) -> int:
+        index = len(self._note)
+        if index == len(self._counts):
+            size = max(64, index * 2)
+            counts = np.zeros((size, self.dim), dtype=np.uint16)
+            counts[:index] = self._counts
+            lengths = np.zeros(size, dtype=np.float32)
+            lengths[:index] = self._lengths
+            self._counts, self._lengths = counts, lengths
+        self._note.append(None)
+        self._text.append(None)
+        return index
+
+    def top_passages(self, question: str, k: int, token_budget: int) -> List[dict]:
+        """Best BM25 passages from visible notes, best first, until k or the token budget is reached"""
+        live = self.passage_count()
+        buckets = np.unique([zlib.crc32(term.encode()) % self.dim for term in _terms(question)]).astype(np.int64)
+        if not live or not len(buckets):
+            return []
+
+        used = len(self._note)
+        df = self._df[buckets]
+        idf = np.log(1 + (live - df + 0.5) / (df + 0.5))
+        tf = self._counts[:used, buckets].astype(np.float32)
+        lengths = self._lengths[:used]
+        average = lengths.sum() / live
+        norm = K1 * (1 - B + B * lengths / average)
+        scores = (tf * (K1 + 1) / (tf + norm[:, None])) @ idf
+
+        results, spent, model = [], 0, configured_model()
+        for index in np.argsort(-scores):
+            score = float(scores[index])
+            if score <= 0 or len(results) == k:
+                break
+            note_id = self._note[index]
+            if note_id is None or self.hidden.get(note_id):
+                continue
+            cost = count_tokens(self._text[index], model)
+            if spent + cost > token_budget:
+                continue  # a shorter passage further down may still fit
+            spent += cost
+            results.append({"note_id": note_id, "title": self.titles[note_id], "text": self._text[index], "score": score})
+        return results
+
+
+class ChunkIndex(CorpusIndex):
+    """Passage index (UserChunks) per user"""
+
+    def __init__(self, dim: int, passage_words: int, max_users: int):
+        super().__init__(max_users)
+        self.dim = dim
+        self.passage_words = passage_words
+
+    def _create_user_index(self) -> UserChunks:
+        return UserChunks(self.dim, self.passage_words)
+
+    def search(self, db: Session, user_id: int, question: str, k: int, token_budget: int) -> dict:
+        """{"passages": top passages for the question, "notes_searched": notes indexed for the user}"""
+        index = self.refresh(db, user_id)
+        with index.lock:
+            visible = sum(1 for hidden in index.hidden.values() if not hidden)
+            return {"passages": index.top_passages(question, k, token_budget), "notes_searched": visible}
+
+
+chunk_index = ChunkIndex(settings.CHUNK_INDEX_DIM, settings.CHUNK_INDEX_PASSAGE_WORDS, settings.CHUNK_INDEX_MAX_USERS)
+
+
+def search(db: Session, user_id: int, question: str, k: int, token_budget: int) -> dict:
+    return chunk_index.search(db, user_id, question, k, token_budget)
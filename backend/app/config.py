@@ -19,6 +19,10 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Authenticated user / verified token caches (per process)
+    AUTH_CACHE_TTL_SECONDS: int = 300
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
     
     # OpenRouter Configuration
     OPENROUTER_API_KEY: Optional[str] = None
@@ -41,8 +45,70 @@ class Settings(BaseSettings):
     # CORS
     CORS_ORIGINS: str = "https://note-aipro-frontend.onrender.com,http://localhost:5173,http://localhost:5174"
 
+    # Activity log write-behind buffer
+    ACTIVITY_BATCH_SIZE: int = 200
+    ACTIVITY_FLUSH_INTERVAL_SECONDS: float = 2.0
+    ACTIVITY_BUFFER_MAX_PENDING: int = 50000
+
     # Redis (Optional)
     REDIS_URL: str = "redis://localhost:6379/0"
+
+    # Read cache: "memory" (in-process), "redis", "auto" (Redis when REDIS_URL is
+    # set and reachable, else in-process) or "none"
+    CACHE_BACKEND: str = "memory"
+    CACHE_NAMESPACE: str = "noteai"
+    CACHE_DEFAULT_TTL_SECONDS: int = 300
+    CACHE_MAX_ENTRIES: int = 10000  # in-process backend only
+    ANALYTICS_CACHE_TTL_SECONDS: int = 60  # activity counts arrive without invalidation
+
+    # Background auto-tagging / categorization of saved notes
+    AI_ENRICHMENT_WORKERS: int = 2
+    AI_ENRICHMENT_DEBOUNCE_SECONDS: float = 2.0  # autosaves within this window share one AI call
+    AI_ENRICHMENT_TIMEOUT_SECONDS: float = 30.0  # per note; past it the note is marked failed
+    # Content edits re-enrich only once the note's SimHash similarity to the
+    # last enriched content drops below this (1.0: re-enrich on any change)
+    AI_REENRICH_SIMILARITY_THRESHOLD: float = 0.85
+
+    # Local vector index for semantic search (see vector_index.py): "hashed-tfidf"
+    # or "module:factory" for a local embedder
+    VECTOR_EMBEDDER: str = "hashed-tfidf"
+    VECTOR_INDEX_DIM: int = 2048  # hashed-tfidf buckets; 8 KB per note in memory
+    VECTOR_INDEX_MAX_USERS: int = 200  # indexes kept in memory per worker
+    AI_SEARCH_EXPANSION_TIMEOUT_SECONDS: float = 3.0  # also bounds the related-notes re-ranker
+
+    # Ask My Notes passage index (see chunk_index.py)
+    CHUNK_INDEX_DIM: int = 4096  # hashed word buckets; 8 KB per passage in memory
+    CHUNK_INDEX_PASSAGE_WORDS: int = 120
+    CHUNK_INDEX_MAX_USERS: int = 100
+    ASK_NOTES_TOP_K: int = 8  # passages sent with a question
+    ASK_NOTES_CONTEXT_TOKENS: int = 3000  # ... and at most this many tokens of them
+
+    # Chat memory (see chat_memory.py): the last CHAT_MEMORY_TURNS turns are sent
+    # verbatim; older ones are folded into the session summary
+    # CHAT_SUMMARY_BATCH_TURNS at a time
+    CHAT_MEMORY_TURNS: int = 6
+    CHAT_SUMMARY_BATCH_TURNS: int = 4
+
+    # Daily brief (see daily_brief.py)
+    DAILY_BRIEF_CONCURRENCY: int = 3  # task extractions in flight per brief
+    DAILY_BRIEF_EXTRACTION_DEADLINE_SECONDS: float = 8.0  # then the brief uses the tasks stored so far
+    # Build briefs of recently active users in the background (one worker per day;
+    # needs the Redis cache, each build costs up to 6 AI calls)
+    DAILY_BRIEF_PRECOMPUTE: bool = False
+    DAILY_BRIEF_PRECOMPUTE_INTERVAL_SECONDS: float = 3600.0
+    DAILY_BRIEF_ACTIVE_DAYS: int = 7
+
+    # Prompt budgets (see context_budget.py). LLM_CONTEXT_WINDOW overrides the
+    # window looked up from the model name
+    LLM_CONTEXT_WINDOW: Optional[int] = None
+    LLM_MAX_INPUT_TOKENS: int = 32000  # cap per request, whatever the window
+    LLM_MAX_OUTPUT_TOKENS: int = 16000  # the model's completion limit; bounds rewrite/format input
+
+    # LLM completion cache (content-addressed): the read cache's Redis when it
+    # uses one, else its own in-process LRU so completions never evict notes
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    LLM_CACHE_MAX_ENTRIES: int = 1000  # in-process backend only
     
     # App
     DEBUG: bool = False
@@ -70,6 +136,19 @@ class Settings(BaseSettings):
             return self.DATABASE_URL.replace("postgres://", "postgresql://", 1)
         return self.DATABASE_URL
 
+    @property
+    def async_database_url(self) -> str:
+        """Same database as database_url_validated, but through an asyncio driver"""
+        url = self.database_url_validated
+        if url.startswith("postgresql+psycopg2://"):
+            url = url.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
+        elif url.startswith("postgresql://"):
+            url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
+        elif url.startswith("sqlite://"):
+            url = url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+        # asyncpg spells libpq's sslmode as ssl
+        return url.replace("sslmode=", "ssl=")
+
     class Config:
         env_file = [".env", "../.env", "../../.env"]
         case_sensitive = False
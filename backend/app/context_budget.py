@@ -0,0 +1,209 @@
+# backend/app/context_budget.py
+"""
+Token budgets for LLM prompts
+
+count_tokens() estimates tokens for the configured model. It uses tiktoken
+when it is installed and knows the model; otherwise it divides characters by
+a per-family ratio that leans towards overestimating.
+
+Each AI task has an input budget and an output budget (max_tokens) in
+TASK_BUDGETS. The input budget is further capped so that input plus output
+fits the model's context window (MODEL_CONTEXT_WINDOWS or
+LLM_CONTEXT_WINDOW) and LLM_MAX_INPUT_TOKENS. A ContextBudget is filled part
+by part in priority order: system prompt, history, context, user text. Each
+part takes what is left, minus whatever it reserves for the parts after it,
+and is cut (with a marker) when it does not fit.
+
+Transform tasks (rewrite, format) return the whole text reworked, so their
+input must never be cut: their budgets are sized from the context window,
+LLM_MAX_INPUT_TOKENS and LLM_MAX_OUTPUT_TOKENS instead of TASK_BUDGETS, and
+text that does not fit raises TextTooLong (see ContextBudget.require).
+"""
+import math
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from .config import get_settings
+
+settings = get_settings()
+
+# task: (input tokens, output tokens)
+TASK_BUDGETS: Dict[str, Tuple[int, int]] = {
+    "chat": (16000, 1000),
+    "chat_summary": (6000, 400),
+    "summarize": (24000, 1000),
+    "generate_note": (500, 2500),
+    "tags": (1000, 60),
+    "category": (1500, 10),
+    "enrich": (1500, 150),
+    "tasks": (4000, 1000),
+    "flashcards": (4000, 1500),
+    "related": (3000, 20),
+    "expand_query": (200, 60),
+    "suggestions": (400, 60),
+    "daily_brief": (1500, 600),
+    "ask_notes": (settings.ASK_NOTES_CONTEXT_TOKENS + 1000, 800),
+}
+
+# Transform tasks: output tokens per input token (the output is the input, reworked)
+TRANSFORM_OUTPUT_RATIOS: Dict[str, float] = {
+    "rewrite": 1.0,
+    "format": 1.25,  # headings, bullets and checkboxes add markup
+}
+
+# Context windows by model name prefix (after any "provider/" part), longest match wins
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4o": 128000,
+    "gpt-4.1": 1000000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1": 128000,
+    "o3": 200000,
+    "claude": 200000,
+    "gemini": 1000000,
+    "llama-3": 8192,
+    "llama-3.1": 128000,
+    "llama-3.2": 128000,
+    "llama-3.3": 128000,
+    "mistral": 32000,
+    "mixtral": 32000,
+    "deepseek": 64000,
+    "qwen": 32000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Characters per token when no tokenizer is available
+CHARS_PER_TOKEN: Dict[str, float] = {"gpt-": 4.0, "o1": 4.0, "o3": 4.0, "llama": 3.8, "gemini": 4.0}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators per chat message
+PROMPT_OVERHEAD_TOKENS = 150  # task instructions and formatting around the user's text
+TRUNCATION_MARKER = "... (truncated)"
+
+
+def _model_name(model: str) -> str:
+    return model.split("/")[-1].lower()
+
+
+def _by_prefix(table: Dict[str, float], model: str, default):
+    name = _model_name(model)
+    matches = [prefix for prefix in table if name.startswith(prefix)]
+    return table[max(matches, key=len)] if matches else default
+
+
+def configured_model() -> str:
+    """Model the AI client sends requests to"""
+    if settings.OPENAI_API_KEY:
+        return settings.OPENAI_MODEL or "gpt-4o-mini"
+    return settings.OPENROUTER_MODEL or "gpt-4o-mini"
+
+
+def context_window(model: str) -> int:
+    return settings.LLM_CONTEXT_WINDOW or _by_prefix(MODEL_CONTEXT_WINDOWS, model, DEFAULT_CONTEXT_WINDOW)
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(_model_name(model))
+    except Exception:
+        return None  # tiktoken not installed, or not an OpenAI model
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Estimated tokens of text for this model"""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / _by_prefix(CHARS_PER_TOKEN, model, DEFAULT_CHARS_PER_TOKEN))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str) -> str:
+    """text cut to about max_tokens (marker included), or unchanged if it fits"""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    keep = max(0, max_tokens - count_tokens(TRUNCATION_MARKER, model))
+    encoding = _encoding(model)
+    if encoding is not None:
+        head = encoding.decode(encoding.encode(text, disallowed_special=())[:keep])
+    else:
+        head = text[:int(keep * _by_prefix(CHARS_PER_TOKEN, model, DEFAULT_CHARS_PER_TOKEN))]
+    return head + TRUNCATION_MARKER
+
+
+class TextTooLong(ValueError):
+    """Text that a transform task would have to cut to fit the model"""
+
+    def __init__(self, tokens: int, limit: int):
+        self.tokens = tokens
+        self.limit = limit
+        super().__init__(
+            f"Text is too long for AI processing (about {tokens} tokens, at most {limit}). "
+            "Please try with a shorter section."
+        )
+
+
+def _transform_budget(task: str, model: str) -> Tuple[int, int]:
+    """(input, output) tokens for a transform task: the largest input whose output still fits"""
+    ratio = TRANSFORM_OUTPUT_RATIOS[task]
+    text_tokens = max(0, int(min(
+        settings.LLM_MAX_INPUT_TOKENS - PROMPT_OVERHEAD_TOKENS,
+        settings.LLM_MAX_OUTPUT_TOKENS / ratio,
+        (context_window(model) - PROMPT_OVERHEAD_TOKENS) / (1 + ratio)
+    )))
+    return text_tokens + PROMPT_OVERHEAD_TOKENS, math.ceil(text_tokens * ratio)
+
+
+class ContextBudget:
+    """Input tokens left for one request, filled in priority order"""
+
+    def __init__(self, task: str, model: str):
+        if task in TRANSFORM_OUTPUT_RATIOS:
+            input_tokens, self.max_tokens = _transform_budget(task, model)
+        else:
+            input_tokens, self.max_tokens = TASK_BUDGETS[task]
+        self.model = model
+        self.input_tokens = max(0, min(
+            input_tokens,
+            settings.LLM_MAX_INPUT_TOKENS,
+            context_window(model) - self.max_tokens
+        ) - PROMPT_OVERHEAD_TOKENS)
+        self.remaining = self.input_tokens
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def fit(self, text: Optional[str], reserve: int = 0) -> str:
+        """Take text, cut to what is left after reserving `reserve` tokens for later parts"""
+        if not text:
+            return text or ""
+        text = truncate_tokens(text, max(0, self.remaining - reserve), self.model)
+        self.remaining -= self.count(text)
+        return text
+
+    def require(self, text: Optional[str], reserve: int = 0) -> str:
+        """Take text whole, or raise TextTooLong when it does not fit (for tasks that must not cut it)"""
+        if not text:
+            return text or ""
+        tokens = self.count(text)
+        limit = max(0, self.remaining - reserve)
+        if tokens > limit:
+            raise TextTooLong(tokens, limit)
+        self.remaining -= tokens
+        return text
+
+    def fit_history(self, history: Optional[List[Dict[str, str]]], reserve: int = 0) -> List[Dict[str, str]]:
+        """The most recent messages that fit (whole messages only), oldest first"""
+        kept = []
+        available = self.remaining - reserve
+        for message in reversed(history or []):
+            cost = self.count(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+            if cost > available:
+                break
+            kept.append(message)
+            available -= cost
+        self.remaining = available + reserve
+        return kept[::-1]
@@ -3,13 +3,18 @@
 CRUD operations for database models
 """
 import re
-from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, and_
-from typing import List, Optional
+from sqlalchemy.orm import Session, undefer, selectinload
+from sqlalchemy.orm.attributes import flag_modified, set_committed_value
+from sqlalchemy import func, or_, and_, tuple_, select, delete, insert, update
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
-from . import models, schemas, auth
+from . import models, schemas, auth, activity_log, search_index, rollups, fingerprint, vector_index, chunk_index
+from .config import get_settings
+from .utils import decode_cursor, make_excerpt
 from fastapi import HTTPException, status
 
+settings = get_settings()
+
 
 # ==================== USER OPERATIONS ====================
 
@@ -98,6 +103,7 @@ def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate) -> m
     db_user.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(db_user)
+    auth.invalidate_user_cache(user_id)
     
     return db_user
 
@@ -127,18 +133,113 @@ def reset_password(db: Session, token: str, new_password: str) -> bool:
     user.reset_token_expires = None
     
     db.commit()
+    auth.invalidate_user_cache(user.id)
     return True
 
 
+# ==================== PAGINATION HELPERS ====================
+
+def _paginate(query, sort_column, id_column, skip: int, limit: int, cursor: Optional[str]):
+    """
+    Order by (sort_column DESC, id DESC) and page through the results
+    
+    With a cursor (see utils.encode_cursor) the page starts right after the
+    row it encodes, which an index on (..., sort_column, id) answers without
+    scanning the skipped rows. Without one, falls back to offset paging.
+    """
+    if cursor:
+        try:
+            sort_value, last_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(tuple_(sort_column, id_column) < (sort_value, last_id))
+        skip = 0
+    
+    return query.order_by(sort_column.desc(), id_column.desc()).offset(skip).limit(limit)
+
+
+# ==================== NOTE SUMMARY PROJECTION ====================
+
+# Characters of content read from the database to build an excerpt; leaves
+# room for HTML/Markdown markup that make_excerpt strips
+EXCERPT_SOURCE_CHARS = 1000
+
+
+def _summary_query(query):
+    """
+    Swap a Note query's entities for the NoteSummaryOut columns
+    
+    Only the head of content is selected and attachments are counted by a
+    correlated subquery, so a page of summaries is a single SQL query.
+    """
+    file_count = select(func.count(models.FileAttachment.id)).where(
+        models.FileAttachment.note_id == models.Note.id
+    ).correlate(models.Note).scalar_subquery()
+    
+    return query.with_entities(
+        models.Note.id,
+        models.Note.title,
+        func.substr(models.Note.content, 1, EXCERPT_SOURCE_CHARS).label("content_head"),
+        models.Note.tags,
+        models.Note.meta_data,
+        models.Note.is_favorite,
+        models.Note.is_archived,
+        models.Note.is_hidden,
+        models.Note.is_locked,
+        models.Note.is_deleted,
+        models.Note.version,
+        models.Note.enrichment_status,
+        models.Note.created_at,
+        models.Note.updated_at,
+        models.Note.deleted_at,
+        file_count.label("file_count"),
+    )
+
+
+def _summaries(rows) -> List[dict]:
+    """Turn _summary_query rows into NoteSummaryOut dicts"""
+    summaries = []
+    for row in rows:
+        summary = row._asdict()
+        summary["excerpt"] = make_excerpt(summary.pop("content_head"))
+        summaries.append(summary)
+    return summaries
+
+
 # ==================== NOTE OPERATIONS ====================
 
-def get_notes(db: Session, user_id: int, skip: int = 0, limit: int = 100, archived: bool = False) -> List[models.Note]:
-    """Get all notes for a user (default: non-archived, non-deleted)"""
-    return db.query(models.Note).filter(
+def get_notes(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    archived: bool = False,
+    cursor: Optional[str] = None,
+    summary: bool = False
+) -> List[models.Note]:
+    """Get all notes for a user (default: non-archived, non-deleted); summary=True returns NoteSummaryOut dicts"""
+    query = db.query(models.Note).filter(
         models.Note.user_id == user_id,
         models.Note.is_archived == archived,
         models.Note.is_deleted == False  # Exclude deleted notes
-    ).order_by(models.Note.updated_at.desc()).offset(skip).limit(limit).all()
+    )
+    if summary:
+        return _summaries(_paginate(_summary_query(query), models.Note.updated_at, models.Note.id, skip, limit, cursor))
+    return _paginate(query, models.Note.updated_at, models.Note.id, skip, limit, cursor).all()
+
+
+def get_note_etag_key(db: Session, note_id: int, user_id: int) -> Optional[tuple]:
+    """(version, updated_at, enrichment_status, enriched_version) of a note without loading it, for conditional GETs; None if not found"""
+    row = db.query(
+        models.Note.version,
+        models.Note.updated_at,
+        models.Note.enrichment_status,
+        models.Note.enriched_version
+    ).filter(
+        models.Note.id == note_id,
+        models.Note.user_id == user_id
+    ).first()
+    return tuple(row) if row else None
 
 
 def get_note_by_id(db: Session, note_id: int, user_id: int) -> Optional[models.Note]:
@@ -150,7 +251,7 @@ def get_note_by_id(db: Session, note_id: int, user_id: int) -> Optional[models.N
 
 
 def create_note(db: Session, note: schemas.NoteCreate, user_id: int) -> models.Note:
-    """Create a new note"""
+    """Create a new note together with its initial version, in one transaction"""
     db_note = models.Note(
         title=note.title,
         content=note.content,
@@ -158,14 +259,21 @@ def create_note(db: Session, note: schemas.NoteCreate, user_id: int) -> models.N
         meta_data=note.meta_data,
         is_favorite=note.is_favorite,
         user_id=user_id,
-        version=1
+        version=1,
+        enrichment_status="pending" if note.content else None,  # picked up by enrichment.py
+        tasks_status="pending" if note.content else None,  # picked up by task_index.py
+        files=[]  # a brand-new note has no attachments; saves a load when serialized
     )
+    stamp_content_fingerprint(db_note)
     db.add(db_note)
-    db.commit()
-    db.refresh(db_note)
+    search_index.sync_note(db, db_note)
+    db.flush()  # assigns db_note.id for the version row
+    sync_note_tags(db, db_note)
+    rollups.bump_user_stats(db, user_id, note_count=1)
     
     # Create initial version
     create_note_version(db, db_note)
+    db.commit()
     
     # Log activity
     create_activity(db, user_id=user_id, activity_type="note_created", 
@@ -175,7 +283,7 @@ def create_note(db: Session, note: schemas.NoteCreate, user_id: int) -> models.N
 
 
 def update_note(db: Session, note_id: int, note_update: schemas.NoteUpdate, user_id: int) -> models.Note:
-    """Update an existing note"""
+    """Update an existing note, snapshotting the previous version in the same transaction"""
     db_note = get_note_by_id(db, note_id, user_id)
     if not db_note:
         raise HTTPException(status_code=404, detail="Note not found")
@@ -185,14 +293,28 @@ def update_note(db: Session, note_id: int, note_update: schemas.NoteUpdate, user
     
     # Update fields
     update_data = note_update.model_dump(exclude_unset=True)
+    previous_hash = db_note.content_hash
+    if "is_deleted" in update_data and update_data["is_deleted"] != db_note.is_deleted:
+        # Keep deleted_at in step so the note sorts correctly in the trash
+        db_note.deleted_at = datetime.utcnow() if update_data["is_deleted"] else None
     for field, value in update_data.items():
         setattr(db_note, field, value)
     
     db_note.version += 1
     db_note.updated_at = datetime.utcnow()
+    if "content" in update_data:
+        stamp_content_fingerprint(db_note)
+        if needs_enrichment(db_note, previous_hash):
+            db_note.enrichment_status = "pending"  # re-tag / re-categorize in the background
+        if db_note.content_hash != previous_hash:
+            # Re-extract tasks, unless the text is back to what they were extracted from
+            db_note.tasks_status = "done" if db_note.content_hash == db_note.tasks_content_hash else "pending"
+    if update_data.keys() & {"title", "content", "is_deleted"}:
+        search_index.sync_note(db, db_note)
+    if update_data.keys() & {"tags", "is_deleted"}:
+        sync_note_tags(db, db_note)
     
     db.commit()
-    db.refresh(db_note)
     
     # Log activity
     create_activity(db, user_id=user_id, activity_type="note_updated",
@@ -201,13 +323,32 @@ def update_note(db: Session, note_id: int, note_update: schemas.NoteUpdate, user
     return db_note
 
 
+def _removed_note_stats(db: Session, note_ids: List[int]) -> dict:
+    """user_stats deltas for permanently deleting note_ids (their files and active links go with them)"""
+    if not note_ids:
+        return {}
+    file_count = db.query(func.count(models.FileAttachment.id)).filter(
+        models.FileAttachment.note_id.in_(note_ids)
+    ).scalar()
+    share_count = db.query(func.count(models.SharedLink.id)).filter(
+        models.SharedLink.note_id.in_(note_ids),
+        models.SharedLink.is_active == True
+    ).scalar()
+    return {"note_count": -len(note_ids), "file_count": -file_count, "active_share_count": -share_count}
+
+
 def delete_note(db: Session, note_id: int, user_id: int) -> bool:
     """Delete a note"""
     db_note = get_note_by_id(db, note_id, user_id)
     if not db_note:
         return False
     
+    stat_deltas = _removed_note_stats(db, [note_id])
     db.delete(db_note)
+    search_index.remove_notes(db, [note_id])
+    remove_note_tags(db, [note_id])
+    remove_note_tasks(db, [note_id])
+    rollups.bump_user_stats(db, user_id, **stat_deltas)
     db.commit()
     
     # Log activity
@@ -243,6 +384,304 @@ def unarchive_note(db: Session, note_id: int, user_id: int) -> Optional[models.N
     return db_note
 
 
+# ==================== TAG OPERATIONS ====================
+
+def normalize_tags(tags: Optional[List[str]]) -> List[str]:
+    """Strip, drop empty and de-duplicate tags, keeping their order"""
+    seen = []
+    for tag in tags or []:
+        tag = str(tag).strip()[:255]
+        if tag and tag not in seen:
+            seen.append(tag)
+    return seen
+
+
+def sync_note_tags(db: Session, note: models.Note) -> None:
+    """Rewrite a note's note_tags rows from note.tags (no rows while it is in trash); caller commits"""
+    db.execute(delete(models.NoteTag).where(models.NoteTag.note_id == note.id))
+    tags = [] if note.is_deleted else normalize_tags(note.tags)
+    if tags:
+        db.execute(insert(models.NoteTag), [
+            {"note_id": note.id, "tag": tag, "user_id": note.user_id} for tag in tags
+        ])
+
+
+def remove_note_tags(db: Session, note_ids: List[int]) -> None:
+    """Drop note_tags rows of permanently deleted notes (SQLite doesn't enforce the cascade)"""
+    if note_ids:
+        db.execute(delete(models.NoteTag).where(models.NoteTag.note_id.in_(note_ids)))
+
+
+def tag_filter(user_id: int, tags: List[str], match_all: bool = False):
+    """
+    Select of note ids carrying any (or, with match_all, every) one of tags;
+    answered from ix_note_tags_user_tag alone
+    """
+    tags = normalize_tags(tags)
+    stmt = select(models.NoteTag.note_id).where(
+        models.NoteTag.user_id == user_id,
+        models.NoteTag.tag.in_(tags)
+    )
+    if match_all:
+        stmt = stmt.group_by(models.NoteTag.note_id).having(func.count(models.NoteTag.tag) == len(tags))
+    return stmt
+
+
+def get_tag_counts(db: Session, user_id: int) -> List[dict]:
+    """Number of live (non-trashed) notes per tag, most used first"""
+    count = func.count(models.NoteTag.note_id)
+    rows = db.query(models.NoteTag.tag, count.label("count")).filter(
+        models.NoteTag.user_id == user_id
+    ).group_by(models.NoteTag.tag).order_by(count.desc(), models.NoteTag.tag).all()
+    return [{"tag": row.tag, "count": row.count} for row in rows]
+
+
+def backfill_note_tags(db: Session, batch_size: int = 500) -> int:
+    """Fill note_tags for live notes that have tags but no rows yet (tables created before note_tags)"""
+    written = 0
+    last_id = 0
+    has_rows = select(models.NoteTag.note_id).where(models.NoteTag.note_id == models.Note.id).exists()
+    while True:
+        notes = db.query(models.Note.id, models.Note.user_id, models.Note.tags).filter(
+            models.Note.id > last_id,
+            models.Note.is_deleted == False,
+            ~has_rows
+        ).order_by(models.Note.id).limit(batch_size).all()
+        if not notes:
+            break
+        rows = [
+            {"note_id": note.id, "tag": tag, "user_id": note.user_id}
+            for note in notes
+            for tag in normalize_tags(note.tags)
+        ]
+        if rows:
+            db.execute(insert(models.NoteTag), rows)
+            db.commit()
+            written += len(rows)
+        last_id = notes[-1].id
+    return written
+
+
+# ==================== AI ENRICHMENT ====================
+
+def stamp_content_fingerprint(note: models.Note) -> None:
+    """Recompute a note's content_hash / content_simhash from its content"""
+    note.content_hash = fingerprint.content_hash(note.content)
+    note.content_simhash = fingerprint.simhash(note.content)
+
+
+def needs_enrichment(note: models.Note, previous_hash: Optional[str]) -> bool:
+    """
+    Whether saved content should be re-tagged / re-categorized
+    
+    Not when the text is unchanged (exact hash), nor while it is still within
+    AI_REENRICH_SIMILARITY_THRESHOLD of the last enriched content (typo fixes,
+    autosaves of a few words). Failed or never-enriched notes always qualify.
+    """
+    if not note.content or note.content_hash == previous_hash:
+        return False
+    if note.enrichment_status != "done":
+        return True
+    similarity = fingerprint.similarity(note.content_simhash, note.enriched_simhash)
+    return similarity < settings.AI_REENRICH_SIMILARITY_THRESHOLD
+
+
+def get_enrichment_source(db: Session, note_id: int):
+    """(user_id, title, content, tags, meta_data, version, is_deleted) of a note for the enrichment worker"""
+    return db.query(
+        models.Note.user_id,
+        models.Note.title,
+        models.Note.content,
+        models.Note.tags,
+        models.Note.meta_data,
+        models.Note.version,
+        models.Note.is_deleted
+    ).filter(models.Note.id == note_id).first()
+
+
+def apply_note_enrichment(db: Session, note_id: int, version: int, enrichment: Optional[dict]) -> Optional[models.Note]:
+    """
+    Store tags / category computed from `version` of a note (enrichment=None: the AI call failed)
+    
+    The row is locked and left untouched (returns None) when the note was
+    edited meanwhile; the job for the newer version will write instead.
+    updated_at is left alone: the user did not edit the note (the ETag
+    tracks enrichment through enrichment_status / enriched_version).
+    """
+    note = db.query(models.Note).filter(models.Note.id == note_id).with_for_update().first()
+    if not note or note.version != version:
+        db.rollback()
+        return None
+    
+    if enrichment is None:
+        note.enrichment_status = "failed"
+    else:
+        if "tags" in enrichment:
+            note.tags = enrichment["tags"]
+            sync_note_tags(db, note)
+        if "category" in enrichment:
+            note.meta_data = {**(note.meta_data or {}), "category": enrichment["category"]}
+        note.enrichment_status = "done"
+        note.enriched_version = version
+        note.enriched_simhash = note.content_simhash or fingerprint.simhash(note.content)
+    # Write updated_at back unchanged so its onupdate does not fire
+    flag_modified(note, "updated_at")
+    db.commit()
+    return note
+
+
+def get_pending_enrichments(db: Session, limit: int = 1000) -> List[Tuple[int, int]]:
+    """(note_id, version) of notes still waiting for enrichment, e.g. queued before a restart"""
+    rows = db.query(models.Note.id, models.Note.version).filter(
+        models.Note.enrichment_status == "pending",
+        models.Note.is_deleted == False
+    ).order_by(models.Note.updated_at.desc()).limit(limit).all()
+    return [(row.id, row.version) for row in rows]
+
+
+# ==================== TASK INDEX ====================
+
+def get_task_source(db: Session, note_id: int):
+    """(user_id, content, content_hash, version, updated_at, is_deleted, tasks_status, tasks_content_hash) of a note"""
+    return db.query(
+        models.Note.user_id,
+        models.Note.content,
+        models.Note.content_hash,
+        models.Note.version,
+        models.Note.updated_at,
+        models.Note.is_deleted,
+        models.Note.tasks_status,
+        models.Note.tasks_content_hash
+    ).filter(models.Note.id == note_id).first()
+
+
+def store_note_tasks(db: Session, note_id: int, version: int, tasks: Optional[List[dict]]) -> bool:
+    """
+    Replace a note's note_tasks rows with tasks extracted from `version` (tasks=None: extraction failed)
+    
+    Nothing is written (returns False) when the note was edited meanwhile.
+    updated_at is left alone: the note itself did not change.
+    """
+    note = db.execute(
+        select(models.Note.user_id, models.Note.version, models.Note.content_hash)
+        .where(models.Note.id == note_id).with_for_update()
+    ).first()
+    if not note or note.version != version:
+        db.rollback()
+        return False
+    
+    values = {"tasks_status": "failed", "updated_at": models.Note.updated_at}
+    if tasks is not None:
+        db.execute(delete(models.NoteTask).where(models.NoteTask.note_id == note_id))
+        if tasks:
+            db.execute(insert(models.NoteTask), [
+                {**task, "note_id": note_id, "user_id": note.user_id, "position": position, "note_version": version}
+                for position, task in enumerate(tasks)
+            ])
+        values.update(tasks_status="done", tasks_content_hash=note.content_hash)
+    db.execute(update(models.Note).where(models.Note.id == note_id).values(**values))
+    db.commit()
+    return True
+
+
+def request_task_extraction(db: Session, note_id: int) -> None:
+    """Mark a note's tasks pending (e.g. never extracted, or the last attempt failed)"""
+    db.execute(
+        update(models.Note).where(models.Note.id == note_id)
+        .values(tasks_status="pending", updated_at=models.Note.updated_at)
+    )
+    db.commit()
+
+
+def get_note_tasks(db: Session, note_id: int) -> List[models.NoteTask]:
+    """A note's stored tasks, in the order they appear in it"""
+    return db.query(models.NoteTask).filter(
+        models.NoteTask.note_id == note_id
+    ).order_by(models.NoteTask.position).all()
+
+
+def get_user_tasks(
+    db: Session,
+    user_id: int,
+    due_within_days: Optional[int] = None,
+    priority: Optional[str] = None,
+    order: str = "due",
+    limit: int = 50
+) -> List[dict]:
+    """
+    Tasks across a user's notes (not trashed or archived), as NoteTaskOut dicts
+    
+    due_within_days keeps tasks due by then (overdue included); order "due"
+    sorts by due date, then priority, undated last, and "priority" the other
+    way round.
+    """
+    query = db.query(models.NoteTask, models.Note.title).join(
+        models.Note, models.Note.id == models.NoteTask.note_id
+    ).filter(
+        models.NoteTask.user_id == user_id,
+        models.Note.is_deleted == False,
+        models.Note.is_archived == False
+    )
+    if due_within_days is not None:
+        horizon = datetime.combine(datetime.utcnow().date() + timedelta(days=due_within_days), datetime.max.time())
+        query = query.filter(models.NoteTask.due_at <= horizon)
+    if priority:
+        query = query.filter(models.NoteTask.priority == priority)
+    
+    undated_last = models.NoteTask.due_at.is_(None)
+    if order == "priority":
+        ordering = (models.NoteTask.priority_rank, undated_last, models.NoteTask.due_at)
+    else:
+        ordering = (undated_last, models.NoteTask.due_at, models.NoteTask.priority_rank)
+    rows = query.order_by(*ordering, models.NoteTask.id).limit(limit).all()
+    return [
+        {**schemas.NoteTaskOut.model_validate(task).model_dump(), "note_title": title}
+        for task, title in rows
+    ]
+
+
+def get_pending_task_extractions(db: Session, limit: int = 1000) -> List[Tuple[int, int]]:
+    """(note_id, version) of notes whose tasks are waiting to be extracted"""
+    rows = db.query(models.Note.id, models.Note.version).filter(
+        models.Note.tasks_status == "pending",
+        models.Note.is_deleted == False
+    ).order_by(models.Note.updated_at.desc()).limit(limit).all()
+    return [(row.id, row.version) for row in rows]
+
+
+def remove_note_tasks(db: Session, note_ids: List[int]) -> None:
+    """Drop note_tasks rows of permanently deleted notes (SQLite doesn't enforce the cascade)"""
+    if note_ids:
+        db.execute(delete(models.NoteTask).where(models.NoteTask.note_id.in_(note_ids)))
+
+
+# ==================== DAILY BRIEF ====================
+
+def get_brief_notes(db: Session, user_id: int, since: datetime, limit: int = 10):
+    """Notes edited since `since` (not archived or trashed), newest first, with their task index state"""
+    return db.query(
+        models.Note.id,
+        models.Note.title,
+        models.Note.version,
+        models.Note.content_hash,
+        models.Note.tasks_status,
+        models.Note.tasks_content_hash
+    ).filter(
+        models.Note.user_id == user_id,
+        models.Note.updated_at >= since,
+        models.Note.is_archived == False,
+        models.Note.is_deleted == False
+    ).order_by(models.Note.updated_at.desc()).limit(limit).all()
+
+
+def get_recently_active_users(db: Session, since: datetime, limit: int = 500) -> List[int]:
+    """Ids of users with any activity since `since`"""
+    rows = db.query(models.UserActivity.user_id).filter(
+        models.UserActivity.created_at >= since
+    ).distinct().limit(limit).all()
+    return [row.user_id for row in rows]
+
+
 # ==================== TRASH OPERATIONS ====================
 
 def move_to_trash(db: Session, note_id: int, user_id: int) -> Optional[models.Note]:
@@ -254,8 +693,9 @@ def move_to_trash(db: Session, note_id: int, user_id: int) -> Optional[models.No
     db_note.is_deleted = True
     db_note.deleted_at = datetime.utcnow()
     db_note.updated_at = datetime.utcnow()
+    search_index.sync_note(db, db_note)
+    sync_note_tags(db, db_note)
     db.commit()
-    db.refresh(db_note)
     
     # Log activity
     create_activity(db, user_id=user_id, activity_type="note_trashed",
@@ -278,8 +718,9 @@ def restore_from_trash(db: Session, note_id: int, user_id: int) -> Optional[mode
     db_note.is_deleted = False
     db_note.deleted_at = None
     db_note.updated_at = datetime.utcnow()
+    search_index.sync_note(db, db_note)
+    sync_note_tags(db, db_note)
     db.commit()
-    db.refresh(db_note)
     
     # Log activity
     create_activity(db, user_id=user_id, activity_type="note_restored",
@@ -288,12 +729,46 @@ def restore_from_trash(db: Session, note_id: int, user_id: int) -> Optional[mode
     return db_note
 
 
-def get_trash_notes(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Note]:
-    """Get all deleted notes (trash) for a user"""
-    return db.query(models.Note).filter(
+def get_trash_notes(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    summary: bool = False
+) -> List[models.Note]:
+    """Get all deleted notes (trash) for a user; summary=True returns NoteSummaryOut dicts"""
+    query = db.query(models.Note).filter(
         models.Note.user_id == user_id,
         models.Note.is_deleted == True
-    ).order_by(models.Note.deleted_at.desc()).offset(skip).limit(limit).all()
+    )
+    if summary:
+        return _summaries(_paginate(_summary_query(query), models.Note.deleted_at, models.Note.id, skip, limit, cursor))
+    return _paginate(query, models.Note.deleted_at, models.Note.id, skip, limit, cursor).all()
+
+
+def backfill_trash_deleted_at(db: Session) -> int:
+    """
+    Give trashed notes without deleted_at (trashed before it was always set) their
+    updated_at, so the trash's keyset cursor never meets a NULL; returns rows fixed
+    """
+    missing = (models.Note.is_deleted == True, models.Note.deleted_at.is_(None))
+    user_ids = db.execute(select(models.Note.user_id).where(*missing).distinct()).scalars().all()
+    if not user_ids:
+        return 0
+    result = db.execute(
+        update(models.Note)
+        .where(*missing)
+        .values(
+            deleted_at=func.coalesce(models.Note.updated_at, models.Note.created_at, datetime.utcnow()),
+            updated_at=models.Note.updated_at
+        )
+    )
+    # The trash pages changed: move their list ETags on
+    for user_id in user_ids:
+        rollups.bump_user_stats(db, user_id, corpus_version=1)
+    db.commit()
+    return result.rowcount
 
 
 def permanent_delete_note(db: Session, note_id: int, user_id: int) -> bool:
@@ -308,7 +783,12 @@ def permanent_delete_note(db: Session, note_id: int, user_id: int) -> bool:
         return False
     
     note_title = db_note.title
+    stat_deltas = _removed_note_stats(db, [note_id])
     db.delete(db_note)
+    search_index.remove_notes(db, [note_id])
+    remove_note_tags(db, [note_id])
+    remove_note_tasks(db, [note_id])
+    rollups.bump_user_stats(db, user_id, **stat_deltas)
     db.commit()
     
     # Log activity
@@ -326,9 +806,15 @@ def empty_trash(db: Session, user_id: int) -> int:
     ).all()
     
     count = len(deleted_notes)
+    note_ids = [note.id for note in deleted_notes]
+    stat_deltas = _removed_note_stats(db, note_ids)
     
     for note in deleted_notes:
         db.delete(note)
+    search_index.remove_notes(db, note_ids)
+    remove_note_tags(db, note_ids)
+    remove_note_tasks(db, note_ids)
+    rollups.bump_user_stats(db, user_id, **stat_deltas)
     
     db.commit()
     
@@ -339,15 +825,55 @@ def empty_trash(db: Session, user_id: int) -> int:
     return count
 
 
-def search_notes(db: Session, user_id: int, search_params: schemas.NoteSearch) -> List[models.Note]:
-    """Search and filter notes"""
+def semantic_search(db: Session, user_id: int, query: str, limit: int = 20) -> List[dict]:
+    """
+    Notes closest to the query in the local vector index, over the whole corpus
+    
+    Returns NoteSummaryOut dicts with a `score` (cosine similarity), best first.
+    """
+    return _scored_summaries(db, user_id, vector_index.search(db, user_id, query, k=limit))
+
+
+def get_related_notes(db: Session, note_id: int, user_id: int, limit: int = 5) -> List[dict]:
+    """The user's notes most similar to this one (summary dicts with a `score`), from the local vector index"""
+    return _scored_summaries(db, user_id, vector_index.related(db, user_id, note_id, k=limit))
+
+
+def find_passages(db: Session, user_id: int, question: str, k: int, token_budget: int) -> dict:
+    """Best-matching passages across the user's notes for a question (see chunk_index), within token_budget"""
+    return chunk_index.search(db, user_id, question, k, token_budget)
+
+
+def _scored_summaries(db: Session, user_id: int, ranked: List[Tuple[int, float]]) -> List[dict]:
+    """NoteSummaryOut dicts for vector_index (note_id, score) results, in the same order"""
+    if not ranked:
+        return []
+    rows = _summary_query(db.query(models.Note).filter(
+        models.Note.user_id == user_id,
+        models.Note.id.in_([note_id for note_id, _ in ranked])
+    )).all()
+    by_id = {summary["id"]: summary for summary in _summaries(rows)}
+    return [{**by_id[note_id], "score": score} for note_id, score in ranked if note_id in by_id]
+
+
+def search_notes(db: Session, user_id: int, search_params: schemas.NoteSearch, summary: bool = False) -> List[models.Note]:
+    """
+    Search and filter notes; summary=True returns NoteSummaryOut dicts
+    
+    A text query goes through the full-text index (see search_index): results
+    are ordered by relevance and carry `rank` and a highlighted `snippet`.
+    """
     query = db.query(models.Note).filter(
         models.Note.user_id == user_id,
         models.Note.is_deleted == False
     )
     
     # Text search
-    if search_params.query:
+    ranked = search_index.match(user_id, search_params.query) if search_params.query else None
+    if ranked is not None:
+        query = query.join(ranked, ranked.c.note_id == models.Note.id)
+    elif search_params.query:
+        # No full-text index on this database
         search_term = f"%{search_params.query}%"
         query = query.filter(
             or_(
@@ -356,9 +882,11 @@ def search_notes(db: Session, user_id: int, search_params: schemas.NoteSearch) -
             )
         )
     
-    # Filter by tags
+    # Filter by tags (any-of / all-of, via note_tags)
     if search_params.tags:
-        query = query.filter(models.Note.tags.overlap(search_params.tags))
+        query = query.filter(models.Note.id.in_(
+            tag_filter(user_id, search_params.tags, match_all=search_params.tag_mode == "all")
+        ))
     
     # Filter by favorite
     if search_params.is_favorite is not None:
@@ -375,16 +903,39 @@ def search_notes(db: Session, user_id: int, search_params: schemas.NoteSearch) -
         query = query.filter(models.Note.created_at <= search_params.date_to)
     
     # Order and paginate
-    query = query.order_by(models.Note.updated_at.desc())
+    if summary:
+        query = _summary_query(query)
+    if ranked is not None:
+        query = query.add_columns(ranked.c.rank).order_by(ranked.c.rank.desc(), models.Note.updated_at.desc())
+    else:
+        query = query.order_by(models.Note.updated_at.desc())
     query = query.offset(search_params.offset).limit(search_params.limit)
     
-    return query.all()
+    if ranked is None:
+        return _summaries(query) if summary else query.all()
+    
+    # Highlight only the page being returned
+    rows = query.all()
+    if summary:
+        results = _summaries(rows)
+        snippets = search_index.snippets(db, search_params.query, [r["id"] for r in results])
+        for result in results:
+            result["snippet"] = snippets.get(result["id"])
+        return results
+    
+    snippets = search_index.snippets(db, search_params.query, [note.id for note, _ in rows])
+    notes = []
+    for note, rank in rows:
+        note.rank = rank
+        note.snippet = snippets.get(note.id)
+        notes.append(note)
+    return notes
 
 
 # ==================== NOTE VERSION OPERATIONS ====================
 
 def create_note_version(db: Session, note: models.Note) -> models.NoteVersion:
-    """Create a version snapshot of a note"""
+    """Stage a version snapshot of a note; committed with the caller's transaction"""
     version = models.NoteVersion(
         version_number=note.version,
         title=note.title,
@@ -394,7 +945,6 @@ def create_note_version(db: Session, note: models.Note) -> models.NoteVersion:
         note_id=note.id
     )
     db.add(version)
-    db.commit()
     return version
 
 
@@ -442,6 +992,8 @@ def create_file_attachment(
     )
     
     db.add(file_attachment)
+    note.updated_at = datetime.utcnow()  # attachments are part of the note (ETag, list order)
+    rollups.bump_user_stats(db, user_id, file_count=1)
     db.commit()
     db.refresh(file_attachment)
     
@@ -452,11 +1004,27 @@ def create_file_attachment(
     return file_attachment
 
 
-def get_file_attachment(db: Session, file_id: int, user_id: int) -> Optional[models.FileAttachment]:
-    """Get a file attachment with ownership verification"""
-    file_attachment = db.query(models.FileAttachment).filter(
+def get_file_attachment(
+    db: Session,
+    file_id: int,
+    user_id: int,
+    with_data: bool = False,
+    with_thumbnail: bool = False
+) -> Optional[models.FileAttachment]:
+    """
+    Get a file attachment with ownership verification
+    
+    Only metadata is loaded unless with_data / with_thumbnail ask for the
+    file_data / thumbnail_data bytes.
+    """
+    query = db.query(models.FileAttachment).filter(
         models.FileAttachment.id == file_id
-    ).first()
+    )
+    if with_data:
+        query = query.options(undefer(models.FileAttachment.file_data))
+    if with_thumbnail:
+        query = query.options(undefer(models.FileAttachment.thumbnail_data))
+    file_attachment = query.first()
     
     if not file_attachment:
         return None
@@ -476,6 +1044,8 @@ def delete_file_attachment(db: Session, file_id: int, user_id: int) -> bool:
         return False
     
     db.delete(file_attachment)
+    db.get(models.Note, file_attachment.note_id).updated_at = datetime.utcnow()
+    rollups.bump_user_stats(db, user_id, file_count=-1)
     db.commit()
     
     return True
@@ -505,6 +1075,7 @@ def create_shared_link(
     )
     
     db.add(shared_link)
+    rollups.bump_user_stats(db, user_id, active_share_count=1)
     db.commit()
     db.refresh(shared_link)
     
@@ -517,6 +1088,16 @@ def create_shared_link(
 
 def get_shared_note(db: Session, token: str, password: Optional[str] = None) -> Optional[models.Note]:
     """Access a shared note using token"""
+    result = get_shared_note_with_link(db, token, password)
+    return result[1] if result else None
+
+
+def get_shared_note_with_link(
+    db: Session,
+    token: str,
+    password: Optional[str] = None
+) -> Optional[Tuple[models.SharedLink, models.Note]]:
+    """Access a shared note using token, returning the link with it"""
     shared_link = db.query(models.SharedLink).filter(
         models.SharedLink.token == token,
         models.SharedLink.is_active == True
@@ -541,7 +1122,39 @@ def get_shared_note(db: Session, token: str, password: Optional[str] = None) ->
     
     # Get note with files
     note = db.query(models.Note).filter(models.Note.id == shared_link.note_id).first()
-    return note
+    return (shared_link, note) if note else None
+
+
+def get_shared_link_state(db: Session, token: str):
+    """
+    A share link's access state and its note's ETag fields in one indexed lookup
+    (link_id, is_active, expires_at, has_password, note_id, user_id, version,
+    updated_at, enrichment_status, enriched_version); None if the token is unknown
+    """
+    return db.query(
+        models.SharedLink.id.label("link_id"),
+        models.SharedLink.is_active,
+        models.SharedLink.expires_at,
+        models.SharedLink.password_hash.isnot(None).label("has_password"),
+        models.Note.id.label("note_id"),
+        models.Note.user_id,
+        models.Note.version,
+        models.Note.updated_at,
+        models.Note.enrichment_status,
+        models.Note.enriched_version
+    ).join(models.Note, models.Note.id == models.SharedLink.note_id).filter(
+        models.SharedLink.token == token
+    ).first()
+
+
+def record_shared_view(db: Session, link_id: int) -> None:
+    """Count a view of a shared link served from the cache (one UPDATE, nothing loaded)"""
+    db.execute(
+        update(models.SharedLink)
+        .where(models.SharedLink.id == link_id)
+        .values(view_count=models.SharedLink.view_count + 1, last_viewed_at=datetime.utcnow())
+    )
+    db.commit()
 
 
 def get_shared_links_for_note(db: Session, note_id: int, user_id: int) -> List[models.SharedLink]:
@@ -567,6 +1180,8 @@ def deactivate_shared_link(db: Session, link_id: int, user_id: int) -> bool:
     if not note:
         raise HTTPException(status_code=403, detail="Access denied")
     
+    if shared_link.is_active:
+        rollups.bump_user_stats(db, user_id, active_share_count=-1)
     shared_link.is_active = False
     db.commit()
     
@@ -582,57 +1197,46 @@ def create_activity(
     description: Optional[str] = None,
     note_id: Optional[int] = None,
     meta_data: dict = {}
-) -> models.UserActivity:
-    """Log user activity"""
-    activity = models.UserActivity(
+) -> None:
+    """Log user activity (write-behind: queued and batch-inserted by activity_log)"""
+    activity_log.log_activity(
         user_id=user_id,
         activity_type=activity_type,
         description=description,
         note_id=note_id,
         meta_data=meta_data
     )
-    
-    db.add(activity)
-    db.commit()
-    
-    return activity
 
 
-def get_analytics(db: Session, user_id: int) -> dict:
-    """Get analytics data for user dashboard"""
-    # Total notes
-    total_notes = db.query(func.count(models.Note.id)).filter(
-        models.Note.user_id == user_id
-    ).scalar()
+ANALYTICS_TIMELINE_DAYS = 7
+
+
+def get_analytics(db: Session, user_id: int, days: int = ANALYTICS_TIMELINE_DAYS) -> dict:
+    """
+    Get analytics data for user dashboard, with a timeline of the last `days` days
     
-    # Notes created this week
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    notes_this_week = db.query(func.count(models.Note.id)).filter(
-        models.Note.user_id == user_id,
-        models.Note.created_at >= week_ago
-    ).scalar()
+    Reads the precomputed rollups (see rollups.py) rather than the raw notes and
+    user_activities tables, except notes_this_week: a count of the user's notes
+    rows created in the last 7 days (the created_at index keeps it small), so
+    permanently deleted notes and dropped activity events do not skew it.
+    """
+    today = datetime.utcnow().date()
+    first_day = today - timedelta(days=days - 1)
     
-    # Total files
-    total_files = db.query(func.count(models.FileAttachment.id)).join(
-        models.Note
-    ).filter(models.Note.user_id == user_id).scalar()
-    
-    # Total shared links
-    total_shared = db.query(func.count(models.SharedLink.id)).join(
-        models.Note
-    ).filter(
-        models.Note.user_id == user_id,
-        models.SharedLink.is_active == True
-    ).scalar()
-    
-    # AI operations count
-    ai_operations_count = db.query(func.count(models.UserActivity.id)).filter(
-        models.UserActivity.user_id == user_id,
-        models.UserActivity.activity_type.like("ai_%")
-    ).scalar()
+    # Totals
+    stats = db.query(
+        models.UserStats.note_count,
+        models.UserStats.file_count,
+        models.UserStats.active_share_count,
+        models.UserStats.ai_operation_count
+    ).filter(models.UserStats.user_id == user_id).first()
     
     # Recent activities (last 10)
-    recent_activities = db.query(models.UserActivity).filter(
+    recent_activities = db.query(
+        models.UserActivity.activity_type,
+        models.UserActivity.description,
+        models.UserActivity.created_at
+    ).filter(
         models.UserActivity.user_id == user_id
     ).order_by(models.UserActivity.created_at.desc()).limit(10).all()
     
@@ -646,41 +1250,48 @@ def get_analytics(db: Session, user_id: int) -> dict:
     ]
     
     # Notes by tag
-    notes = db.query(models.Note).filter(models.Note.user_id == user_id).all()
-    notes_by_tag = {}
-    for note in notes:
-        for tag in note.tags:
-            notes_by_tag[tag] = notes_by_tag.get(tag, 0) + 1
+    notes_by_tag = {row["tag"]: row["count"] for row in get_tag_counts(db, user_id)}
     
-    # Activity timeline (last 7 days)
-    activity_timeline = []
-    for i in range(7):
-        date = datetime.utcnow() - timedelta(days=i)
-        date_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-        date_end = date.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        count = db.query(func.count(models.UserActivity.id)).filter(
-            models.UserActivity.user_id == user_id,
-            models.UserActivity.created_at >= date_start,
-            models.UserActivity.created_at <= date_end
-        ).scalar()
-        
-        activity_timeline.append({
-            "date": date_start.strftime("%Y-%m-%d"),
-            "count": count
-        })
+    # Notes created this week
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    notes_this_week = db.query(func.count(models.Note.id)).filter(
+        models.Note.user_id == user_id,
+        models.Note.created_at >= week_ago
+    ).scalar()
+    
+    # Daily counts covering the requested range
+    daily_rows = db.query(
+        models.ActivityDailyCount.day,
+        models.ActivityDailyCount.activity_type,
+        models.ActivityDailyCount.count
+    ).filter(
+        models.ActivityDailyCount.user_id == user_id,
+        models.ActivityDailyCount.day >= first_day
+    ).all()
+    
+    counts_by_day = {}
+    activity_by_type = {}
+    for row in daily_rows:
+        counts_by_day[row.day] = counts_by_day.get(row.day, 0) + row.count
+        activity_by_type[row.activity_type] = activity_by_type.get(row.activity_type, 0) + row.count
     
-    activity_timeline.reverse()
+    # Activity timeline (oldest first, days without activity included)
+    activity_timeline = []
+    for i in range(days):
+        date = first_day + timedelta(days=i)
+        activity_timeline.append({"date": date.strftime("%Y-%m-%d"), "count": counts_by_day.get(date, 0)})
     
     return {
-        "total_notes": total_notes,
+        "total_notes": stats.note_count if stats else 0,
         "notes_this_week": notes_this_week,
-        "total_files": total_files,
-        "total_shared": total_shared,
-        "ai_operations_count": ai_operations_count,
+        "total_files": stats.file_count if stats else 0,
+        "total_shared": stats.active_share_count if stats else 0,
+        "ai_operations_count": stats.ai_operation_count if stats else 0,
         "recent_activities": recent_activities_data,
         "notes_by_tag": notes_by_tag,
-        "activity_timeline": activity_timeline
+        "activity_timeline": activity_timeline,
+        "activity_by_type": activity_by_type,
+        "range_days": days
     }
 
 
@@ -692,6 +1303,9 @@ def create_chat_session(db: Session, user_id: int) -> models.ChatSession:
     db.add(db_session)
     db.commit()
     db.refresh(db_session)
+    # A new session has no messages; mark the collection loaded so serializing
+    # ChatSessionOut does not lazy-load outside the async session
+    set_committed_value(db_session, "messages", [])
     return db_session
 
 
@@ -703,11 +1317,20 @@ def get_chat_session(db: Session, chat_id: str, user_id: int) -> Optional[models
     ).first()
 
 
-def get_chat_sessions(db: Session, user_id: int, skip: int = 0, limit: int = 20) -> List[models.ChatSession]:
-    """Get all chat sessions for a user"""
-    return db.query(models.ChatSession).filter(
+def get_chat_sessions(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> List[models.ChatSession]:
+    """Get all chat sessions for a user, with their messages (ChatSessionOut serializes them)"""
+    query = db.query(models.ChatSession).options(
+        selectinload(models.ChatSession.messages)
+    ).filter(
         models.ChatSession.user_id == user_id
-    ).order_by(models.ChatSession.created_at.desc()).offset(skip).limit(limit).all()
+    )
+    return _paginate(query, models.ChatSession.created_at, models.ChatSession.id, skip, limit, cursor).all()
 
 
 def create_chat_message(db: Session, chat_id: str, role: str, content: str) -> models.ChatMessage:
@@ -724,12 +1347,72 @@ def create_chat_message(db: Session, chat_id: str, role: str, content: str) -> m
 
 
 def get_chat_messages(db: Session, chat_id: str, user_id: int, limit: int = 50) -> List[models.ChatMessage]:
-    """Get messages for a chat session with ownership verification"""
+    """Get the latest `limit` messages of a chat session (oldest first) with ownership verification"""
     # Verify session ownership
     session = get_chat_session(db, chat_id, user_id)
     if not session:
         return []
         
-    return db.query(models.ChatMessage).filter(
+    messages = db.query(models.ChatMessage).filter(
         models.ChatMessage.chat_id == chat_id
-    ).order_by(models.ChatMessage.created_at.asc()).limit(limit).all()
+    ).order_by(models.ChatMessage.id.desc()).limit(limit).all()
+    return messages[::-1]
+
+
+def get_chat_memory(db: Session, chat_id: str, user_id: int, limit: int) -> Optional[dict]:
+    """
+    A session's rolling memory, or None if the session doesn't exist / isn't the user's
+    
+    {"summary", "summarized_until", "messages": the latest `limit` messages not
+    yet in the summary (oldest first), "unsummarized": how many such messages exist}
+    """
+    session = db.execute(
+        select(models.ChatSession.summary, models.ChatSession.summarized_until)
+        .where(models.ChatSession.id == chat_id, models.ChatSession.user_id == user_id)
+    ).first()
+    if session is None:
+        return None
+    
+    recent = (models.ChatMessage.chat_id == chat_id, models.ChatMessage.id > session.summarized_until)
+    messages = db.execute(
+        select(models.ChatMessage.id, models.ChatMessage.role, models.ChatMessage.content)
+        .where(*recent).order_by(models.ChatMessage.id.desc()).limit(limit)
+    ).all()
+    unsummarized = len(messages)
+    if unsummarized == limit:
+        unsummarized = db.execute(select(func.count(models.ChatMessage.id)).where(*recent)).scalar()
+    return {
+        "summary": session.summary,
+        "summarized_until": session.summarized_until,
+        "messages": [{"id": m.id, "role": m.role, "content": m.content} for m in reversed(messages)],
+        "unsummarized": unsummarized,
+    }
+
+
+def get_messages_to_summarize(db: Session, chat_id: str, after_id: int, keep: int, limit: int) -> List[dict]:
+    """Oldest messages after after_id, up to `limit`, leaving the latest `keep` out"""
+    last_id = db.execute(
+        select(models.ChatMessage.id)
+        .where(models.ChatMessage.chat_id == chat_id, models.ChatMessage.id > after_id)
+        .order_by(models.ChatMessage.id.desc()).offset(keep).limit(1)
+    ).scalar()
+    if last_id is None:
+        return []
+    messages = db.execute(
+        select(models.ChatMessage.id, models.ChatMessage.role, models.ChatMessage.content)
+        .where(models.ChatMessage.chat_id == chat_id, models.ChatMessage.id > after_id,
+               models.ChatMessage.id <= last_id)
+        .order_by(models.ChatMessage.id.asc()).limit(limit)
+    ).all()
+    return [{"id": m.id, "role": m.role, "content": m.content} for m in messages]
+
+
+def update_chat_summary(db: Session, chat_id: str, summary: str, previous_until: int, summarized_until: int) -> bool:
+    """Store a new summary unless another update moved summarized_until since previous_until"""
+    result = db.execute(
+        update(models.ChatSession)
+        .where(models.ChatSession.id == chat_id, models.ChatSession.summarized_until == previous_until)
+        .values(summary=summary, summarized_until=summarized_until)
+    )
+    db.commit()
+    return result.rowcount == 1
@@ -0,0 +1,164 @@
+# backend/app/daily_brief.py
+"""
+Daily brief: built once per user per day, served from the cache
+
+A brief covers the notes edited in the last 7 days and the most pressing
+tasks from the task index (task_index.py). Notes whose stored tasks are
+behind their content are re-extracted first, concurrently
+(DAILY_BRIEF_CONCURRENCY at a time). The wait is bounded by
+DAILY_BRIEF_EXTRACTION_DEADLINE_SECONDS. Extractions still running then
+finish in the background, and the brief uses the tasks stored so far
+(tasks_complete=False).
+
+Briefs are cached under (user, UTC date) until the day ends; they are not
+user-scoped entries, so editing a note does not throw the day's brief away
+(pass refresh to rebuild it). With DAILY_BRIEF_PRECOMPUTE and the Redis
+cache, a background loop builds the brief for users active in the last
+DAILY_BRIEF_ACTIVE_DAYS days, so opening the dashboard is a cache read. Each
+UTC day's batch runs on the one worker that claims it; with a per-process
+cache every worker and cold start would pay for the whole batch again.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional, Set
+from .config import get_settings
+from .database import AsyncSessionLocal
+from .cache import cache
+from . import async_crud, ai_integration, task_index
+
+settings = get_settings()
+
+RECENT_DAYS = 7
+BRIEF_TASKS = 10
+
+_extractions: Set[asyncio.Task] = set()  # outlive the brief that started them
+
+
+def _cache_key(user_id: int, day) -> str:
+    return f"{user_id}:{day.isoformat()}"
+
+
+def _seconds_left_today(now: datetime) -> float:
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (tomorrow - now).total_seconds() + 60
+
+
+async def _extract_one(note_id: int, version: int, semaphore: asyncio.Semaphore) -> bool:
+    async with semaphore:
+        async with AsyncSessionLocal() as db:
+            return await task_index.extract(db, note_id, version, settings.AI_ENRICHMENT_TIMEOUT_SECONDS)
+
+
+async def _refresh_tasks(user_id: int, notes) -> bool:
+    """Bring the task index up to date for these notes within the deadline; True if all of them made it"""
+    stale = [note for note in notes
+             if note.tasks_status != "done" or note.tasks_content_hash != note.content_hash]
+    if not stale:
+        return True
+
+    semaphore = asyncio.Semaphore(settings.DAILY_BRIEF_CONCURRENCY)
+    jobs = [asyncio.create_task(_extract_one(note.id, note.version, semaphore)) for note in stale]
+    done, pending = await asyncio.wait(jobs, timeout=settings.DAILY_BRIEF_EXTRACTION_DEADLINE_SECONDS)
+    for job in pending:
+        # Not cancelled: the result is stored for the next brief and the note's tasks view
+        _extractions.add(job)
+        job.add_done_callback(_extractions.discard)
+
+    failed = sum(1 for job in done if job.exception() is not None or not job.result())
+    if failed or pending:
+        print(f"WARNING: daily brief for user {user_id}: {failed} task extractions failed, "
+              f"{len(pending)} still running at the deadline")
+    return not failed and not pending
+
+
+async def build(user_id: int) -> dict:
+    """Build today's brief for a user (AI calls included)"""
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        notes = await async_crud.get_brief_notes(db, user_id, now - timedelta(days=RECENT_DAYS))
+        await db.rollback()
+        tasks_complete = await _refresh_tasks(user_id, notes[:5])
+        tasks = await async_crud.get_user_tasks(db, user_id, order="due", limit=BRIEF_TASKS)
+        await db.rollback()
+
+    brief = await ai_integration.ai_generate_daily_brief([{"title": note.title} for note in notes], tasks)
+    return {
+        "brief": brief,
+        "date": now.date().isoformat(),
+        "generated_at": now.isoformat(),
+        "recent_notes_count": len(notes),
+        "pending_tasks_count": len(tasks),
+        "tasks_complete": tasks_complete,
+    }
+
+
+async def get(user_id: int, refresh: bool = False) -> dict:
+    """Today's brief for a user: cached, or built now (concurrent requests share one build)"""
+    now = datetime.utcnow()
+    key = _cache_key(user_id, now.date())
+    ttl = _seconds_left_today(now)
+    if refresh:
+        brief = await build(user_id)
+        await cache.set("daily_brief", key, brief, ttl=ttl)
+        return brief
+    return await cache.get_or_set("daily_brief", key, lambda: build(user_id), ttl=ttl)
+
+
+async def shutdown() -> None:
+    """Cancel task extractions that outlived their brief; called from the app's lifespan on shutdown"""
+    for job in list(_extractions):
+        job.cancel()
+    await asyncio.gather(*_extractions, return_exceptions=True)
+
+
+class BriefPrecomputer:
+    """Background loop building missing briefs of recently active users"""
+
+    def __init__(self, interval: float, active_days: int):
+        self.interval = interval
+        self.active_days = active_days
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if not cache.shared:
+            print("WARNING: DAILY_BRIEF_PRECOMPUTE needs CACHE_BACKEND=redis; briefs are built on demand")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.precompute()
+            except Exception as e:
+                print(f"WARNING: daily brief precompute failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def precompute(self) -> int:
+        """Build today's brief for active users that have none yet; returns how many were built"""
+        if ai_integration.client is None:
+            return 0
+        now = datetime.utcnow()
+        if not await cache.claim("daily_brief_precompute", now.date().isoformat(), _seconds_left_today(now)):
+            return 0  # another worker (or an earlier run here) has today's batch
+        async with AsyncSessionLocal() as db:
+            user_ids = await async_crud.get_recently_active_users(db, now - timedelta(days=self.active_days))
+        built = 0
+        for user_id in user_ids:
+            if await cache.get("daily_brief", _cache_key(user_id, now.date())) is not None:
+                continue
+            try:
+                await get(user_id)
+                built += 1
+            except Exception as e:
+                print(f"WARNING: daily brief for user {user_id} failed: {e}")
+        return built
+
+
+precomputer = BriefPrecomputer(settings.DAILY_BRIEF_PRECOMPUTE_INTERVAL_SECONDS, settings.DAILY_BRIEF_ACTIVE_DAYS)
@@ -4,12 +4,20 @@ Database connection and session management for PostgreSQL
 Auto-creates missing tables/columns on startup (for small projects)
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, literal, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import get_settings
 
 settings = get_settings()
 
+# SQLite engines may run on NullPool/SingletonThreadPool, which reject pool sizing
+_pool_kwargs = (
+    {}
+    if settings.database_url_validated.startswith("sqlite")
+    else {"pool_size": 10, "max_overflow": 20}
+)
+
 # -----------------------------
 # Create PostgreSQL engine
 # -----------------------------
@@ -17,15 +25,32 @@ engine = create_engine(
     settings.database_url_validated,
     echo=settings.DEBUG,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+    **_pool_kwargs,
 )
 
 # -----------------------------
-# Session factory
+# Async engine (same database, asyncio driver)
+# -----------------------------
+async_engine = create_async_engine(
+    settings.async_database_url,
+    echo=settings.DEBUG,
+    pool_pre_ping=True,
+    **_pool_kwargs,
+)
+
+# -----------------------------
+# Session factories
 # -----------------------------
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# expire_on_commit=False: returned ORM objects are serialized after the
+# route returns, where an implicit refresh would need a blocking round-trip
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 # -----------------------------
 # Base class for models
 # -----------------------------
@@ -35,8 +60,79 @@ Base = declarative_base()
 # Create tables automatically
 # -----------------------------
 def init_db():
-    from . import models  # ensures all models are imported
+    from . import models, search_index  # ensures all models are imported
     Base.metadata.create_all(bind=engine)
+    ensure_schema()
+    search_index.setup(engine)
+    backfill_note_tags()
+    backfill_rollups()
+    backfill_trash_deleted_at()  # after the rollups: it bumps corpus versions
+
+
+def backfill_note_tags():
+    """Populate note_tags for notes written before the table existed"""
+    from . import crud
+    db = SessionLocal()
+    try:
+        written = crud.backfill_note_tags(db)
+        if written:
+            print(f"Backfilled {written} note tags")
+    finally:
+        db.close()
+
+
+def backfill_trash_deleted_at():
+    """Set deleted_at on notes trashed before every trash path recorded it"""
+    from . import crud
+    db = SessionLocal()
+    try:
+        fixed = crud.backfill_trash_deleted_at(db)
+        if fixed:
+            print(f"Backfilled deleted_at on {fixed} trashed notes")
+    finally:
+        db.close()
+
+
+def backfill_rollups():
+    """Build the analytics rollups from the raw tables when they are still empty"""
+    from . import rollups
+    db = SessionLocal()
+    try:
+        if rollups.needs_rebuild(db):
+            rollups.rebuild(db)
+            db.commit()
+            print("Rebuilt analytics rollups")
+    finally:
+        db.close()
+
+
+def ensure_schema():
+    """Add columns and indexes declared on models whose tables already existed (create_all skips those)"""
+    existing_tables = set(inspect(engine).get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name in existing_tables:
+            ensure_columns(table)
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def ensure_columns(table):
+    """ALTER TABLE ... ADD COLUMN for model columns missing from an existing table"""
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    missing = [column for column in table.columns if column.name not in existing]
+    if not missing:
+        return
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for column in missing:
+            ddl = (f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                   f"{preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}")
+            # Existing rows get a scalar Python-side default (e.g. 0) as the column default
+            if column.default is not None and column.default.is_scalar:
+                value = literal(column.default.arg, type_=column.type)
+                ddl += " DEFAULT " + str(value.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            conn.execute(text(ddl))
+            print(f"Added column {table.name}.{column.name}")
 
 
 # -----------------------------
@@ -48,3 +144,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,157 @@
+# backend/app/enrichment.py
+"""
+Background auto-tagging / categorization of saved notes
+
+Note saves only mark the note enrichment_status="pending" and enqueue a job;
+AI_ENRICHMENT_WORKERS asyncio tasks make the AI call and write the tags and
+meta_data.category afterwards, so save latency no longer depends on the LLM.
+
+Jobs are deduplicated per note: a save while the note is still queued
+replaces the queued version instead of adding a job, and each job waits
+AI_ENRICHMENT_DEBOUNCE_SECONDS after the latest save, so a burst of
+autosaves costs one AI call for the final version. A result computed from
+a version that has since been edited is discarded.
+
+The queue is in-process; notes left pending by a restart are re-queued when
+the workers start. Clients follow progress through NoteOut.enrichment_status.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from .config import get_settings
+from .database import AsyncSessionLocal
+from . import async_crud, ai_integration
+
+settings = get_settings()
+
+
+@dataclass
+class EnrichmentJob:
+    note_id: int
+    version: int
+    recategorize: bool = False  # re-detect the category even if the note has one
+    log_activity: bool = False
+    ready_at: float = 0.0  # loop time after which the job may run
+
+
+class EnrichmentQueue:
+    """
+    Per-note deduplicated job queue with a pool of asyncio workers
+    
+    Subclasses for other per-note background AI work (task_index) override
+    _requeue_pending and _process.
+    """
+
+    def __init__(self, workers: int, debounce: float, timeout: float):
+        self.workers = workers
+        self.debounce = debounce
+        self.timeout = timeout
+        self._pending: Dict[int, EnrichmentJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def enqueue(self, note_id: int, version: int, recategorize: bool = False, log_activity: bool = False) -> None:
+        """Queue enrichment of this version of a note (no-op if a newer one is queued)"""
+        ready_at = self._now() + self.debounce
+        job = self._pending.get(note_id)
+        if job is not None:
+            if version >= job.version:
+                job.version = version
+                job.ready_at = ready_at
+            job.recategorize = job.recategorize or recategorize
+            job.log_activity = job.log_activity or log_activity
+            return
+        self._pending[note_id] = EnrichmentJob(note_id, version, recategorize, log_activity, ready_at)
+        if self._queue is not None:
+            self._queue.put_nowait(note_id)
+
+    async def start(self) -> None:
+        """Start the workers and re-queue notes left pending by a previous run"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        for note_id in self._pending:
+            self._queue.put_nowait(note_id)
+        try:
+            async with AsyncSessionLocal() as db:
+                await self._requeue_pending(db)
+        except Exception as e:
+            print(f"WARNING: could not re-queue pending jobs of {type(self).__name__}: {e}")
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued notes stay pending in the database for the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def queued(self) -> int:
+        return len(self._pending)
+
+    async def _requeue_pending(self, db) -> None:
+        for note_id, version in await async_crud.get_pending_enrichments(db):
+            self.enqueue(note_id, version, recategorize=True)
+
+    @staticmethod
+    def _now() -> float:
+        return asyncio.get_running_loop().time()
+
+    async def _work(self) -> None:
+        while True:
+            note_id = await self._queue.get()
+            # Wait out the debounce window, which later saves keep pushing back
+            while True:
+                job = self._pending.get(note_id)
+                if job is None or job.ready_at <= self._now():
+                    break
+                await asyncio.sleep(job.ready_at - self._now())
+            job = self._pending.pop(note_id, None)
+            if job is None:
+                continue
+            try:
+                await self._process(job)
+            except Exception as e:
+                print(f"WARNING: enrichment of note {job.note_id} failed: {e}")
+
+    async def _process(self, job: EnrichmentJob) -> None:
+        async with AsyncSessionLocal() as db:
+            source = await async_crud.get_enrichment_source(db, job.note_id)
+            await db.rollback()  # don't hold a transaction open across the AI call
+            if source is None or source.version != job.version:
+                return  # deleted, or edited again (a newer job is queued)
+
+            want_tags = not source.tags
+            want_category = job.recategorize or not (source.meta_data or {}).get("category")
+            enrichment = {}
+            if source.content and (want_tags or want_category):
+                try:
+                    enrichment = await asyncio.wait_for(
+                        ai_integration.ai_enrich_note(source.content, want_tags=want_tags, want_category=want_category),
+                        timeout=self.timeout
+                    )
+                except Exception as e:
+                    print(f"WARNING: enrichment of note {job.note_id} failed: {e}")
+                    enrichment = None
+
+            note = await async_crud.apply_note_enrichment(db, job.note_id, job.version, enrichment)
+            if note is None or not enrichment or not job.log_activity:
+                return
+            if "tags" in enrichment:
+                await async_crud.create_activity(db, user_id=source.user_id, activity_type="ai_auto_tag",
+                                                 description=f"Auto-generated tags for: {source.title}", note_id=job.note_id)
+            if "category" in enrichment:
+                await async_crud.create_activity(db, user_id=source.user_id, activity_type="ai_auto_category",
+                                                 description=f"Auto-detected category: {enrichment['category']}", note_id=job.note_id)
+
+
+enrichment_queue = EnrichmentQueue(
+    workers=settings.AI_ENRICHMENT_WORKERS,
+    debounce=settings.AI_ENRICHMENT_DEBOUNCE_SECONDS,
+    timeout=settings.AI_ENRICHMENT_TIMEOUT_SECONDS,
+)
+
+
+def enqueue(note_id: int, version: int, recategorize: bool = False, log_activity: bool = False) -> None:
+    enrichment_queue.enqueue(note_id, version, recategorize, log_activity)
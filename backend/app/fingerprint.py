@@ -0,0 +1,50 @@
+# backend/app/fingerprint.py
+"""
+Content fingerprints for notes
+
+content_hash  sha256 of the normalized plain text: exact "did anything change"
+simhash       64-bit SimHash over the text's words: the share of matching bits
+              estimates how similar two texts' vocabularies are, which is
+              what tags and category depend on (word order is ignored)
+
+Both are computed from the words of to_plain_text(), lowercased, so markup,
+punctuation and reformatting alone do not count as a change. SimHashes are
+stored as 16 hex digits (64 unsigned bits do not fit a signed BIGINT).
+"""
+import hashlib
+import re
+from collections import Counter
+from typing import List, Optional
+from .utils import to_plain_text
+
+SIMHASH_BITS = 64
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _words(text: Optional[str]) -> List[str]:
+    return _WORD.findall(to_plain_text(text).lower())
+
+
+def content_hash(text: Optional[str]) -> str:
+    """sha256 hex digest of the normalized text"""
+    return hashlib.sha256(" ".join(_words(text)).encode()).hexdigest()
+
+
+def simhash(text: Optional[str]) -> str:
+    """64-bit SimHash of the text's words (weighted by count), as 16 hex digits"""
+    weights = [0] * SIMHASH_BITS
+    for word, count in Counter(_words(text)).items():
+        value = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+    fingerprint = sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+    return f"{fingerprint:016x}"
+
+
+def similarity(a: Optional[str], b: Optional[str]) -> float:
+    """Share of equal bits between two SimHashes: 1.0 identical, ~0.5 unrelated, 0.0 if either is missing"""
+    if not a or not b:
+        return 0.0
+    distance = bin(int(a, 16) ^ int(b, 16)).count("1")
+    return 1 - distance / SIMHASH_BITS
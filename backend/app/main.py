@@ -4,29 +4,58 @@
 NoteAI Pro - FastAPI Main Application
 Production-ready REST API with comprehensive features
 """
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Response
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Response, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from datetime import datetime
 from io import BytesIO
-from .database import get_db, engine, Base
+import asyncio
+import hashlib
+import json
+from contextlib import asynccontextmanager
+from .database import AsyncSessionLocal, async_engine, get_db, get_async_db, init_db
 from .config import get_settings
-from . import models, schemas, crud, auth, ai_integration, file_handler, pdf_export
+from . import models, schemas, crud, async_crud, auth, ai_integration, file_handler, pdf_export, activity_log, enrichment, chat_memory, task_index, daily_brief
+from .cache import cache, llm_cache, Uncached
+from .context_budget import TextTooLong
+from .utils import encode_cursor
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables and any missing indexes
+init_db()
 
 settings = get_settings()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start-up / shutdown hooks for background workers"""
+    await enrichment.enrichment_queue.start()
+    await task_index.task_queue.start()
+    if settings.DAILY_BRIEF_PRECOMPUTE:
+        daily_brief.precomputer.start()
+    yield
+    await daily_brief.precomputer.stop()
+    await daily_brief.shutdown()
+    await chat_memory.shutdown()
+    await enrichment.enrichment_queue.stop()
+    await task_index.task_queue.stop()
+    # Write out any activity events still buffered
+    activity_log.shutdown()
+    # Close pooled connections while the event loop is still running
+    await async_engine.dispose()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     description="Production-ready note-taking application with AI features",
     version="1.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    lifespan=lifespan
 )
 
 
@@ -42,9 +71,147 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 
+def _next_cursor(items: list, limit: int, sort_attr: str) -> Optional[str]:
+    """
+    Keyset cursor for the page after this one, if this page is full
+
+    Sort columns are never NULL on listed rows (init_db backfills trash
+    deleted_at), so a full page always gets a cursor.
+    """
+    if items and len(items) == limit:
+        last = items[-1]
+        return encode_cursor(getattr(last, sort_attr), last.id)
+    return None
+
+
+def _set_next_cursor(response: Response, items: list, limit: int, sort_attr: str):
+    """Advertise the keyset cursor for the next page when this page is full"""
+    cursor = _next_cursor(items, limit, sort_attr)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+
+
+# Conditional GET: clients revalidate with If-None-Match and get 304 when nothing changed
+def _note_etag(
+    note_id: int,
+    version: int,
+    updated_at: Optional[datetime],
+    enrichment_status: Optional[str],
+    enriched_version: Optional[int]
+) -> str:
+    """
+    Strong ETag for a single note; updated_at covers non-versioned changes (archive, files, ...)
+    and the enrichment fields cover background tagging, which leaves updated_at alone
+    """
+    stamp = updated_at.strftime("%Y%m%d%H%M%S%f") if updated_at else "0"
+    return f'"note-{note_id}-v{version}-{stamp}-{enrichment_status or "none"}{enriched_version or 0}"'
+
+
+def _list_etag(request: Request, user_id: int, corpus_version: int) -> str:
+    """Strong ETag for a note list: the user's corpus version plus the exact query (page, view, fields)"""
+    digest = hashlib.sha1(f"{user_id}:{request.url.path}?{request.url.query}".encode()).hexdigest()[:16]
+    return f'"notes-{corpus_version}-{digest}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check ('*' or any listed tag; weak comparison as RFC 9110 requires)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+
+def _set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+
+
+async def _cached_list(
+    request: Request,
+    if_none_match: Optional[str],
+    user_id: int,
+    db: AsyncSession,
+    load: Callable[[], Awaitable[Tuple[List[dict], Optional[str]]]]
+) -> Response:
+    """
+    Serve a note list page from the cache, revalidated against the list ETag
+    
+    The ETag comes from the user's corpus version, read on every request: a
+    cached page is used only while it carries that ETag, whichever worker
+    cached it. On a miss the page is built by load() -> (body, next cursor).
+    The corpus version is read again afterwards; if a write landed in between,
+    the page goes out without an ETag and is not cached.
+    """
+    etag = _list_etag(request, user_id, await async_crud.get_corpus_version(db, user_id))
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    
+    async def build():
+        body, next_cursor = await load()
+        entry = {"etag": etag, "body": body, "next_cursor": next_cursor}
+        if etag != _list_etag(request, user_id, await async_crud.get_corpus_version(db, user_id)):
+            return Uncached({**entry, "etag": None})
+        return entry
+    
+    key = f"{request.url.path}?{request.url.query}"
+    entry = await cache.get_or_set("notes", key, build, user_id=user_id, fresh=lambda cached: cached["etag"] == etag)
+    
+    response = JSONResponse(content=entry["body"])
+    if entry["etag"]:
+        _set_etag(response, entry["etag"])
+    if entry["next_cursor"]:
+        response.headers["X-Next-Cursor"] = entry["next_cursor"]
+    return response
+
+
+def _dump_notes(notes: List[models.Note]) -> List[dict]:
+    return [schemas.NoteOut.model_validate(note).model_dump(mode="json") for note in notes]
+
+
+# ?view=summary / ?fields=a,b,c on list routes
+NOTE_VIEW_PATTERN = "^(full|summary)$"
+
+
+def _summary_payload(summaries: List[dict], fields: Optional[str], schema=schemas.NoteSummaryOut) -> Tuple[List[dict], list]:
+    """Serialize NoteSummaryOut rows, keeping only the requested sparse fields; returns (body, items)"""
+    include = None
+    if fields:
+        include = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = include - set(schema.model_fields)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+    
+    items = [schema(**summary) for summary in summaries]
+    return [item.model_dump(mode="json", include=include) for item in items], items
+
+
+def _summary_response(
+    summaries: List[dict],
+    fields: Optional[str],
+    limit: Optional[int] = None,
+    sort_attr: Optional[str] = None,
+    schema=schemas.NoteSummaryOut
+) -> JSONResponse:
+    """JSONResponse of _summary_payload, with the next-page cursor when limit is given"""
+    body, items = _summary_payload(summaries, fields, schema)
+    response = JSONResponse(content=body)
+    if limit is not None:
+        _set_next_cursor(response, items, limit, sort_attr)
+    return response
+
+
 # ==================== HEALTH CHECK ====================
 
 @app.get("/health")
@@ -54,7 +221,11 @@ async def health_check():
         "status": "healthy",
         "app_name": settings.APP_NAME,
         "message": "Welcome to NoteAI Pro API This uses ai in the backend",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow().isoformat(),
+        "cache": cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "enrichment_queued": enrichment.enrichment_queue.queued(),
+        "task_extraction_queued": task_index.task_queue.queued()
     }
 
 
@@ -107,6 +278,7 @@ async def login(user: schemas.UserLogin, db: Session = Depends(get_db)):
     db_user.last_login = datetime.utcnow()
     db.commit()
     db.refresh(db_user)
+    auth.invalidate_user_cache(db_user.id)
     
     # Log activity
     crud.create_activity(db, user_id=db_user.id, activity_type="login", description="User logged in")
@@ -184,6 +356,7 @@ async def change_password(
     # Update password
     current_user.hashed_password = auth.get_password_hash(new_password)
     db.commit()
+    auth.invalidate_user_cache(current_user.id)
     
     return {"message": "Password changed successfully"}
 
@@ -192,47 +365,49 @@ async def change_password(
 
 @app.get("/api/notes", response_model=List[schemas.NoteOut])
 async def get_notes(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     archived: bool = False,
+    cursor: Optional[str] = None,
+    view: str = Query("full", pattern=NOTE_VIEW_PATTERN),
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all notes for current user"""
-    notes = crud.get_notes(db, current_user.id, skip, limit, archived)
-    return notes
+    """
+    Get all notes for current user (pass X-Next-Cursor back as ?cursor= for the next page)
+    
+    ?view=summary returns NoteSummaryOut items; ?fields=id,title,tags picks a subset of them.
+    Send the ETag back as If-None-Match to get 304 while none of the user's notes changed.
+    """
+    async def load():
+        if view == "summary" or fields:
+            summaries = await async_crud.get_notes(db, current_user.id, skip, limit, archived, cursor, summary=True)
+            body, items = _summary_payload(summaries, fields)
+        else:
+            items = await async_crud.get_notes(db, current_user.id, skip, limit, archived, cursor)
+            body = _dump_notes(items)
+        return body, _next_cursor(items, limit, "updated_at")
+    
+    return await _cached_list(request, if_none_match, current_user.id, db, load)
 
 
 @app.post("/api/notes", response_model=schemas.NoteOut, status_code=status.HTTP_201_CREATED)
 async def create_note(
     note: schemas.NoteCreate,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Create a new note with AI-powered auto-tagging and category detection"""
-    db_note = crud.create_note(db, note, current_user.id)
+    """Create a new note; AI auto-tagging and category detection follow in the background"""
+    db_note = await async_crud.create_note(db, note, current_user.id)
     
-    # Auto-generate tags and category if content is provided
-    if db_note.content:
-        try:
-            # Auto-generate tags if not provided
-            if not db_note.tags:
-                tags = await ai_integration.ai_generate_tags(db_note.content)
-                db_note.tags = tags
-                crud.create_activity(db, user_id=current_user.id, activity_type="ai_auto_tag",
-                                   description=f"Auto-generated tags for: {db_note.title}", note_id=db_note.id)
-            
-            # Auto-detect category
-            if not db_note.meta_data.get("category"):
-                category = await ai_integration.ai_detect_category(db_note.content)
-                db_note.meta_data = {**db_note.meta_data, "category": category}
-                crud.create_activity(db, user_id=current_user.id, activity_type="ai_auto_category",
-                                   description=f"Auto-detected category: {category}", note_id=db_note.id)
-            
-            db.commit()
-            db.refresh(db_note)
-        except Exception:
-            pass  # Fail silently if AI processing fails
+    # Tags (if not provided) and category are filled in by the enrichment workers
+    if db_note.enrichment_status == "pending":
+        enrichment.enqueue(db_note.id, db_note.version, log_activity=True)
+    if db_note.tasks_status == "pending":
+        task_index.enqueue(db_note.id, db_note.version)
     
     return db_note
 
@@ -240,19 +415,42 @@ async def create_note(
 @app.get("/api/notes/{note_id}", response_model=schemas.NoteOut)
 async def get_note(
     note_id: int,
+    if_none_match: Optional[str] = Header(None),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get a specific note"""
-    note = crud.get_note_by_id(db, note_id, current_user.id)
-    if not note:
+    """
+    Get a specific note (304 when If-None-Match carries its current ETag)
+    
+    The ETag fields are read on every request; the cached body is used only
+    while it carries the same ETag, whichever worker cached it.
+    """
+    etag_key = await async_crud.get_note_etag_key(db, note_id, current_user.id)
+    if etag_key is None:
         raise HTTPException(status_code=404, detail="Note not found")
+    etag = _note_etag(note_id, *etag_key)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    
+    async def load():
+        note = await async_crud.get_note_by_id(db, note_id, current_user.id)
+        if not note:
+            raise HTTPException(status_code=404, detail="Note not found")
+        # ETag from the loaded row, in case the note changed since the check above
+        return {
+            "etag": _note_etag(note.id, note.version, note.updated_at, note.enrichment_status, note.enriched_version),
+            "body": schemas.NoteOut.model_validate(note).model_dump(mode="json")
+        }
+    
+    entry = await cache.get_or_set("note", note_id, load, user_id=current_user.id, fresh=lambda cached: cached["etag"] == etag)
     
     # Log activity
-    crud.create_activity(db, user_id=current_user.id, activity_type="note_viewed",
-                       description=f"Viewed note: {note.title}", note_id=note_id)
+    await async_crud.create_activity(db, user_id=current_user.id, activity_type="note_viewed",
+                                     description=f"Viewed note: {entry['body']['title']}", note_id=note_id)
     
-    return note
+    response = JSONResponse(content=entry["body"])
+    _set_etag(response, entry["etag"])
+    return response
 
 
 @app.put("/api/notes/{note_id}", response_model=schemas.NoteOut)
@@ -260,27 +458,15 @@ async def update_note(
     note_id: int,
     note_update: schemas.NoteUpdate,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Update a note with optional AI re-processing"""
-    updated_note = crud.update_note(db, note_id, note_update, current_user.id)
+    """Update a note; new content is re-tagged (if it has no tags) and re-categorized in the background"""
+    updated_note = await async_crud.update_note(db, note_id, note_update, current_user.id)
     
-    # Re-process tags and category if content changed significantly
-    if note_update.content:
-        try:
-            # Regenerate tags if none exist or if content changed
-            if not updated_note.tags or len(updated_note.tags) == 0:
-                tags = await ai_integration.ai_generate_tags(updated_note.content)
-                updated_note.tags = tags
-            
-            # Re-detect category
-            category = await ai_integration.ai_detect_category(updated_note.content)
-            updated_note.meta_data = {**updated_note.meta_data, "category": category}
-            
-            db.commit()
-            db.refresh(updated_note)
-        except Exception:
-            pass  # Fail silently
+    if updated_note.enrichment_status == "pending":
+        enrichment.enqueue(updated_note.id, updated_note.version, recategorize=True)
+    if updated_note.tasks_status == "pending":
+        task_index.enqueue(updated_note.id, updated_note.version)
     
     return updated_note
 
@@ -290,10 +476,10 @@ async def update_note(
 async def delete_note(
     note_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a note"""
-    success = crud.delete_note(db, note_id, current_user.id)
+    success = await async_crud.delete_note(db, note_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Note not found")
     
@@ -304,10 +490,10 @@ async def delete_note(
 async def archive_note(
     note_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Archive a note"""
-    note = crud.archive_note(db, note_id, current_user.id)
+    note = await async_crud.archive_note(db, note_id, current_user.id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     return note
@@ -317,37 +503,61 @@ async def archive_note(
 async def unarchive_note(
     note_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Unarchive a note"""
-    note = crud.unarchive_note(db, note_id, current_user.id)
+    note = await async_crud.unarchive_note(db, note_id, current_user.id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     return note
 
 
+# ==================== TAG ROUTES ====================
+
+@app.get("/api/tags", response_model=List[schemas.TagCountOut])
+async def get_tags(
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get the user's tags with the number of notes using each, most used first"""
+    return await async_crud.get_tag_counts(db, current_user.id)
+
+
 # ==================== TRASH ROUTES ====================
 
 @app.get("/api/trash", response_model=List[schemas.NoteOut])
 async def get_trash(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    view: str = Query("full", pattern=NOTE_VIEW_PATTERN),
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all deleted notes (trash)"""
-    notes = crud.get_trash_notes(db, current_user.id, skip, limit)
-    return notes
+    """Get all deleted notes (trash), keyset-paginated and with the same views and ETags as /api/notes"""
+    async def load():
+        if view == "summary" or fields:
+            summaries = await async_crud.get_trash_notes(db, current_user.id, skip, limit, cursor, summary=True)
+            body, items = _summary_payload(summaries, fields)
+        else:
+            items = await async_crud.get_trash_notes(db, current_user.id, skip, limit, cursor)
+            body = _dump_notes(items)
+        return body, _next_cursor(items, limit, "deleted_at")
+    
+    return await _cached_list(request, if_none_match, current_user.id, db, load)
 
 
 @app.post("/api/notes/{note_id}/trash", response_model=schemas.NoteOut)
 async def move_note_to_trash(
     note_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Move a note to trash (soft delete)"""
-    note = crud.move_to_trash(db, note_id, current_user.id)
+    note = await async_crud.move_to_trash(db, note_id, current_user.id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     return note
@@ -357,10 +567,10 @@ async def move_note_to_trash(
 async def restore_note(
     note_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Restore a note from trash"""
-    note = crud.restore_from_trash(db, note_id, current_user.id)
+    note = await async_crud.restore_from_trash(db, note_id, current_user.id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found in trash")
     return note
@@ -370,10 +580,10 @@ async def restore_note(
 async def permanent_delete(
     note_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Permanently delete a note from trash"""
-    success = crud.permanent_delete_note(db, note_id, current_user.id)
+    success = await async_crud.permanent_delete_note(db, note_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Note not found in trash")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -382,21 +592,27 @@ async def permanent_delete(
 @app.delete("/api/trash", status_code=status.HTTP_200_OK)
 async def empty_trash_endpoint(
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Empty trash (permanently delete all notes in trash)"""
-    count = crud.empty_trash(db, current_user.id)
+    count = await async_crud.empty_trash(db, current_user.id)
     return {"message": f"Trash emptied successfully", "deleted_count": count}
 
 
-@app.post("/api/notes/search", response_model=List[schemas.NoteOut])
+@app.post("/api/notes/search", response_model=List[schemas.NoteSearchResultOut])
 async def search_notes(
     search_params: schemas.NoteSearch,
+    view: str = Query("full", pattern=NOTE_VIEW_PATTERN),
+    fields: Optional[str] = None,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Search and filter notes"""
-    notes = crud.search_notes(db, current_user.id, search_params)
+    """Full-text search and filter notes, ranked, with snippets (supports ?view=summary and ?fields=)"""
+    if view == "summary" or fields:
+        summaries = await async_crud.search_notes(db, current_user.id, search_params, summary=True)
+        return _summary_response(summaries, fields, schema=schemas.NoteSearchSummaryOut)
+    
+    notes = await async_crud.search_notes(db, current_user.id, search_params)
     return notes
 
 
@@ -446,10 +662,10 @@ async def toggle_hide_note(
 async def get_note_versions(
     note_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get version history for a note"""
-    versions = crud.get_note_versions(db, note_id, current_user.id)
+    versions = await async_crud.get_note_versions(db, note_id, current_user.id)
     return versions
 
 
@@ -460,7 +676,7 @@ async def upload_file(
     note_id: int,
     file: UploadFile = File(...),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload a file attachment to a note"""
     # Process file upload
@@ -469,7 +685,7 @@ async def upload_file(
     )
     
     # Save to database
-    file_attachment = crud.create_file_attachment(
+    file_attachment = await async_crud.create_file_attachment(
         db=db,
         note_id=note_id,
         user_id=current_user.id,
@@ -495,10 +711,10 @@ async def upload_file(
 async def download_file(
     file_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Download a file attachment"""
-    file_attachment = crud.get_file_attachment(db, file_id, current_user.id)
+    file_attachment = await async_crud.get_file_attachment(db, file_id, current_user.id, with_data=True)
     
     if not file_attachment:
         raise HTTPException(status_code=404, detail="File not found")
@@ -517,10 +733,10 @@ async def download_file(
 async def get_file_thumbnail(
     file_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get file thumbnail (for images)"""
-    file_attachment = crud.get_file_attachment(db, file_id, current_user.id)
+    file_attachment = await async_crud.get_file_attachment(db, file_id, current_user.id, with_thumbnail=True)
     
     if not file_attachment:
         raise HTTPException(status_code=404, detail="File not found")
@@ -538,10 +754,10 @@ async def get_file_thumbnail(
 async def get_file_content(
     file_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get extracted text content and metadata for a file"""
-    file_attachment = crud.get_file_attachment(db, file_id, current_user.id)
+    file_attachment = await async_crud.get_file_attachment(db, file_id, current_user.id)
     
     if not file_attachment:
         raise HTTPException(status_code=404, detail="File not found")
@@ -561,10 +777,10 @@ async def get_file_content(
 async def delete_file(
     file_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a file attachment"""
-    success = crud.delete_file_attachment(db, file_id, current_user.id)
+    success = await async_crud.delete_file_attachment(db, file_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="File not found")
     
@@ -577,10 +793,10 @@ async def delete_file(
 async def export_note_pdf(
     note_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Export note as PDF"""
-    note = crud.get_note_by_id(db, note_id, current_user.id)
+    note = await async_crud.get_note_by_id(db, note_id, current_user.id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
@@ -595,8 +811,8 @@ async def export_note_pdf(
     )
     
     # Log activity
-    crud.create_activity(db, user_id=current_user.id, activity_type="note_exported",
-                       description=f"Exported note to PDF: {note.title}", note_id=note_id)
+    await async_crud.create_activity(db, user_id=current_user.id, activity_type="note_exported",
+                                     description=f"Exported note to PDF: {note.title}", note_id=note_id)
     
     # Return PDF
     filename = f"{note.title.replace(' ', '_')}.pdf"
@@ -614,10 +830,10 @@ async def create_share_link(
     note_id: int,
     share_config: schemas.SharedLinkCreate,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a shareable link for a note"""
-    shared_link = crud.create_shared_link(
+    shared_link = await async_crud.create_shared_link(
         db=db,
         note_id=note_id,
         user_id=current_user.id,
@@ -632,10 +848,10 @@ async def create_share_link(
 async def get_share_links(
     note_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all share links for a note"""
-    shares = crud.get_shared_links_for_note(db, note_id, current_user.id)
+    shares = await async_crud.get_shared_links_for_note(db, note_id, current_user.id)
     return shares
 
 
@@ -643,10 +859,10 @@ async def get_share_links(
 async def deactivate_share_link(
     link_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deactivate a share link"""
-    success = crud.deactivate_shared_link(db, link_id, current_user.id)
+    success = await async_crud.deactivate_shared_link(db, link_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Share link not found")
     
@@ -657,64 +873,156 @@ async def deactivate_share_link(
 async def access_shared_note(
     token: str,
     access_request: schemas.SharedNoteAccess,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Access a shared note (no authentication required)"""
-    note = crud.get_shared_note(db, token, access_request.password)
+    """
+    Access a shared note (no authentication required)
+    
+    The link's state (active, expiry, password, note ETag fields) is read on
+    every request. Links without a password are then served from the cache
+    while the cached copy matches the note's ETag; views are still counted.
+    """
+    state = await async_crud.get_shared_link_state(db, token)
+    if state is None or not state.is_active or (state.expires_at is not None and state.expires_at < datetime.utcnow()):
+        raise HTTPException(status_code=404, detail="Shared note not found or expired")
     
-    if not note:
+    etag = _note_etag(state.note_id, state.version, state.updated_at, state.enrichment_status, state.enriched_version)
+    generation = None
+    if not state.has_password:
+        entry = await cache.get("shared", token, user_id=state.user_id)
+        if entry is not None and entry["etag"] == etag:
+            await async_crud.record_shared_view(db, state.link_id)
+            return JSONResponse(content=entry["body"])
+        generation = await cache.generation(state.user_id)
+    
+    result = await async_crud.get_shared_note_with_link(db, token, access_request.password)
+    
+    if not result:
         raise HTTPException(status_code=404, detail="Shared note not found or expired")
     
-    return note
+    link, note = result
+    body = schemas.NoteOut.model_validate(note).model_dump(mode="json")
+    if not link.password_hash and generation is not None:
+        await cache.set("shared", token, {
+            "etag": _note_etag(note.id, note.version, note.updated_at, note.enrichment_status, note.enriched_version),
+            "body": body
+        }, user_id=note.user_id, generation=generation)
+    return JSONResponse(content=body)
 
 
 # ==================== AI ROUTES ====================
 
+# Streaming variants answer with Server-Sent Events: one "data: {"delta": ...}"
+# event per chunk, then "event: done" (or "event: error" with a detail)
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    lines = f"event: {event}\n" if event else ""
+    return f"{lines}data: {json.dumps(data)}\n\n"
+
+
+def _sse_response(
+    chunks: AsyncIterator[str],
+    on_complete: Optional[Callable[[str], Awaitable[dict]]] = None
+) -> StreamingResponse:
+    """
+    Forward AI chunks as SSE
+    
+    on_complete(full_text) runs once the stream has finished (not when the
+    client disconnects first); what it returns goes out with the done event.
+    """
+    async def events():
+        parts = []
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield _sse({"delta": chunk})
+            done = await on_complete("".join(parts)) if on_complete else {}
+        except Exception as e:
+            yield _sse({"detail": str(e)}, event="error")
+            return
+        yield _sse(done or {}, event="done")
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # don't let a reverse proxy hold chunks back
+    })
+
+
 @app.post("/api/ai/summarize", response_model=schemas.AIResponse)
 async def ai_summarize_text(
     request: schemas.AIRequest,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Summarize text using AI"""
     result = await ai_integration.ai_summarize(request.text, request.context)
     
     # Log activity
-    crud.create_activity(db, user_id=current_user.id, activity_type="ai_summarize",
-                       description="Used AI summarization")
+    await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_summarize",
+                                     description="Used AI summarization")
     
     return {"result": result}
 
 
+@app.post("/api/ai/summarize/stream")
+async def ai_summarize_text_stream(
+    request: schemas.AIRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Summarize text using AI, streamed as Server-Sent Events"""
+    await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_summarize",
+                                     description="Used AI summarization")
+    return _sse_response(ai_integration.ai_summarize_stream(request.text, request.context))
+
+
 @app.post("/api/ai/rewrite", response_model=schemas.AIResponse)
 async def ai_rewrite_text(
     request: schemas.AIRequest,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Rewrite/improve text using AI"""
-    result = await ai_integration.ai_rewrite(request.text, request.action)
+    """Rewrite/improve text using AI (413 when the text is too long to rewrite whole)"""
+    try:
+        result = await ai_integration.ai_rewrite(request.text, request.action)
+    except TextTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
     # Log activity
-    crud.create_activity(db, user_id=current_user.id, activity_type="ai_rewrite",
-                       description=f"Used AI rewrite ({request.action})")
+    await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_rewrite",
+                                     description=f"Used AI rewrite ({request.action})")
     
     return {"result": result}
 
 
+@app.post("/api/ai/rewrite/stream")
+async def ai_rewrite_text_stream(
+    request: schemas.AIRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Rewrite/improve text using AI, streamed as Server-Sent Events"""
+    try:
+        chunks = ai_integration.ai_rewrite_stream(request.text, request.action)
+    except TextTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_rewrite",
+                                     description=f"Used AI rewrite ({request.action})")
+    return _sse_response(chunks)
+
+
 @app.post("/api/ai/generate")
 async def ai_generate_note_content(
     topic: str = Form(...),
     length: str = Form("medium"),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Auto-generate note content from topic"""
     result = await ai_integration.ai_generate_note(topic, length)
     
     # Log activity
-    crud.create_activity(db, user_id=current_user.id, activity_type="ai_generate",
-                       description=f"Generated note about: {topic}")
+    await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_generate",
+                                     description=f"Generated note about: {topic}")
     
     return result
 
@@ -723,14 +1031,14 @@ async def ai_generate_note_content(
 async def ai_generate_image_endpoint(
     request: schemas.AIImageRequest,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Generate an image using AI"""
     image_bytes = await ai_integration.ai_generate_image(request.prompt, request.size, request.quality)
     
     # Log activity
-    crud.create_activity(db, user_id=current_user.id, activity_type="ai_image",
-                       description=f"Generated image: {request.prompt[:50]}")
+    await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_image",
+                                     description=f"Generated image: {request.prompt[:50]}")
     
     return StreamingResponse(
         BytesIO(image_bytes),
@@ -743,14 +1051,14 @@ async def ai_generate_image_endpoint(
 async def ai_text_to_speech_endpoint(
     request: schemas.AITTSRequest,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Convert text to speech"""
     audio_bytes = await ai_integration.ai_text_to_speech(request.text, request.voice)
     
     # Log activity
-    crud.create_activity(db, user_id=current_user.id, activity_type="ai_tts",
-                       description="Used text-to-speech")
+    await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_tts",
+                                     description="Used text-to-speech")
     
     return StreamingResponse(
         BytesIO(audio_bytes),
@@ -763,85 +1071,125 @@ async def ai_text_to_speech_endpoint(
 async def ai_get_suggestions_endpoint(
     request: schemas.AISuggestionRequest,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get AI suggestions for text completion"""
     return {"result": suggestion}
 
 
-@app.post("/api/ai/chat", response_model=schemas.AIResponse)
-async def ai_chat_endpoint(
+async def _start_chat_turn(
+    db: AsyncSession,
     request: schemas.AIRequest,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Chat with AI with session memory"""
+    user_id: int
+) -> Tuple[str, Optional[str], List[dict]]:
+    """Resolve (or start) the chat session, load its memory (summary, recent messages) and save the user message"""
     chat_id = request.chat_id
     
     # If no chat_id provided, we still allow stateless chat or reject depending on policy.
     # User requested: "When a new chat starts, generate a new chat_id."
     if not chat_id:
-        session = crud.create_chat_session(db, current_user.id)
+        session = await async_crud.create_chat_session(db, user_id)
         chat_id = session.id
+        summary, history = None, []
     
     # Verify session ownership if chat_id was provided
     else:
-        session = crud.get_chat_session(db, chat_id, current_user.id)
-        if not session:
+        memory = await chat_memory.load(db, chat_id, user_id)
+        if memory is None:
             raise HTTPException(status_code=404, detail="Chat session not found")
-    
-    # Fetch history
-    history_objs = crud.get_chat_messages(db, chat_id, current_user.id)
-    history = [{"role": msg.role, "content": msg.content} for msg in history_objs]
+        summary, history = memory
     
     # Save user message
-    crud.create_chat_message(db, chat_id, "user", request.text)
+    await async_crud.create_chat_message(db, chat_id, "user", request.text)
+    return chat_id, summary, history
+
+
+@app.post("/api/ai/chat", response_model=schemas.AIResponse)
+async def ai_chat_endpoint(
+    request: schemas.AIRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Chat with AI with session memory"""
+    chat_id, summary, history = await _start_chat_turn(db, request, current_user.id)
     
     # Get AI response
     try:
-        result = await ai_integration.ai_chat(request.text, history, request.context)
+        result = await ai_integration.ai_chat(request.text, history, request.context, summary)
         
         # Save assistant message
-        crud.create_chat_message(db, chat_id, "assistant", result)
+        await async_crud.create_chat_message(db, chat_id, "assistant", result)
+        chat_memory.schedule_fold(chat_id, current_user.id)
         
         # Log activity
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_chat",
-                           description="Used AI chat session", meta_data={"chat_id": chat_id})
+        await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_chat",
+                                         description="Used AI chat session", meta_data={"chat_id": chat_id})
         
         return {"result": result, "chat_id": chat_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/ai/chat/stream")
+async def ai_chat_stream_endpoint(
+    request: schemas.AIRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Chat with AI with session memory, streamed as Server-Sent Events
+    
+    The assistant message is saved once the stream completes; the done event
+    carries the chat_id and the saved message's id.
+    """
+    chat_id, summary, history = await _start_chat_turn(db, request, current_user.id)
+    
+    async def save_reply(result: str) -> dict:
+        # The request's session is closed by the time the stream ends
+        async with AsyncSessionLocal() as stream_db:
+            message = await async_crud.create_chat_message(stream_db, chat_id, "assistant", result)
+            await async_crud.create_activity(stream_db, user_id=current_user.id, activity_type="ai_chat",
+                                             description="Used AI chat session", meta_data={"chat_id": chat_id})
+        chat_memory.schedule_fold(chat_id, current_user.id)
+        return {"chat_id": chat_id, "message_id": message.id}
+    
+    return _sse_response(ai_integration.ai_chat_stream(request.text, history, request.context, summary), save_reply)
+
+
 @app.post("/api/ai/chat/sessions", response_model=schemas.ChatSessionOut)
 async def create_chat_session_endpoint(
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new chat session"""
-    return crud.create_chat_session(db, current_user.id)
+    return await async_crud.create_chat_session(db, current_user.id)
 
 
 @app.get("/api/ai/chat/sessions", response_model=List[schemas.ChatSessionOut])
 async def list_chat_sessions(
+    response: Response,
     skip: int = 0,
     limit: int = 20,
+    cursor: Optional[str] = None,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """List recent chat sessions"""
-    return crud.get_chat_sessions(db, current_user.id, skip, limit)
+    """List recent chat sessions, keyset-paginated like /api/notes"""
+    sessions = await async_crud.get_chat_sessions(db, current_user.id, skip, limit, cursor)
+    _set_next_cursor(response, sessions, limit, "created_at")
+    return sessions
 
 
 @app.get("/api/ai/chat/sessions/{chat_id}/messages", response_model=List[schemas.ChatMessageOut])
 async def get_chat_session_history(
     chat_id: str,
+    limit: int = Query(50, ge=1, le=500),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get message history for a session"""
-    messages = crud.get_chat_messages(db, chat_id, current_user.id)
-    if not messages and not crud.get_chat_session(db, chat_id, current_user.id):
+    """Get the latest messages of a session, oldest first"""
+    messages = await async_crud.get_chat_messages(db, chat_id, current_user.id, limit)
+    if not messages and not await async_crud.get_chat_session(db, chat_id, current_user.id):
         raise HTTPException(status_code=404, detail="Chat session not found")
     return messages
 
@@ -850,7 +1198,7 @@ async def get_chat_session_history(
 async def ai_generate_text_endpoint(
     prompt: str = Form(...),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Generate text content using AI"""
     try:
@@ -861,8 +1209,8 @@ async def ai_generate_text_endpoint(
         )
         
         # Log activity
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_text_gen",
-                           description=f"Generated text: {prompt[:50]}")
+        await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_text_gen",
+                                         description=f"Generated text: {prompt[:50]}")
         
         return {"text": result}
     except Exception as e:
@@ -873,7 +1221,7 @@ async def ai_generate_text_endpoint(
 async def ai_generate_image_modal(
     prompt: str = Form(...),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Generate an image and return as base64"""
     try:
@@ -886,8 +1234,8 @@ async def ai_generate_image_modal(
         image_url = f"data:image/png;base64,{image_b64}"
         
         # Log activity
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_image_gen",
-                           description=f"Generated image: {prompt[:50]}")
+        await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_image_gen",
+                                         description=f"Generated image: {prompt[:50]}")
         
         return {"image_url": image_url}
     except Exception as e:
@@ -898,7 +1246,7 @@ async def ai_generate_image_modal(
 async def ai_generate_flowchart_endpoint(
     prompt: str = Form(...),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Generate a Mermaid flowchart diagram"""
     try:
@@ -926,8 +1274,8 @@ flowchart TD
                 mermaid_code = mermaid_code[7:].strip()
         
         # Log activity
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_flowchart",
-                           description=f"Generated flowchart: {prompt[:50]}")
+        await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_flowchart",
+                                         description=f"Generated flowchart: {prompt[:50]}")
         
         return {"mermaid_code": mermaid_code}
     except Exception as e:
@@ -940,14 +1288,16 @@ flowchart TD
 async def ai_format_text_endpoint(
     text: str = Form(...),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Auto-format messy text into clean markdown"""
     try:
         result = await ai_integration.ai_auto_format(text)
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_format",
-                           description="Auto-formatted text")
+        await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_format",
+                                         description="Auto-formatted text")
         return {"formatted_text": result}
+    except TextTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -956,30 +1306,61 @@ async def ai_format_text_endpoint(
 async def ai_detect_category_endpoint(
     text: str = Form(...),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Detect the category of text content"""
     try:
         category = await ai_integration.ai_detect_category(text)
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_category",
-                           description=f"Detected category: {category}")
+        await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_category",
+                                         description=f"Detected category: {category}")
         return {"category": category}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _note_tasks_response(db: AsyncSession, note: models.Note, status: Optional[str] = None) -> dict:
+    tasks = await async_crud.get_note_tasks(db, note.id)
+    return {
+        "note_id": note.id,
+        "note_title": note.title,
+        "status": status or note.tasks_status,
+        "tasks": [schemas.NoteTaskOut.model_validate(task).model_dump(mode="json") for task in tasks]
+    }
+
+
 @app.post("/api/ai/extract-tasks")
 async def ai_extract_tasks_endpoint(
-    text: str = Form(...),
+    text: Optional[str] = Form(None),
+    note_id: Optional[int] = Form(None),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Extract tasks and deadlines from text"""
+    """
+    Extract tasks and deadlines from text, or from a note
+    
+    For a note, stored tasks are returned when they are current; otherwise
+    they are extracted now and stored in the note's task index.
+    """
+    if note_id is None and not text:
+        raise HTTPException(status_code=422, detail="Provide text or note_id")
     try:
-        tasks = await ai_integration.ai_extract_tasks(text)
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_extract_tasks",
-                           description=f"Extracted {len(tasks)} tasks")
-        return {"tasks": tasks}
+        if note_id is not None:
+            note = await async_crud.get_note_by_id(db, note_id, current_user.id)
+            if not note or note.is_deleted:
+                raise HTTPException(status_code=404, detail="Note not found")
+            if not await task_index.extract(db, note_id):
+                raise HTTPException(status_code=502, detail="Task extraction failed, please try again")
+            await db.refresh(note)
+            result = await _note_tasks_response(db, note)
+            tasks = result["tasks"]
+        else:
+            tasks = await ai_integration.ai_extract_tasks(text)
+            result = {"tasks": tasks}
+        await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_extract_tasks",
+                                         description=f"Extracted {len(tasks)} tasks", note_id=note_id)
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -988,86 +1369,111 @@ async def ai_extract_tasks_endpoint(
 async def get_note_tasks(
     note_id: int,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Extract and return tasks from a specific note"""
-    note = crud.get_note_by_id(db, note_id, current_user.id)
+    """
+    Tasks of a note from the task index (no AI call)
+    
+    status is "pending" while (re-)extraction of the current content is
+    queued; tasks are then those of the previous content, if any.
+    """
+    note = await async_crud.get_note_by_id(db, note_id, current_user.id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
-    if not note.content:
-        return {"tasks": []}
-    
-    try:
-        tasks = await ai_integration.ai_extract_tasks(note.content)
-        return {"note_id": note_id, "note_title": note.title, "tasks": tasks}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    if note.tasks_status != "done" and note.content and not note.is_deleted:
+        # Never extracted (notes from before the index) or the last attempt failed
+        if note.tasks_status != "pending":
+            await async_crud.request_task_extraction(db, note_id)
+        task_index.enqueue(note.id, note.version)
+        return await _note_tasks_response(db, note, status="pending")
+    return await _note_tasks_response(db, note)
+
+
+@app.get("/api/tasks", response_model=List[schemas.NoteTaskOut])
+async def list_tasks(
+    due_within_days: Optional[int] = Query(None, ge=0, le=365, description="Only tasks due by then (overdue included)"),
+    priority: Optional[str] = Query(None, pattern="^(high|medium|low)$"),
+    order: str = Query("due", pattern="^(due|priority)$"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Tasks across all notes from the task index: due soonest first, or by priority"""
+    return await async_crud.get_user_tasks(db, current_user.id, due_within_days, priority, order, limit)
 
 
 @app.get("/api/notes/{note_id}/related")
 async def get_related_notes(
     note_id: int,
+    limit: int = Query(3, ge=1, le=20),
+    rerank: bool = False,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Find notes related to the specified note"""
-    note = crud.get_note_by_id(db, note_id, current_user.id)
-    if not note:
-        raise HTTPException(status_code=404, detail="Note not found")
+    """
+    Find notes related to the specified note, by similarity over all of the user's notes
     
-    # Get other notes
-    all_notes = crud.get_notes(db, current_user.id, skip=0, limit=50)
-    other_notes = [n for n in all_notes if n.id != note_id]
+    ?rerank=true lets the AI reorder the closest candidates; if it fails or
+    takes longer than AI_SEARCH_EXPANSION_TIMEOUT_SECONDS the similarity order stands.
+    """
+    if await async_crud.get_note_etag_key(db, note_id, current_user.id) is None:
+        raise HTTPException(status_code=404, detail="Note not found")
     
-    if not other_notes:
-        return {"related_notes": []}
+    candidates = await async_crud.get_related_notes(db, note_id, current_user.id,
+                                                    limit=max(limit * 3, 10) if rerank else limit)
+    if rerank and len(candidates) > 1:
+        note = await async_crud.get_note_by_id(db, note_id, current_user.id)
+        try:
+            order = await asyncio.wait_for(ai_integration.ai_find_related_notes(
+                note.title + " " + (note.content or ""),
+                [{"title": c["title"], "content": c["excerpt"]} for c in candidates]
+            ), timeout=settings.AI_SEARCH_EXPANSION_TIMEOUT_SECONDS)
+            picked = [candidates[i] for i in dict.fromkeys(order)]
+            candidates = picked + [c for c in candidates if c not in picked]
+        except Exception:
+            pass  # keep the similarity order
     
-    try:
-        other_notes_data = [{"title": n.title, "content": n.content or ""} for n in other_notes]
-        related_indices = await ai_integration.ai_find_related_notes(
-            note.title + " " + (note.content or ""),
-            other_notes_data
-        )
-        related_notes = [{"id": other_notes[i].id, "title": other_notes[i].title} for i in related_indices]
-        return {"related_notes": related_notes}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    related_notes = [{"id": c["id"], "title": c["title"], "score": round(c["score"], 4)} for c in candidates[:limit]]
+    return {"related_notes": related_notes}
 
 
 @app.post("/api/ai/ask-notes")
 async def ai_ask_notes_endpoint(
     question: str = Form(...),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Answer a question based on the user's notes (Ask My Notes feature)"""
-    # Fetch notes, excluding private ones
-    notes = db.query(models.Note).filter(
-        models.Note.user_id == current_user.id,
-        models.Note.is_archived == False,
-        models.Note.is_deleted == False
-    ).order_by(models.Note.updated_at.desc()).limit(30).all()
-    
-    # Filter out private notes from meta_data
-    public_notes = [n for n in notes if not n.meta_data.get("is_private", False)]
-    
-    if not public_notes:
+    """
+    Answer a question based on the user's notes (Ask My Notes feature)
+    
+    Only the passages that best match the question, from any of the user's
+    notes, are sent: at most ASK_NOTES_TOP_K of them within ASK_NOTES_CONTEXT_TOKENS.
+    """
+    found = await async_crud.find_passages(db, current_user.id, question,
+                                           settings.ASK_NOTES_TOP_K, settings.ASK_NOTES_CONTEXT_TOKENS)
+    if not found["notes_searched"]:
         return {"answer": "You don't have any notes yet. Create some notes first!"}
-    
-    # Build context from notes
-    context_parts = []
-    for n in public_notes[:20]:
-        content_preview = (n.content or "")[:800]
-        context_parts.append(f"=== Note: {n.title} ===\n{content_preview}")
-    
+    if not found["passages"]:
+        return {"answer": "I couldn't find information about this in your notes.",
+                "notes_searched": found["notes_searched"], "sources": []}
+    
+    # Build context from the passages, grouped by note (best note first)
+    by_note = {}
+    for passage in found["passages"]:
+        by_note.setdefault(passage["note_id"], []).append(passage)
+    context_parts = [
+        f"=== Note: {passages[0]['title']} ===\n" + "\n...\n".join(p["text"] for p in passages)
+        for passages in by_note.values()
+    ]
     notes_context = "\n\n".join(context_parts)
     
     try:
         answer = await ai_integration.ai_ask_notes(question, notes_context)
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_ask_notes",
-                           description=f"Asked: {question[:50]}")
-        return {"answer": answer, "notes_searched": len(public_notes)}
+        await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_ask_notes",
+                                         description=f"Asked: {question[:50]}")
+        sources = [{"id": note_id, "title": passages[0]["title"]} for note_id, passages in by_note.items()]
+        return {"answer": answer, "notes_searched": found["notes_searched"], "sources": sources}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1077,10 +1483,10 @@ async def ai_generate_flashcards_endpoint(
     note_id: int = Form(...),
     count: int = Form(5),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Generate flashcards from a note for study mode"""
-    note = crud.get_note_by_id(db, note_id, current_user.id)
+    note = await async_crud.get_note_by_id(db, note_id, current_user.id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
@@ -1089,8 +1495,8 @@ async def ai_generate_flashcards_endpoint(
     
     try:
         flashcards = await ai_integration.ai_generate_flashcards(note.content, count)
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_flashcards",
-                           description=f"Generated {len(flashcards)} flashcards from: {note.title}")
+        await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_flashcards",
+                                         description=f"Generated {len(flashcards)} flashcards from: {note.title}")
         return {"note_title": note.title, "flashcards": flashcards}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1098,35 +1504,16 @@ async def ai_generate_flashcards_endpoint(
 
 @app.get("/api/ai/daily-brief")
 async def ai_daily_brief_endpoint(
+    refresh: bool = False,
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Generate a personalized daily brief"""
-    # Get recent notes from last 7 days
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    recent_notes = db.query(models.Note).filter(
-        models.Note.user_id == current_user.id,
-        models.Note.updated_at >= week_ago,
-        models.Note.is_archived == False,
-        models.Note.is_deleted == False
-    ).order_by(models.Note.updated_at.desc()).limit(10).all()
-    
-    # Extract tasks from recent notes
-    all_tasks = []
-    for note in recent_notes[:5]:
-        if note.content:
-            try:
-                tasks = await ai_integration.ai_extract_tasks(note.content)
-                all_tasks.extend(tasks)
-            except:
-                pass
-    
+    """Today's personalized daily brief (built once a day, usually ahead of time; refresh rebuilds it)"""
     try:
-        notes_data = [{"title": n.title} for n in recent_notes]
-        brief = await ai_integration.ai_generate_daily_brief(notes_data, all_tasks)
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_daily_brief",
-                           description="Generated daily brief")
-        return {"brief": brief, "recent_notes_count": len(recent_notes), "pending_tasks_count": len(all_tasks)}
+        brief = await daily_brief.get(current_user.id, refresh=refresh)
+        await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_daily_brief",
+                                         description="Generated daily brief")
+        return brief
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1134,56 +1521,53 @@ async def ai_daily_brief_endpoint(
 @app.post("/api/ai/semantic-search")
 async def ai_semantic_search_endpoint(
     query: str = Form(...),
+    expand: bool = Form(True),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Search notes using semantic expansion"""
-    try:
-        # Get expanded terms
-        expanded_terms = await ai_integration.ai_expand_search_query(query)
-        all_terms = [query] + expanded_terms
-        
-        # Search with all terms
-        all_notes = crud.get_notes(db, current_user.id, skip=0, limit=100)
-        
-        # Score notes based on term matches
-        scored_notes = []
-        for note in all_notes:
-            score = 0
-            note_text = (note.title + " " + (note.content or "")).lower()
-            for i, term in enumerate(all_terms):
-                if term.lower() in note_text:
-                    score += (len(all_terms) - i)  # Higher weight for original query
-            if score > 0:
-                scored_notes.append((note, score))
-        
-        # Sort by score
-        scored_notes.sort(key=lambda x: x[1], reverse=True)
-        
-        results = [{
-            "id": n.id,
-            "title": n.title,
-            "score": s,
-            "preview": (n.content or "")[:150]
-        } for n, s in scored_notes[:20]]
-        
-        crud.create_activity(db, user_id=current_user.id, activity_type="ai_semantic_search",
-                           description=f"Semantic search: {query}")
-        return {"query": query, "expanded_terms": expanded_terms, "results": results}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    """
+    Search notes by meaning: the local vector index over all of the user's notes
+    
+    With expand, the query is widened with AI expansion terms if the AI answers
+    within AI_SEARCH_EXPANSION_TIMEOUT_SECONDS; otherwise the plain query is used.
+    """
+    expanded_terms = []
+    if expand:
+        try:
+            expanded_terms = await asyncio.wait_for(ai_integration.ai_expand_search_query(query),
+                                                    timeout=settings.AI_SEARCH_EXPANSION_TIMEOUT_SECONDS)
+        except Exception:
+            pass  # search without expansion
+    
+    # The original query counts double against the expansion terms
+    search_text = " ".join([query, query] + expanded_terms)
+    matches = await async_crud.semantic_search(db, current_user.id, search_text, limit=20)
+    results = [{
+        "id": match["id"],
+        "title": match["title"],
+        "score": round(match["score"], 4),
+        "preview": match["excerpt"][:150]
+    } for match in matches]
+    
+    await async_crud.create_activity(db, user_id=current_user.id, activity_type="ai_semantic_search",
+                                     description=f"Semantic search: {query}")
+    return {"query": query, "expanded_terms": expanded_terms, "results": results}
 
 
 # ==================== ANALYTICS ROUTES ====================
 
 @app.get("/api/analytics", response_model=schemas.AnalyticsOut)
 async def get_analytics_dashboard(
+    days: int = Query(7, ge=1, le=365, description="Timeline range in days, e.g. 7, 30, 90 or 365"),
     current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get analytics dashboard data"""
-    analytics_data = crud.get_analytics(db, current_user.id)
-    return analytics_data
+    """Get analytics dashboard data (cached for ANALYTICS_CACHE_TTL_SECONDS, dropped on note changes)"""
+    async def load():
+        return await async_crud.get_analytics(db, current_user.id, days)
+    
+    return await cache.get_or_set("analytics", days, load, ttl=settings.ANALYTICS_CACHE_TTL_SECONDS,
+                                  user_id=current_user.id)
 
 
 # Root endpoint
@@ -2,8 +2,9 @@
 """
 SQLAlchemy models for NoteAI Pro with PostgreSQL BYTEA file storage
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, LargeBinary, JSON, ARRAY
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, Boolean, LargeBinary, JSON, ARRAY, Index, PrimaryKeyConstraint
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from .database import Base
 from datetime import datetime
 import secrets
@@ -43,14 +44,15 @@ class Note(Base):
     title = Column(String(500), nullable=False, index=True)
     content = Column(Text, nullable=True)  # Rich text content (HTML or Markdown)
     
-    # AI-generated tags (stored as array in PostgreSQL, JSON in SQLite)
+    # AI-generated tags (JSON list; mirrored into note_tags for filtering and counts)
     tags = Column(JSON, default=list)
     
     # Metadata as JSON (color, icon, category, etc.)
     meta_data = Column(JSON, default=dict)
     
-    # Search optimization
-    search_vector = Column(Text, nullable=True)  # For full-text search
+    # Search optimization: weighted tsvector on PostgreSQL (GIN-indexed), unused
+    # elsewhere (SQLite uses the notes_fts table); maintained by search_index
+    search_vector = deferred(Column(Text().with_variant(TSVECTOR(), "postgresql"), nullable=True))
     
     # Flags
     is_favorite = Column(Boolean, default=False)
@@ -65,6 +67,22 @@ class Note(Base):
     # Version tracking
     version = Column(Integer, default=1)
     
+    # Background auto-tagging / categorization (see enrichment.py):
+    # status is "pending", "done" or "failed" (None: never requested)
+    enrichment_status = Column(String(20), nullable=True)
+    enriched_version = Column(Integer, nullable=True)  # note version the last enrichment was computed from
+    
+    # Content fingerprints (see fingerprint.py); enriched_simhash is the SimHash
+    # of the content last enriched, so small edits can skip re-enrichment
+    content_hash = Column(String(64), nullable=True)
+    content_simhash = Column(String(16), nullable=True)
+    enriched_simhash = Column(String(16), nullable=True)
+    
+    # Task extraction into note_tasks (see task_index.py): status as for
+    # enrichment; tasks_content_hash is the content_hash the rows came from
+    tasks_status = Column(String(20), nullable=True)
+    tasks_content_hash = Column(String(64), nullable=True)
+    
     # Foreign keys
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     
@@ -75,9 +93,64 @@ class Note(Base):
     
     # Relationships
     user = relationship("User", back_populates="notes")
-    files = relationship("FileAttachment", back_populates="note", cascade="all, delete-orphan")
+    # selectin: NoteOut serializes files after the (async) session has returned
+    files = relationship("FileAttachment", back_populates="note", cascade="all, delete-orphan", lazy="selectin")
     versions = relationship("NoteVersion", back_populates="note", cascade="all, delete-orphan")
     shared_links = relationship("SharedLink", back_populates="note", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Keyset pagination: note list by (updated_at, id), trash by (deleted_at, id)
+        Index("ix_notes_user_list", "user_id", "is_archived", "is_deleted", "updated_at", "id"),
+        Index("ix_notes_user_trash", "user_id", "is_deleted", "deleted_at", "id"),
+    )
+
+
+class NoteTag(Base):
+    """
+    Normalized copy of Note.tags, one row per (note, tag), for indexed tag
+    filters and per-user tag counts. Kept in step by crud.sync_note_tags;
+    trashed notes have no rows.
+    """
+    __tablename__ = "note_tags"
+    
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="CASCADE"), nullable=False)
+    tag = Column(String(255), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    
+    __table_args__ = (
+        PrimaryKeyConstraint("note_id", "tag"),
+        # Tag filters and counts: (user_id, tag) -> note_id without touching notes
+        Index("ix_note_tags_user_tag", "user_id", "tag", "note_id"),
+    )
+
+
+class NoteTask(Base):
+    """
+    A task extracted from a note's content (see task_index.py). A note's rows
+    are replaced together when its content changes; note_version is the
+    version they were extracted from. Trashed notes keep their rows (queries
+    join notes to hide them).
+    """
+    __tablename__ = "note_tasks"
+    
+    id = Column(Integer, primary_key=True)
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False, default=0)  # order within the note
+    task = Column(Text, nullable=False)
+    deadline = Column(String(255), nullable=True)  # as written in the note
+    due_at = Column(DateTime, nullable=True)  # the deadline, when it names a date
+    priority = Column(String(10), nullable=False, default="medium")  # high, medium, low
+    priority_rank = Column(Integer, nullable=False, default=1)  # 0 high, 1 medium, 2 low: sorts by urgency
+    note_version = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_note_tasks_note", "note_id", "position"),
+        # Cross-note task lists: due soon, or by priority
+        Index("ix_note_tasks_user_due", "user_id", "due_at"),
+        Index("ix_note_tasks_user_priority", "user_id", "priority_rank", "due_at"),
+    )
 
 
 class FileAttachment(Base):
@@ -91,10 +164,12 @@ class FileAttachment(Base):
     file_size = Column(Integer, nullable=False)  # Size in bytes
     
     # File data stored in database (BYTEA column)
-    file_data = Column(LargeBinary, nullable=False)
+    # Deferred with raiseload: never fetched with the row (e.g. for NoteOut.files);
+    # routes that need the bytes must ask for them with undefer()
+    file_data = deferred(Column(LargeBinary, nullable=False), raiseload=True)
     
     # Thumbnail for images/videos (optional)
-    thumbnail_data = Column(LargeBinary, nullable=True)
+    thumbnail_data = deferred(Column(LargeBinary, nullable=True), raiseload=True)
     
     # Metadata
     meta_data = Column(JSON, default=dict)  # width, height, duration, etc.
@@ -176,6 +251,32 @@ class UserActivity(Base):
     user = relationship("User", back_populates="activities")
 
 
+class ActivityDailyCount(Base):
+    """Per-user, per-day, per-activity_type event counts, folded in from the activity stream"""
+    __tablename__ = "activity_daily_counts"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)
+    activity_type = Column(String(50), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        PrimaryKeyConstraint("user_id", "day", "activity_type"),
+    )
+
+
+class UserStats(Base):
+    """Running per-user totals for the analytics dashboard (see rollups.py)"""
+    __tablename__ = "user_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    note_count = Column(Integer, nullable=False, default=0)
+    file_count = Column(Integer, nullable=False, default=0)
+    active_share_count = Column(Integer, nullable=False, default=0)
+    ai_operation_count = Column(Integer, nullable=False, default=0)
+    corpus_version = Column(Integer, nullable=False, default=0)  # bumped on any note change; list ETags
+
+
 class ChatSession(Base):
     """Chat session for conversation memory"""
     __tablename__ = "chat_sessions"
@@ -184,8 +285,20 @@ class ChatSession(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
+    # Rolling memory (see chat_memory.py): summary of every message up to and
+    # including summarized_until (a ChatMessage.id); later ones are sent verbatim
+    summary = Column(Text, nullable=True)
+    summarized_until = Column(Integer, default=0, nullable=False)
+    
     # Relationships
+    # Not selectin: ownership checks must not pull the transcript. Routes that
+    # serialize ChatSessionOut.messages load it explicitly (crud.get_chat_sessions)
     messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Keyset pagination of a user's sessions by (created_at, id)
+        Index("ix_chat_sessions_user_created", "user_id", "created_at", "id"),
+    )
 
 
 class ChatMessage(Base):
@@ -0,0 +1,160 @@
+# backend/app/rollups.py
+"""
+Incrementally maintained analytics rollups
+
+activity_daily_counts  per user, day and activity_type; folded in by
+                       activity_log in the same transaction that writes each
+                       batch of events.
+user_stats             per-user note, file and active-share counters, bumped
+                       by the crud write paths in the transaction that makes
+                       the change; ai_operation_count comes from the fold.
+                       corpus_version is bumped on every flush that changes
+                       one of the user's notes and keys the list ETags.
+
+crud.get_analytics reads only these (plus note_tags), so a 365-day range
+costs the same as a 7-day one. rebuild() recomputes everything from the raw
+tables; init_db runs it when the rollups are empty.
+"""
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from sqlalchemy import bindparam, delete, event, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from . import models
+
+STAT_COLUMNS = ("note_count", "file_count", "active_share_count", "ai_operation_count", "corpus_version")
+
+
+def _dialect(conn):
+    """Dialect of a Connection or Session"""
+    return conn.dialect if hasattr(conn, "dialect") else conn.get_bind().dialect
+
+
+def _increment(conn, table, key_columns: List[str], rows: List[Dict[str, Any]], add_columns: List[str]) -> None:
+    """Insert rows, adding add_columns onto the existing row when the key is already there"""
+    if not rows:
+        return
+    name = _dialect(conn).name
+    if name in ("postgresql", "sqlite"):
+        stmt = (postgresql.insert if name == "postgresql" else sqlite.insert)(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={column: table.c[column] + stmt.excluded[column] for column in add_columns}
+        )
+        conn.execute(stmt, rows)
+        return
+
+    # No upsert on this backend: UPDATE, then INSERT when no row matched
+    for row in rows:
+        result = conn.execute(
+            update(table)
+            .where(*(table.c[key] == row[key] for key in key_columns))
+            .values({column: table.c[column] + row[column] for column in add_columns})
+        )
+        if result.rowcount == 0:
+            conn.execute(insert(table).values(**row))
+
+
+def bump_user_stats(conn, user_id: int, **deltas: int) -> None:
+    """Add deltas (note_count=1, file_count=-2, ...) to a user's counters; caller commits"""
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    row = {"user_id": user_id, **{column: deltas.get(column, 0) for column in STAT_COLUMNS}}
+    _increment(conn, models.UserStats.__table__, ["user_id"], [row], list(deltas))
+
+
+def fold_activities(conn, rows: List[Dict[str, Any]]) -> None:
+    """Add a batch of user_activities rows to the daily counts and AI operation counters"""
+    per_day = Counter((row["user_id"], row["created_at"].date(), row["activity_type"]) for row in rows)
+    _increment(conn, models.ActivityDailyCount.__table__, ["user_id", "day", "activity_type"], [
+        {"user_id": user_id, "day": day, "activity_type": activity_type, "count": count}
+        for (user_id, day, activity_type), count in per_day.items()
+    ], ["count"])
+
+    ai_operations = Counter(row["user_id"] for row in rows if row["activity_type"].startswith("ai_"))
+    for user_id, count in ai_operations.items():
+        bump_user_stats(conn, user_id, ai_operation_count=count)
+
+
+def needs_rebuild(db) -> bool:
+    """True when users exist but no rollups do (first start after the tables were added)"""
+    has_users = db.execute(select(models.User.id).limit(1)).first() is not None
+    has_stats = db.execute(select(models.UserStats.user_id).limit(1)).first() is not None
+    return has_users and not has_stats
+
+
+def rebuild(db, user_ids: Optional[List[int]] = None) -> None:
+    """
+    Recompute the rollups from notes, files, shared links and user_activities; caller commits
+
+    Only for user_ids when given (e.g. rows a benchmark inserted), else for
+    everyone. corpus_version is not recomputable: each user's continues one
+    past its old value, so list ETags from before the rebuild never match again.
+    """
+    daily = models.ActivityDailyCount.__table__
+    stats = models.UserStats.__table__
+    activity = models.UserActivity
+
+    def scoped(statement, column):
+        return statement if user_ids is None else statement.where(column.in_(user_ids))
+
+    previous_versions = dict(db.execute(
+        scoped(select(stats.c.user_id, stats.c.corpus_version), stats.c.user_id)
+    ).all())
+    db.execute(scoped(delete(daily), daily.c.user_id))
+    db.execute(scoped(delete(stats), stats.c.user_id))
+
+    day = func.date(activity.created_at)
+    db.execute(insert(daily).from_select(
+        ["user_id", "day", "activity_type", "count"],
+        scoped(select(activity.user_id, day, activity.activity_type, func.count(activity.id)), activity.user_id)
+        .group_by(activity.user_id, day, activity.activity_type)
+    ))
+
+    def count_for_user(query):
+        return query.where(models.Note.user_id == models.User.id).scalar_subquery()
+
+    db.execute(insert(stats).from_select(
+        list(("user_id",) + STAT_COLUMNS),
+        scoped(select(
+            models.User.id,
+            count_for_user(select(func.count(models.Note.id))),
+            count_for_user(select(func.count(models.FileAttachment.id)).join(models.Note)),
+            count_for_user(
+                select(func.count(models.SharedLink.id)).join(models.Note)
+                .where(models.SharedLink.is_active == True)
+            ),
+            select(func.count(activity.id)).where(
+                activity.user_id == models.User.id,
+                activity.activity_type.like("ai_%")
+            ).scalar_subquery(),
+            literal(0),
+        ), models.User.id)
+    ))
+    if previous_versions:
+        db.execute(
+            update(stats).where(stats.c.user_id == bindparam("uid")).values(corpus_version=bindparam("version")),
+            [{"uid": user_id, "version": (version or 0) + 1} for user_id, version in previous_versions.items()]
+        )
+
+
+def get_corpus_version(db, user_id: int) -> int:
+    """Counter that changes whenever any of the user's notes does"""
+    version = db.execute(
+        select(models.UserStats.corpus_version).where(models.UserStats.user_id == user_id)
+    ).scalar()
+    return version or 0
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_corpus_versions(session, flush_context, instances) -> None:
+    """Every flush that inserts, changes or deletes a note moves its owner's corpus_version"""
+    user_ids = {
+        obj.user_id
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, models.Note) and (obj not in session.dirty or session.is_modified(obj))
+    }
+    for user_id in user_ids:
+        if user_id is not None:
+            bump_user_stats(session, user_id, corpus_version=1)
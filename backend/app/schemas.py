@@ -109,6 +109,8 @@ class NoteOut(BaseModel):
     is_locked: bool = False
     is_deleted: bool = False
     version: int = 1
+    enrichment_status: Optional[str] = None
+    enriched_version: Optional[int] = None
     user_id: int
     created_at: datetime
     updated_at: datetime
@@ -118,6 +120,38 @@ class NoteOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class NoteSummaryOut(BaseModel):
+    """Lightweight note listing: plain-text excerpt instead of content, file count instead of files"""
+    id: Optional[int] = None
+    title: Optional[str] = None
+    excerpt: Optional[str] = None
+    tags: Optional[List[str]] = None
+    meta_data: Optional[Dict[str, Any]] = None
+    is_favorite: Optional[bool] = None
+    is_archived: Optional[bool] = None
+    is_hidden: Optional[bool] = None
+    is_locked: Optional[bool] = None
+    is_deleted: Optional[bool] = None
+    version: Optional[int] = None
+    enrichment_status: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    deleted_at: Optional[datetime] = None
+    file_count: Optional[int] = None
+
+
+class NoteSearchResultOut(NoteOut):
+    """Note search hit; rank and snippet are set for full-text queries"""
+    rank: Optional[float] = None
+    snippet: Optional[str] = None
+
+
+class NoteSearchSummaryOut(NoteSummaryOut):
+    """Summary-view note search hit"""
+    rank: Optional[float] = None
+    snippet: Optional[str] = None
+
+
 class NoteVersionOut(BaseModel):
     """Schema for note version output"""
     id: int
@@ -214,17 +248,33 @@ class ChatSessionOut(BaseModel):
     id: str
     user_id: int
     created_at: datetime
+    summary: Optional[str] = None
     messages: List[ChatMessageOut] = []
     
     model_config = ConfigDict(from_attributes=True)
 
 
+class NoteTaskOut(BaseModel):
+    """Schema for a task extracted from a note"""
+    id: int
+    note_id: int
+    note_title: Optional[str] = None
+    task: str
+    deadline: Optional[str] = None
+    due_at: Optional[datetime] = None
+    priority: str
+    note_version: int
+    
+    model_config = ConfigDict(from_attributes=True)
+
+
 # ==================== SEARCH & FILTER SCHEMAS ====================
 
 class NoteSearch(BaseModel):
     """Schema for note search"""
     query: Optional[str] = None
     tags: Optional[List[str]] = None
+    tag_mode: str = Field(default="any", pattern="^(any|all)$")  # match any or all of tags
     is_favorite: Optional[bool] = None
     is_archived: Optional[bool] = None
     date_from: Optional[datetime] = None
@@ -233,6 +283,12 @@ class NoteSearch(BaseModel):
     offset: int = Field(default=0, ge=0)
 
 
+class TagCountOut(BaseModel):
+    """Schema for a tag and the number of notes using it"""
+    tag: str
+    count: int
+
+
 # ==================== ANALYTICS SCHEMAS ====================
 
 class ActivityCreate(BaseModel):
@@ -253,6 +309,8 @@ class AnalyticsOut(BaseModel):
     recent_activities: List[Dict[str, Any]] = []
     notes_by_tag: Dict[str, int] = {}
     activity_timeline: List[Dict[str, Any]] = []
+    activity_by_type: Dict[str, int] = {}  # event counts over the timeline range
+    range_days: int = 7
 
 
 # ==================== PRIVACY SCHEMAS ====================
@@ -0,0 +1,216 @@
+# backend/app/search_index.py
+"""
+Full-text search index for notes
+
+PostgreSQL: notes.search_vector is a weighted tsvector (title A, content B)
+            with a GIN index, queried with websearch_to_tsquery.
+SQLite:     an FTS5 shadow table notes_fts(rowid = note id), ranked by bm25.
+
+crud keeps the index in step on note create, update, trash, restore and
+delete; setup() creates the structures and backfills existing notes on start.
+On any other backend the index is disabled and crud.search_notes falls back
+to ILIKE matching.
+"""
+import re
+from typing import Dict, List, Optional
+from sqlalchemy import Text, bindparam, column, delete, func, insert, literal_column, select, table, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from . import models
+from .utils import to_plain_text
+
+# "postgresql" / "sqlite" once setup() succeeded, None while disabled
+_backend: Optional[str] = None
+
+BACKFILL_BATCH_SIZE = 500
+
+# -----------------------------
+# PostgreSQL
+# -----------------------------
+_PG_CONFIG = literal_column("'english'::regconfig")
+
+
+def _pg_vector(title, body):
+    """setweight(to_tsvector(title), 'A') || setweight(to_tsvector(body), 'B')"""
+    return func.setweight(func.to_tsvector(_PG_CONFIG, title), literal_column("'A'")).op("||")(
+        func.setweight(func.to_tsvector(_PG_CONFIG, body), literal_column("'B'"))
+    )
+
+
+def _pg_query(query_text: str):
+    return func.websearch_to_tsquery(_PG_CONFIG, query_text)
+
+
+def _setup_postgresql(conn: Connection) -> None:
+    column_type = conn.execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = 'notes' AND column_name = 'search_vector'"
+    )).scalar()
+    if column_type != "tsvector":
+        # Tables created before the column became a tsvector
+        conn.execute(text("ALTER TABLE notes ALTER COLUMN search_vector TYPE tsvector USING NULL"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_notes_search_vector ON notes USING gin (search_vector)"))
+
+    notes = models.Note.__table__
+    stmt = update(notes).where(notes.c.id == bindparam("b_id")).values(
+        search_vector=_pg_vector(bindparam("b_title", type_=Text), bindparam("b_body", type_=Text))
+    )
+    while True:
+        rows = conn.execute(
+            select(notes.c.id, notes.c.title, notes.c.content)
+            .where(notes.c.search_vector.is_(None))
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        conn.execute(stmt, [
+            {"b_id": row.id, "b_title": row.title or "", "b_body": to_plain_text(row.content)}
+            for row in rows
+        ])
+
+
+# -----------------------------
+# SQLite
+# -----------------------------
+_fts = table("notes_fts", column("rowid"), column("title"), column("content"), column("user_id"))
+_FTS_TABLE = literal_column("notes_fts")
+
+
+def _fts_query(query_text: str) -> Optional[str]:
+    """Quote each word for FTS5 (no operator injection) and prefix-match it; words are ANDed"""
+    words = re.findall(r"\w+", query_text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _setup_sqlite(conn: Connection) -> None:
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts "
+        "USING fts5(title, content, user_id UNINDEXED, tokenize = 'porter unicode61')"
+    ))
+
+    notes = models.Note.__table__
+    indexed = select(_fts.c.rowid)
+    while True:
+        rows = conn.execute(
+            select(notes.c.id, notes.c.title, notes.c.content, notes.c.user_id)
+            .where(notes.c.is_deleted == False, notes.c.id.not_in(indexed))
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        conn.execute(insert(_fts), [
+            {"rowid": row.id, "title": row.title or "", "content": to_plain_text(row.content), "user_id": row.user_id}
+            for row in rows
+        ])
+
+
+# -----------------------------
+# Public API
+# -----------------------------
+def setup(engine) -> None:
+    """Create the index for this database and backfill notes that are not indexed yet"""
+    global _backend
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "postgresql":
+                _setup_postgresql(conn)
+            elif dialect == "sqlite":
+                _setup_sqlite(conn)
+            else:
+                return
+        _backend = dialect
+    except Exception as e:
+        print(f"WARNING: full-text search index unavailable, falling back to ILIKE: {e}")
+
+
+def sync_note(db: Session, note: models.Note) -> None:
+    """Bring a note's index entry in line with it: indexed while live, removed once trashed"""
+    if _backend == "postgresql":
+        if not note.is_deleted:
+            note.search_vector = _pg_vector(note.title or "", to_plain_text(note.content))
+    elif _backend == "sqlite":
+        if note.id is None:
+            db.flush()
+        db.execute(delete(_fts).where(_fts.c.rowid == note.id))
+        if not note.is_deleted:
+            db.execute(insert(_fts).values(
+                rowid=note.id,
+                title=note.title or "",
+                content=to_plain_text(note.content),
+                user_id=note.user_id
+            ))
+
+
+def remove_notes(db: Session, note_ids: List[int]) -> None:
+    """Drop index entries for permanently deleted notes"""
+    if _backend == "sqlite" and note_ids:
+        db.execute(delete(_fts).where(_fts.c.rowid.in_(note_ids)))
+    # PostgreSQL keeps the vector on the notes row itself, so it goes with the row
+
+
+def match(user_id: int, query_text: str):
+    """
+    Subquery of (note_id, rank) for the user's notes matching query_text,
+    higher rank = more relevant; None when full-text search can't be used
+    """
+    if _backend == "postgresql":
+        tsquery = _pg_query(query_text)
+        return select(
+            models.Note.id.label("note_id"),
+            func.ts_rank_cd(models.Note.search_vector, tsquery).label("rank")
+        ).where(
+            models.Note.user_id == user_id,
+            models.Note.search_vector.op("@@")(tsquery)
+        ).subquery()
+
+    if _backend == "sqlite":
+        fts_query = _fts_query(query_text)
+        if fts_query is None:
+            return None
+        return select(
+            _fts.c.rowid.label("note_id"),
+            # bm25 is lower-is-better; title hits weigh 10x content hits
+            (-func.bm25(_FTS_TABLE, 10.0, 1.0)).label("rank")
+        ).where(
+            _FTS_TABLE.op("MATCH")(fts_query),
+            _fts.c.user_id == user_id
+        ).subquery()
+
+    return None
+
+
+def snippets(db: Session, query_text: str, note_ids: List[int]) -> Dict[int, str]:
+    """Highlighted (<mark>) snippets around the matches, for one page of results"""
+    if not note_ids:
+        return {}
+
+    if _backend == "postgresql":
+        rows = db.execute(
+            select(
+                models.Note.id,
+                func.ts_headline(
+                    _PG_CONFIG,
+                    func.regexp_replace(func.coalesce(models.Note.content, ""), "<[^>]+>", " ", "g"),
+                    _pg_query(query_text),
+                    "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2"
+                )
+            ).where(models.Note.id.in_(note_ids))
+        ).all()
+        return {row[0]: row[1] for row in rows}
+
+    if _backend == "sqlite":
+        fts_query = _fts_query(query_text)
+        if fts_query is None:
+            return {}
+        rows = db.execute(
+            select(_fts.c.rowid, func.snippet(_FTS_TABLE, -1, "<mark>", "</mark>", "…", 16)).where(
+                _FTS_TABLE.op("MATCH")(fts_query),
+                _fts.c.rowid.in_(note_ids)
+            )
+        ).all()
+        return {row[0]: row[1] for row in rows}
+
+    return {}
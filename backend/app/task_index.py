@@ -0,0 +1,182 @@
+# backend/app/task_index.py
+"""
+Persisted per-note task index
+
+Tasks extracted from a note (ai_extract_tasks) are stored in note_tasks,
+tagged with the note version they came from, so reading a note's tasks or
+listing tasks across notes is a query, not an LLM call. Extraction runs in
+the background (TaskExtractionQueue, the enrichment queue's workers and
+debounce) and only when the note's content_hash moves away from the one the
+stored tasks came from; title or flag edits never trigger it.
+
+Deadlines are stored as written and, when they name a day ("tomorrow",
+"Friday 5pm", "2024-03-01", "March 5", "in 3 days", "end of month"), as
+due_at, resolved against the time the note was last saved.
+"""
+import asyncio
+import calendar
+import re
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import get_settings
+from .database import AsyncSessionLocal
+from .enrichment import EnrichmentJob, EnrichmentQueue
+from . import async_crud, ai_integration
+
+settings = get_settings()
+
+PRIORITY_RANKS = {"high": 0, "medium": 1, "low": 2}
+
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+_MONTHS["sept"] = 9
+
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_MONTH_DAY = re.compile(r"\b([a-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?\b(?:,?\s+(\d{4}))?")
+_DAY_MONTH = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?([a-z]{3,9})\b(?:,?\s+(\d{4}))?")
+_IN_DAYS = re.compile(r"\bin\s+(\d{1,3})\s+(day|week)s?\b")
+_WEEKDAY = re.compile(r"\b(next\s+)?(" + "|".join(_WEEKDAYS + [day[:3] for day in _WEEKDAYS]) + r")\b")
+_TIME = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)\b|\b(\d{1,2}):(\d{2})\b")
+
+
+def _day(text: str, reference: datetime) -> Optional[datetime]:
+    """The calendar day a deadline names (midnight), or None"""
+    today = reference.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    match = _ISO_DATE.search(text)
+    if match:
+        year, month, day = map(int, match.groups())
+        try:
+            return datetime(year, month, day)
+        except ValueError:
+            return None
+
+    for pattern, month_group, day_group in ((_MONTH_DAY, 1, 2), (_DAY_MONTH, 2, 1)):
+        for match in pattern.finditer(text):
+            month = _MONTHS.get(match.group(month_group))
+            if not month:
+                continue
+            year = int(match.group(3)) if match.group(3) else today.year
+            try:
+                date = datetime(year, month, int(match.group(day_group)))
+            except ValueError:
+                return None
+            # A date without a year that is long past means next year's
+            if not match.group(3) and date < today - timedelta(days=180):
+                date = date.replace(year=year + 1)
+            return date
+
+    if re.search(r"\b(today|tonight|eod|end of (the )?day)\b", text):
+        return today
+    if re.search(r"\btomorrow\b", text):
+        return today + timedelta(days=1)
+    match = _IN_DAYS.search(text)
+    if match:
+        return today + timedelta(days=int(match.group(1)) * (7 if match.group(2) == "week" else 1))
+    if re.search(r"\bend of (the )?month\b", text):
+        return today.replace(day=calendar.monthrange(today.year, today.month)[1])
+    if re.search(r"\b(end of (the )?week|this week)\b", text):
+        return today + timedelta(days=(4 - today.weekday()) % 7)  # Friday
+    if re.search(r"\bnext week\b", text):
+        return today + timedelta(days=7 - today.weekday())  # Monday
+    match = _WEEKDAY.search(text)
+    if match:
+        weekday = [day[:3] for day in _WEEKDAYS].index(match.group(2)[:3])
+        ahead = (weekday - today.weekday()) % 7
+        if match.group(1) and ahead == 0:
+            ahead = 7
+        return today + timedelta(days=ahead)
+    return None
+
+
+def parse_deadline(deadline: Optional[str], reference: datetime) -> Optional[datetime]:
+    """When a deadline falls (end of the day unless it gives a time), read relative to `reference`"""
+    if not deadline:
+        return None
+    text = deadline.lower()
+    day = _day(text, reference)
+    if day is None:
+        return None
+
+    match = _TIME.search(_ISO_DATE.sub(" ", text))
+    if match:
+        if match.group(3):
+            hour, minute = int(match.group(1)) % 12, int(match.group(2) or 0)
+            if match.group(3) == "pm":
+                hour += 12
+        else:
+            hour, minute = int(match.group(4)), int(match.group(5))
+        if hour < 24 and minute < 60:
+            return day.replace(hour=hour, minute=minute)
+    return day.replace(hour=23, minute=59, second=59)
+
+
+def normalize_tasks(raw: Any, reference: datetime) -> List[dict]:
+    """note_tasks values from ai_extract_tasks output, skipping malformed items"""
+    tasks = []
+    for item in raw if isinstance(raw, list) else []:
+        if not isinstance(item, dict) or not str(item.get("task") or "").strip():
+            continue
+        deadline = item.get("deadline")
+        deadline = str(deadline).strip()[:255] if deadline not in (None, "", "null") else None
+        priority = str(item.get("priority") or "").lower()
+        priority = priority if priority in PRIORITY_RANKS else "medium"
+        tasks.append({
+            "task": str(item["task"]).strip(),
+            "deadline": deadline,
+            "due_at": parse_deadline(deadline, reference),
+            "priority": priority,
+            "priority_rank": PRIORITY_RANKS[priority],
+        })
+    return tasks
+
+
+async def extract(db: AsyncSession, note_id: int, version: Optional[int] = None, timeout: Optional[float] = None) -> bool:
+    """
+    Extract and store the tasks of a note's current content (if `version` is given, only that version)
+
+    False when the note is gone, was edited meanwhile or the AI call failed.
+    Cheap when the stored tasks are already current.
+    """
+    source = await async_crud.get_task_source(db, note_id)
+    await db.rollback()  # don't hold a transaction open across the AI call
+    if source is None or source.is_deleted or (version is not None and source.version != version):
+        return False
+    if source.tasks_status == "done" and source.tasks_content_hash == source.content_hash:
+        return True
+
+    tasks = []
+    if source.content:
+        try:
+            raw = await asyncio.wait_for(ai_integration.ai_extract_tasks(source.content), timeout=timeout)
+            tasks = normalize_tasks(raw, source.updated_at or datetime.utcnow())
+        except Exception as e:
+            print(f"WARNING: task extraction for note {note_id} failed: {e}")
+            tasks = None
+    stored = await async_crud.store_note_tasks(db, note_id, source.version, tasks)
+    return stored and tasks is not None
+
+
+class TaskExtractionQueue(EnrichmentQueue):
+    """Background task extraction for notes whose content changed"""
+
+    async def _requeue_pending(self, db) -> None:
+        for note_id, version in await async_crud.get_pending_task_extractions(db):
+            self.enqueue(note_id, version)
+
+    async def _process(self, job: EnrichmentJob) -> None:
+        async with AsyncSessionLocal() as db:
+            await extract(db, job.note_id, job.version, self.timeout)
+
+
+task_queue = TaskExtractionQueue(
+    workers=settings.AI_ENRICHMENT_WORKERS,
+    debounce=settings.AI_ENRICHMENT_DEBOUNCE_SECONDS,
+    timeout=settings.AI_ENRICHMENT_TIMEOUT_SECONDS,
+)
+
+
+def enqueue(note_id: int, version: int) -> None:
+    task_queue.enqueue(note_id, version)
@@ -0,0 +1,107 @@
+# backend/app/utils.py
+"""
+Shared helper utilities
+"""
+import base64
+import html
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable, Optional, Tuple, Union
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries also expire after a TTL
+
+    Args:
+        maxsize: Maximum number of entries; the least recently used is evicted
+        ttl: Default time-to-live in seconds
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value; ttl overrides the default time-to-live for this entry"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove an entry and return its value"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def encode_cursor(sort_value: datetime, row_id: Union[int, str]) -> str:
+    """Encode a (timestamp, id) keyset position as an opaque URL-safe cursor"""
+    raw = json.dumps([sort_value.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Union[int, str]]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        return datetime.fromisoformat(sort_value), row_id
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_MARKDOWN_RE = re.compile(r"!?\[([^\]]*)\]\([^)]*\)|[#*_`>~|]+|^\s*[-+]\s+|^\s*\d+\.\s+", re.MULTILINE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def to_plain_text(text: Optional[str]) -> str:
+    """Strip HTML tags, entities and Markdown markup from note content"""
+    if not text:
+        return ""
+    plain = html.unescape(_TAG_RE.sub(" ", text))
+    plain = _MARKDOWN_RE.sub(lambda m: m.group(1) or " ", plain)
+    return _SPACE_RE.sub(" ", plain).strip()
+
+
+def make_excerpt(text: Optional[str], max_chars: int = 200) -> str:
+    """Plain-text preview of HTML/Markdown note content, cut at a word boundary"""
+    plain = to_plain_text(text)
+    if len(plain) <= max_chars:
+        return plain
+    return plain[:max_chars].rsplit(" ", 1)[0] + "…"
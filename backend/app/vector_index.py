@@ -0,0 +1,286 @@
+# backend/app/vector_index.py
+"""
+Per-user in-memory vector index over notes (no external service)
+
+Each note (title counted twice, plus content as plain text) becomes one row of
+a float32 matrix. The default embedder hashes words into VECTOR_INDEX_DIM
+buckets of log term frequency, and queries weight both sides by the user's
+own IDF. VECTOR_EMBEDDER can instead name a local embedder ("module:factory"
+returning an object with .dim, .uses_idf = False and .embed(text) -> vector).
+
+A query, whether a text search or "notes related to this one", is one
+matrix-vector product over the user's whole corpus. Indexes
+are built lazily on a user's first query and kept for the
+VECTOR_INDEX_MAX_USERS most recent users. Before answering, the index compares
+its corpus_version with user_stats. If they differ, it re-reads only the
+notes whose updated_at moved and drops deleted ones. Writes from other
+workers are therefore picked up too.
+
+The functions take a sync Session; async_crud runs them via run_sync. The
+per-user lock is never held across a database round-trip, because run_sync
+yields to the event loop while waiting on the database.
+"""
+import importlib
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from .config import get_settings
+from .utils import to_plain_text
+from . import models, rollups
+
+settings = get_settings()
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_LOAD_BATCH = 500
+
+
+def note_text(title: Optional[str], content: Optional[str]) -> str:
+    """Text a note is indexed by: the title (twice, as it says what the note is about) and the content"""
+    title = title or ""
+    return f"{title} {title} {to_plain_text(content)}"
+
+
+class HashedTfidfEmbedder:
+    """Words hashed into `dim` buckets of log(1 + count); IDF is applied by the index"""
+    name = "hashed-tfidf"
+    uses_idf = True
+
+    def __init__(self, dim: int = 2048):
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        counts = Counter(word for word in _WORD.findall(text.lower()) if len(word) > 1)
+        for word, count in counts.items():
+            vector[zlib.crc32(word.encode()) % self.dim] += count
+        return np.log1p(vector, out=vector)
+
+
+def _create_embedder():
+    if settings.VECTOR_EMBEDDER in ("", "hashed-tfidf"):
+        return HashedTfidfEmbedder(settings.VECTOR_INDEX_DIM)
+    module_name, _, factory = settings.VECTOR_EMBEDDER.partition(":")
+    return getattr(importlib.import_module(module_name), factory)()
+
+
+class UserIndex:
+    """One user's note vectors: raw embeddings, plus a normalized copy rebuilt after changes"""
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.lock = threading.Lock()
+        self.corpus_version: Optional[int] = None
+        self.stamps: Dict[int, object] = {}  # note_id -> updated_at the row was built from
+        self.archived: Dict[int, bool] = {}
+        self._rows: Dict[int, int] = {}  # note_id -> matrix row
+        self._ids: List[Optional[int]] = []  # matrix row -> note_id (None: free)
+        self._free: List[int] = []
+        self._matrix = np.zeros((0, embedder.dim), dtype=np.float32)
+        self._df = np.zeros(embedder.dim, dtype=np.float32)
+        self._normalized: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add_note(self, row) -> None:
+        """Index (or re-index) a note row loaded by CorpusIndex.refresh"""
+        self.upsert(row.id, self.embedder.embed(note_text(row.title, row.content)))
+        self.archived[row.id] = bool(row.is_archived)
+
+    def upsert(self, note_id: int, vector: np.ndarray) -> None:
+        row = self._rows.get(note_id)
+        if row is None:
+            row = self._free.pop() if self._free else self._grow()
+            self._rows[note_id] = row
+            self._ids[row] = note_id
+        else:
+            self._df -= self._matrix[row] > 0
+        self._matrix[row] = vector
+        self._df += vector > 0
+        self._normalized = None
+
+    def remove(self, note_id: int) -> None:
+        row = self._rows.pop(note_id, None)
+        self.stamps.pop(note_id, None)
+        self.archived.pop(note_id, None)
+        if row is None:
+            return
+        self._df -= self._matrix[row] > 0
+        self._matrix[row] = 0
+        self._ids[row] = None
+        self._free.append(row)
+        self._normalized = None
+
+    def _grow(self) -> int:
+        row = len(self._ids)
+        if row == len(self._matrix):
+            grown = np.zeros((max(16, row * 2), self.embedder.dim), dtype=np.float32)
+            grown[:row] = self._matrix
+            self._matrix = grown
+        self._ids.append(None)
+        return row
+
+    def _idf(self) -> np.ndarray:
+        count = len(self._rows)
+        return np.log((1 + count) / (1 + self._df)) + 1
+
+    def weigh(self, vector: np.ndarray) -> np.ndarray:
+        """Query / note vector in the index's space (IDF-weighted when the embedder wants it), L2-normalized"""
+        if self.embedder.uses_idf:
+            vector = vector * self._idf()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def normalized(self) -> np.ndarray:
+        if self._normalized is None:
+            matrix = self._matrix[:len(self._ids)]
+            if self.embedder.uses_idf:
+                matrix = matrix * self._idf()
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            self._normalized = (matrix / norms).astype(np.float32, copy=False)
+        return self._normalized
+
+    def vector_of(self, note_id: int) -> Optional[np.ndarray]:
+        row = self._rows.get(note_id)
+        return None if row is None else self._matrix[row].copy()
+
+    def top_k(
+        self,
+        query: np.ndarray,
+        k: int,
+        exclude: Iterable[int] = (),
+        include_archived: bool = False,
+        min_score: float = 0.0
+    ) -> List[Tuple[int, float]]:
+        """(note_id, cosine) of the k best-scoring notes, best first"""
+        if not self._rows:
+            return []
+        scores = self.normalized() @ self.weigh(query)
+        excluded = set(exclude)
+        ranked = np.argsort(-scores)
+        results = []
+        for row in ranked:
+            score = float(scores[row])
+            if score <= min_score or len(results) == k:
+                break
+            note_id = self._ids[row]
+            if note_id is None or note_id in excluded:
+                continue
+            if not include_archived and self.archived.get(note_id):
+                continue
+            results.append((note_id, score))
+        return results
+
+
+class CorpusIndex:
+    """
+    Per-user indexes kept in step with the notes table, least recently used evicted past max_users
+
+    Subclasses build the user indexes (_create_user_index). A user index has
+    .lock, .corpus_version and .stamps (note_id -> updated_at it was built
+    from), plus add_note(row) and remove(note_id). The row carries id, title,
+    content, is_archived, meta_data and updated_at.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._users: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _create_user_index(self):
+        raise NotImplementedError
+
+    def _user(self, user_id: int):
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                index = self._users[user_id] = self._create_user_index()
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            self._users.move_to_end(user_id)
+            return index
+
+    def refresh(self, db: Session, user_id: int):
+        """The user's index, brought up to date with the notes table"""
+        index = self._user(user_id)
+        version = rollups.get_corpus_version(db, user_id)
+        if index.corpus_version == version:
+            return index
+
+        current = dict(db.execute(
+            select(models.Note.id, models.Note.updated_at)
+            .where(models.Note.user_id == user_id, models.Note.is_deleted == False)
+        ).all())
+        with index.lock:
+            changed = [note_id for note_id, stamp in current.items() if index.stamps.get(note_id) != stamp]
+            removed = [note_id for note_id in index.stamps if note_id not in current]
+
+        loaded = []
+        for start in range(0, len(changed), _LOAD_BATCH):
+            loaded.extend(db.execute(
+                select(models.Note.id, models.Note.title, models.Note.content,
+                       models.Note.is_archived, models.Note.meta_data, models.Note.updated_at)
+                .where(models.Note.id.in_(changed[start:start + _LOAD_BATCH]))
+            ).all())
+
+        with index.lock:
+            if index.corpus_version is not None and index.corpus_version > version:
+                return index  # a concurrent refresh already applied newer data
+            for note_id in removed:
+                index.remove(note_id)
+            for row in loaded:
+                index.add_note(row)
+                index.stamps[row.id] = row.updated_at
+            index.corpus_version = version
+        return index
+
+
+class VectorIndex(CorpusIndex):
+    """Note vectors (UserIndex) per user"""
+
+    def __init__(self, embedder, max_users: int):
+        super().__init__(max_users)
+        self.embedder = embedder
+
+    def _create_user_index(self) -> UserIndex:
+        return UserIndex(self.embedder)
+
+    def search(
+        self,
+        db: Session,
+        user_id: int,
+        query: str,
+        k: int = 20,
+        include_archived: bool = False
+    ) -> List[Tuple[int, float]]:
+        """(note_id, cosine similarity) of the user's k notes closest to the query text"""
+        index = self.refresh(db, user_id)
+        vector = self.embedder.embed(query)
+        with index.lock:
+            return index.top_k(vector, k, include_archived=include_archived)
+
+    def related(self, db: Session, user_id: int, note_id: int, k: int = 5) -> List[Tuple[int, float]]:
+        """(note_id, cosine similarity) of the user's k notes closest to this note (none if it is not indexed, e.g. in trash)"""
+        index = self.refresh(db, user_id)
+        with index.lock:
+            vector = index.vector_of(note_id)
+            if vector is None:
+                return []
+            return index.top_k(vector, k, exclude=[note_id])
+
+
+vector_index = VectorIndex(_create_embedder(), settings.VECTOR_INDEX_MAX_USERS)
+
+
+def search(db: Session, user_id: int, query: str, k: int = 20, include_archived: bool = False) -> List[Tuple[int, float]]:
+    return vector_index.search(db, user_id, query, k, include_archived)
+
+
+def related(db: Session, user_id: int, note_id: int, k: int = 5) -> List[Tuple[int, float]]:
+    return vector_index.related(db, user_id, note_id, k)
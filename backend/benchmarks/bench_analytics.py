@@ -0,0 +1,116 @@
+"""
+Benchmark: analytics dashboard round-trips vs account size
+
+Seeds throwaway users with increasing numbers of notes, tags and activity
+events (spread over the past year), then calls crud.get_analytics for each
+and reports the number of SQL statements sent and the time taken, for each
+timeline range. Both should stay flat however many notes the account holds
+and however long the range is, since the dashboard reads the rollups.
+
+Run from the backend directory against the configured DATABASE_URL:
+    python benchmarks/bench_analytics.py --sizes 10 100 1000 --days 7 90 365
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, insert
+from app.database import SessionLocal, engine, init_db
+from app import models, crud, rollups
+
+TAGS = ["work", "ideas", "python", "travel", "reading", "health", "finance", "todo"]
+
+
+def seed(note_count: int) -> int:
+    """Create a throwaway user with note_count tagged notes and ~3 activities per note"""
+    db = SessionLocal()
+    try:
+        user = models.User(
+            name="Benchmark",
+            email=f"bench-analytics-{note_count}-{int(time.time() * 1000)}@example.com",
+            hashed_password="x",
+        )
+        db.add(user)
+        db.commit()
+        db.add_all([
+            models.Note(title=f"Note {i}", content="lorem ipsum " * 20, tags=random.sample(TAGS, 3),
+                        meta_data={}, user_id=user.id)
+            for i in range(note_count)
+        ])
+        db.commit()
+        crud.backfill_note_tags(db)
+        now = datetime.utcnow()
+        db.execute(insert(models.UserActivity), [
+            {
+                "user_id": user.id,
+                "activity_type": random.choice(["note_viewed", "note_updated", "ai_summarize"]),
+                "description": "bench",
+                "meta_data": {},
+                "created_at": now - timedelta(hours=random.randint(0, 24 * 365)),
+            }
+            for _ in range(note_count * 3)
+        ])
+        # The raw inserts above bypass the incremental updates; rebuild only this user
+        rollups.rebuild(db, user_ids=[user.id])
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def cleanup(user_id: int):
+    db = SessionLocal()
+    try:
+        db.delete(db.get(models.User, user_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def measure(user_id: int, days: int, repeat: int) -> dict:
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db = SessionLocal()
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        crud.get_analytics(db, user_id, days)  # warm up
+        statements.clear()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            crud.get_analytics(db, user_id, days)
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+        db.close()
+
+    return {"queries": len(statements) / repeat, "ms": elapsed / repeat * 1000}
+
+
+def main(args):
+    init_db()
+    print(f"{'notes':>8}{'days':>6}{'queries/call':>14}{'ms/call':>10}")
+    for size in args.sizes:
+        user_id = seed(size)
+        try:
+            for days in args.days:
+                result = measure(user_id, days, args.repeat)
+                print(f"{size:>8}{days:>6}{result['queries']:>14.1f}{result['ms']:>10.2f}")
+        finally:
+            cleanup(user_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--days", type=int, nargs="+", default=[7, 30, 90, 365])
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
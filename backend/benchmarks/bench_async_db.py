@@ -0,0 +1,126 @@
+"""
+Benchmark: concurrent note-list requests on the sync vs async session layer
+
+Simulates N concurrent `GET /api/notes` handlers on one event loop, the way
+uvicorn runs them, and reports throughput plus the worst event-loop stall seen
+by a heartbeat task while they run.
+
+  before: async route calling crud.get_notes on a SessionLocal (blocks the loop)
+  after:  async route awaiting async_crud.get_notes on an AsyncSession
+
+Run from the backend directory against the configured DATABASE_URL:
+    python benchmarks/bench_async_db.py --requests 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal, AsyncSessionLocal, async_engine, init_db
+from app import models, crud, async_crud
+
+
+def seed(note_count: int) -> int:
+    """Create a throwaway user with note_count notes, return its id"""
+    db = SessionLocal()
+    try:
+        user = models.User(
+            name="Benchmark",
+            email=f"bench-{int(time.time() * 1000)}@example.com",
+            hashed_password="x",
+        )
+        db.add(user)
+        db.commit()
+        db.add_all([
+            models.Note(title=f"Note {i}", content="lorem ipsum " * 50, tags=["bench"], meta_data={}, user_id=user.id)
+            for i in range(note_count)
+        ])
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def cleanup(user_id: int):
+    db = SessionLocal()
+    try:
+        db.delete(db.get(models.User, user_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def sync_handler(user_id: int):
+    db = SessionLocal()
+    try:
+        crud.get_notes(db, user_id, 0, 50)
+    finally:
+        db.close()
+
+
+async def async_handler(user_id: int):
+    async with AsyncSessionLocal() as db:
+        await async_crud.get_notes(db, user_id, 0, 50)
+
+
+async def heartbeat(stop: asyncio.Event, interval: float, stalls: list):
+    """Record how late each tick fires; a blocked loop shows up as large lag"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - started - interval)
+
+
+async def run(handler, user_id: int, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    stalls = []
+
+    async def one():
+        async with semaphore:
+            await handler(user_id)
+
+    beat = asyncio.create_task(heartbeat(stop, 0.005, stalls))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+
+    return {
+        "elapsed_s": elapsed,
+        "req_per_s": requests / elapsed,
+        "max_loop_stall_ms": max(stalls, default=0.0) * 1000,
+    }
+
+
+async def main(args):
+    init_db()
+    user_id = seed(args.notes)
+    try:
+        # Warm up both pools so connection setup is not measured
+        await run(sync_handler, user_id, args.concurrency, args.concurrency)
+        await run(async_handler, user_id, args.concurrency, args.concurrency)
+
+        before = await run(sync_handler, user_id, args.requests, args.concurrency)
+        after = await run(async_handler, user_id, args.requests, args.concurrency)
+    finally:
+        cleanup(user_id)
+        await async_engine.dispose()
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.notes} notes")
+    print(f"{'':8}{'req/s':>10}{'elapsed s':>12}{'max loop stall ms':>20}")
+    for label, result in (("before", before), ("after", after)):
+        print(f"{label:8}{result['req_per_s']:>10.1f}{result['elapsed_s']:>12.2f}{result['max_loop_stall_ms']:>20.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--notes", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))